@@ -0,0 +1,205 @@
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+import torch
+import matplotlib.pyplot as plt
+
+from logstore import LogitStore
+from metrics import MetricAccumulator, save_confusion_matrix_csv
+
+STORE = Path("outputs/baseline/test_logits")
+
+CHUNK = 65536
+
+
+def softmax(z):
+    z = z - z.max(axis=1, keepdims=True)
+    e = np.exp(z)
+    return e / e.sum(axis=1, keepdims=True)
+
+
+def bootstrap(y, pred, k, n_boot=1000, seed=42, alpha=0.05):
+    """Percentile CIs for accuracy and macro F1, resampling all replicates at once.
+
+    Every replicate is reduced to a K*K confusion matrix with one bincount over
+    (replicate, true, pred) codes; replicates are processed in chunks so the
+    index matrix stays around 2e7 entries.
+    """
+    rng = np.random.default_rng(seed)
+    n = len(y)
+    codes = y.astype(np.int64) * k + pred.astype(np.int64)
+    per_chunk = max(1, 20_000_000 // max(1, n))
+
+    accs, f1s = [], []
+    for start in range(0, n_boot, per_chunk):
+        b = min(per_chunk, n_boot - start)
+        idx = rng.integers(0, n, size=(b, n))
+        flat = codes[idx] + (np.arange(b, dtype=np.int64) * k * k)[:, None]
+        cm = np.bincount(flat.ravel(), minlength=b * k * k).reshape(b, k, k).astype(np.float64)
+
+        tp = np.diagonal(cm, axis1=1, axis2=2)
+        support = cm.sum(axis=2)
+        predicted = cm.sum(axis=1)
+        precision = np.divide(tp, predicted, out=np.zeros_like(tp), where=predicted > 0)
+        recall = np.divide(tp, support, out=np.zeros_like(tp), where=support > 0)
+        denom = precision + recall
+        f1 = np.divide(2 * precision * recall, denom, out=np.zeros_like(tp), where=denom > 0)
+
+        accs.append(tp.sum(axis=1) / n)
+        f1s.append(f1.mean(axis=1))
+
+    accs = np.concatenate(accs)
+    f1s = np.concatenate(f1s)
+    lo, hi = 100 * alpha / 2, 100 * (1 - alpha / 2)
+    return {
+        "n_boot": n_boot,
+        "level": 1 - alpha,
+        "acc": [float(np.percentile(accs, lo)), float(np.percentile(accs, hi))],
+        "macro_f1": [float(np.percentile(f1s, lo)), float(np.percentile(f1s, hi))],
+    }
+
+
+def threshold_table(conf, correct, thresholds):
+    rows = []
+    for t in thresholds:
+        keep = conf >= t
+        n = int(keep.sum())
+        rows.append({
+            "threshold": float(t),
+            "coverage": n / max(1, len(conf)),
+            "acc": float(correct[keep].mean()) if n else 0.0,
+        })
+    return rows
+
+
+def top_confusions(cm, classes, n=10):
+    off = cm.copy()
+    np.fill_diagonal(off, 0)
+    order = np.argsort(off, axis=None)[::-1][:n]
+    out = []
+    for flat in order:
+        t, p = divmod(int(flat), len(classes))
+        if off[t, p] == 0:
+            break
+        out.append({"true": classes[t], "pred": classes[p], "count": int(off[t, p])})
+    return out
+
+
+def plot_reliability(metrics, bin_acc, out):
+    bins = metrics["ece_bins"]
+    centers = (np.arange(bins) + 0.5) / bins
+    plt.figure()
+    plt.plot([0, 1], [0, 1], linestyle="--", color="gray")
+    plt.bar(centers, bin_acc, width=1.0 / bins, edgecolor="black", alpha=0.7)
+    plt.xlabel("confidence")
+    plt.ylabel("accuracy")
+    plt.title(f"ECE = {metrics['ece']:.4f}")
+    plt.tight_layout()
+    plt.savefig(out, dpi=160)
+    plt.close()
+
+
+def plot_confusion(cm, classes, out):
+    norm = cm / np.maximum(cm.sum(axis=1, keepdims=True), 1)
+    plt.figure(figsize=(1.0 + 0.8 * len(classes), 0.8 + 0.8 * len(classes)))
+    plt.imshow(norm, cmap="Blues", vmin=0, vmax=1)
+    plt.xticks(range(len(classes)), classes, rotation=45, ha="right")
+    plt.yticks(range(len(classes)), classes)
+    for i in range(len(classes)):
+        for j in range(len(classes)):
+            plt.text(j, i, int(cm[i, j]), ha="center", va="center", fontsize=8)
+    plt.xlabel("pred")
+    plt.ylabel("true")
+    plt.tight_layout()
+    plt.savefig(out, dpi=160)
+    plt.close()
+
+
+def plot_per_class(metrics, classes, out):
+    f1 = [metrics["per_class"][c]["f1"] for c in classes]
+    plt.figure()
+    plt.bar(classes, f1)
+    plt.ylabel("F1")
+    plt.ylim(0, 1)
+    plt.tight_layout()
+    plt.savefig(out, dpi=160)
+    plt.close()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--store", type=Path, default=STORE)
+    ap.add_argument("--out-dir", type=Path, default=None, help="Default: <store>_analysis next to the store.")
+    ap.add_argument("--n-boot", type=int, default=1000)
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args()
+
+    store = LogitStore(args.store)
+    classes = store.classes
+    k = store.k
+    out_dir = args.out_dir or args.store.with_name(args.store.name + "_analysis")
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    meter = MetricAccumulator(k)
+    preds, confs, labels = [], [], []
+
+    for start in range(0, len(store), CHUNK):
+        z = np.asarray(store.logits[start:start + CHUNK], dtype=np.float32)
+        y = store.labels[start:start + CHUNK].astype(np.int64)
+        ok = (y >= 0) & np.isfinite(z).all(axis=1)
+        z, y = z[ok], y[ok]
+        if not len(y):
+            continue
+        meter.update(torch.from_numpy(z), torch.from_numpy(y))
+        p = softmax(z)
+        preds.append(p.argmax(axis=1).astype(np.int16))
+        confs.append(p.max(axis=1).astype(np.float32))
+        labels.append(y.astype(np.int16))
+
+    if not labels:
+        raise SystemExit(f"[ERROR] {args.store} has no labeled rows to analyze")
+
+    pred = np.concatenate(preds)
+    conf = np.concatenate(confs)
+    y = np.concatenate(labels)
+    correct = (pred == y).astype(np.float64)
+
+    metrics = meter.compute(classes)
+    cm = meter.confusion_matrix().numpy()
+
+    bins = metrics["ece_bins"]
+    b = np.minimum((conf * bins).astype(np.int64), bins - 1)
+    bin_n = np.bincount(b, minlength=bins)
+    bin_acc = np.divide(np.bincount(b, weights=correct, minlength=bins), bin_n,
+                        out=np.zeros(bins), where=bin_n > 0)
+
+    result = {
+        "store": str(args.store),
+        "source": store.meta.get("source", ""),
+        "rows": len(store),
+        "labeled": int(len(y)),
+        "metrics": metrics,
+        "bootstrap": bootstrap(y, pred, k, n_boot=args.n_boot, seed=args.seed),
+        "thresholds": threshold_table(conf, correct, np.round(np.arange(0.0, 1.0, 0.1), 2)),
+        "top_confusions": top_confusions(cm, classes),
+    }
+
+    (out_dir / "analysis.json").write_text(json.dumps(result, indent=2), encoding="utf-8")
+    save_confusion_matrix_csv(cm, classes, out_dir / "confusion_matrix.csv")
+    plot_reliability(metrics, bin_acc, out_dir / "reliability.png")
+    plot_confusion(cm, classes, out_dir / "confusion_matrix.png")
+    plot_per_class(metrics, classes, out_dir / "per_class_f1.png")
+
+    ci = result["bootstrap"]
+    print(f"acc: {metrics['acc']:.4f} [{ci['acc'][0]:.4f}, {ci['acc'][1]:.4f}] | "
+          f"macro F1: {metrics['macro']['f1']:.4f} [{ci['macro_f1'][0]:.4f}, {ci['macro_f1'][1]:.4f}] | "
+          f"ECE: {metrics['ece']:.4f} | n={len(y)}")
+    for c in result["top_confusions"][:5]:
+        print(f"  {c['true']} -> {c['pred']}: {c['count']}")
+    print("Saved:", out_dir)
+
+
+if __name__ == "__main__":
+    main()
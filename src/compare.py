@@ -0,0 +1,147 @@
+import argparse
+import csv
+import json
+import time
+from pathlib import Path
+
+import torch
+
+from dataset import get_loaders
+from metrics import MetricAccumulator
+from models.factory import load_artifact
+
+DATA_DIR = "data/balanced_raw"
+OUT_DIR = Path("outputs/compare")
+
+SEED = 42
+BATCH = 32
+IMG = 224
+
+
+def parse_models(specs):
+    # "name=path" or just "path" (name = parent dir + file stem)
+    out = []
+    for spec in specs:
+        if "=" in spec:
+            name, path = spec.split("=", 1)
+            path = Path(path)
+        else:
+            path = Path(spec)
+            name = f"{path.parent.name}/{path.stem}"
+        out.append((name, path))
+    names = [n for n, _ in out]
+    if len(set(names)) != len(names):
+        raise SystemExit("[ERROR] model names must be unique, use name=path")
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("models", nargs="+", help="Checkpoints/artifacts as name=path or path.")
+    ap.add_argument("--out-dir", type=Path, default=OUT_DIR)
+    ap.add_argument("--data-dir", type=Path, default=Path(DATA_DIR),
+                    help="Triplet tree to evaluate on (raw or derived).")
+    args = ap.parse_args()
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+
+    _, _, test_loader, num_classes, classes = get_loaders(
+        args.data_dir, batch_size=BATCH, img_size=IMG, seed=SEED
+    )
+
+    models = []
+    for name, path in parse_models(args.models):
+        model, model_classes, model_device = load_artifact(path, device)
+        if model_classes is not None and list(model_classes) != list(classes):
+            raise SystemExit(f"[ERROR] {name}: classes {model_classes} do not match dataset {classes}")
+        models.append((name, path, model, model_device))
+        print(f"[INFO] loaded {name} <- {path} ({model_device})")
+
+    m = len(models)
+    meters = [MetricAccumulator(num_classes, device="cpu") for _ in models]
+    times = [0.0] * m
+    agree = torch.zeros(m, m, dtype=torch.long)
+    all_agree = 0
+    any_correct = 0
+
+    args.out_dir.mkdir(parents=True, exist_ok=True)
+    triplets = test_loader.dataset.all_triplets
+    names = [name for name, _, _, _ in models]
+    sample_i = 0
+
+    with (args.out_dir / "per_sample.csv").open("w", newline="") as f, torch.no_grad():
+        w = csv.writer(f)
+        w.writerow(["appid", "label"] + [f"pred_{n}" for n in names] + ["agree"])
+
+        # each batch is decoded once and handed to every model
+        for x, y in test_loader:
+            preds = []
+            for i, (name, _, model, model_device) in enumerate(models):
+                xb = x.to(model_device, non_blocking=True)
+                if model_device == "cuda":
+                    torch.cuda.synchronize()
+                t0 = time.perf_counter()
+                logits = model(xb)
+                if model_device == "cuda":
+                    torch.cuda.synchronize()
+                times[i] += time.perf_counter() - t0
+
+                logits = logits.float().cpu()
+                meters[i].update(logits, y)
+                preds.append(logits.argmax(dim=1))
+
+            p = torch.stack(preds)
+            agree += (p[:, None, :] == p[None, :, :]).sum(dim=2)
+            same = (p == p[0]).all(dim=0)
+            all_agree += int(same.sum())
+            any_correct += int((p == y[None, :]).any(dim=0).sum())
+
+            for j in range(len(y)):
+                paths, _ = triplets[sample_i + j]
+                w.writerow([paths[0].stem, classes[int(y[j])]] + [classes[int(p[i, j])] for i in range(m)] + [int(same[j])])
+            sample_i += len(y)
+
+    total = max(1, sample_i)
+    table = []
+    for i, (name, path, _, model_device) in enumerate(models):
+        r = meters[i].compute(classes)
+        table.append({
+            "name": name,
+            "path": str(path),
+            "device": model_device,
+            "acc": r["acc"],
+            "macro_f1": r["macro"]["f1"],
+            "top5_acc": r.get("top5_acc"),
+            "ece": r["ece"],
+            "ms_per_sample": 1000.0 * times[i] / total,
+            "metrics": r,
+        })
+
+    result = {
+        "samples": sample_i,
+        "models": table,
+        "pairwise_agreement": {
+            names[i]: {names[j]: int(agree[i, j]) / total for j in range(m)} for i in range(m)
+        },
+        "all_agree": all_agree / total,
+        "oracle_acc": any_correct / total,
+    }
+    (args.out_dir / "compare.json").write_text(json.dumps(result, indent=2), encoding="utf-8")
+
+    width = max(len(n) for n in names)
+    print(f"\n{'model':<{width}}  {'acc':>7}  {'macroF1':>7}  {'top5':>7}  {'ECE':>7}  {'ms/smp':>7}")
+    for row in table:
+        top5 = f"{row['top5_acc']:.4f}" if row["top5_acc"] is not None else "-"
+        print(f"{row['name']:<{width}}  {row['acc']:>7.4f}  {row['macro_f1']:>7.4f}  {top5:>7}  "
+              f"{row['ece']:>7.4f}  {row['ms_per_sample']:>7.2f}")
+
+    print("\nagreement:")
+    for i in range(m):
+        print(f"{names[i]:<{width}}  " + "  ".join(f"{int(agree[i, j]) / total:.3f}" for j in range(m)))
+    print(f"\nall models agree: {result['all_agree']:.4f} | oracle (any correct): {result['oracle_acc']:.4f}")
+    print("Saved:", args.out_dir / "compare.json")
+    print("Saved:", args.out_dir / "per_sample.csv")
+
+
+if __name__ == "__main__":
+    main()
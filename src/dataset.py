@@ -6,10 +6,46 @@ from torch.utils.data import Dataset, DataLoader
 from torchvision import transforms
 from PIL import Image
 
+
+IMG_SUFFIXES = (".jpg", ".webp")  # raw tree is .jpg, derived trees may be .webp
+
+
+def group_triplets(dir_path, files):
+    # <appid>.jpg, <appid>_gp1.jpg, <appid>_gp2.jpg -> one sample
+    groups = {}
+
+    for f in files:
+        if not f.endswith(IMG_SUFFIXES):
+            continue
+
+        base = f.split("_")[0].split(".")[0]
+
+        if base not in groups:
+            groups[base] = []
+
+        groups[base].append(Path(dir_path) / f)
+
+    triplets = []
+    for base in groups:
+        imgs = groups[base]
+        if len(imgs) == 3:
+            triplets.append((base, sorted(imgs)))
+
+    return triplets
+
+
+def build_eval_tf(img_size=224):
+    return transforms.Compose([
+        transforms.Resize((img_size, img_size)),
+        transforms.ToTensor(),
+    ])
+
+
 class TripletDataset(Dataset):
-    def __init__(self, root_dir, indices, transform):
+    def __init__(self, root_dir, indices, transform, return_index=False):
         self.samples = []
         self.transform = transform
+        self.return_index = return_index
 
         root_dir = Path(root_dir)
 
@@ -21,25 +57,8 @@ class TripletDataset(Dataset):
 
         for cls in class_to_idx:
             cls_dir = root_dir / cls
-            files = os.listdir(cls_dir)
-
-            groups = {}
-
-            for f in files:
-                if not f.endswith(".jpg"):
-                    continue
-
-                base = f.split("_")[0].split(".")[0]
-
-                if base not in groups:
-                    groups[base] = []
-
-                groups[base].append(cls_dir / f)
-
-            for base in groups:
-                imgs = groups[base]
-                if len(imgs) == 3:
-                    all_triplets.append((sorted(imgs), class_to_idx[cls]))
+            for _, imgs in group_triplets(cls_dir, os.listdir(cls_dir)):
+                all_triplets.append((imgs, class_to_idx[cls]))
 
         self.all_triplets = [all_triplets[i] for i in indices]
 
@@ -56,10 +75,12 @@ class TripletDataset(Dataset):
             imgs.append(img)
 
         x = torch.cat(imgs, dim=0)
+        if self.return_index:
+            return x, label, idx
         return x, label
 
 
-def get_loaders(data_dir, batch_size=32, img_size=224, seed=42):
+def get_loaders(data_dir, batch_size=32, img_size=224, seed=42, train_index=False):
 
     train_tf = transforms.Compose([
         transforms.Resize((img_size, img_size)),
@@ -69,10 +90,7 @@ def get_loaders(data_dir, batch_size=32, img_size=224, seed=42):
         transforms.ToTensor(),
     ])
 
-    eval_tf = transforms.Compose([
-        transforms.Resize((img_size, img_size)),
-        transforms.ToTensor(),
-    ])
+    eval_tf = build_eval_tf(img_size)
 
     root = Path(data_dir)
 
@@ -82,25 +100,8 @@ def get_loaders(data_dir, batch_size=32, img_size=224, seed=42):
 
     for cls in class_names:
         cls_dir = root / cls
-        files = os.listdir(cls_dir)
-
-        groups = {}
-
-        for f in files:
-            if not f.endswith(".jpg"):
-                continue
-
-            base = f.split("_")[0].split(".")[0]
-
-            if base not in groups:
-                groups[base] = []
-
-            groups[base].append(cls_dir / f)
-
-        for base in groups:
-            imgs = groups[base]
-            if len(imgs) == 3:
-                temp_dataset.append((sorted(imgs), class_to_idx[cls]))
+        for _, imgs in group_triplets(cls_dir, os.listdir(cls_dir)):
+            temp_dataset.append((imgs, class_to_idx[cls]))
 
     rng = random.Random(seed)
     by_class = {}
@@ -123,7 +124,7 @@ def get_loaders(data_dir, batch_size=32, img_size=224, seed=42):
         val_idx.extend(inds[n_train:n_train + n_val])
         test_idx.extend(inds[n_train + n_val:])
 
-    train_ds = TripletDataset(data_dir, train_idx, train_tf)
+    train_ds = TripletDataset(data_dir, train_idx, train_tf, return_index=train_index)
     val_ds = TripletDataset(data_dir, val_idx, eval_tf)
     test_ds = TripletDataset(data_dir, test_idx, eval_tf)
 
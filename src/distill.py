@@ -0,0 +1,79 @@
+import copy
+import hashlib
+from pathlib import Path
+
+import torch
+import torch.nn.functional as F
+from torch.utils.data import DataLoader
+
+from models.factory import load_model
+
+
+def split_fingerprint(dataset, teacher_ckpt: Path) -> str:
+    # cache is tied to the exact train split and the exact teacher checkpoint
+    h = hashlib.sha1()
+    for paths, label in dataset.all_triplets:
+        h.update(("|".join(str(p) for p in paths) + f":{label}\n").encode("utf-8"))
+    st = Path(teacher_ckpt).stat()
+    h.update(f"{teacher_ckpt}:{st.st_size}:{st.st_mtime_ns}".encode("utf-8"))
+    return h.hexdigest()
+
+
+def check_classes(teacher_classes, classes) -> None:
+    # same count in another order (raw vs balanced_raw, another --data-dir) would permute the targets
+    if list(teacher_classes) != list(classes):
+        raise SystemExit(f"[ERROR] teacher classes {list(teacher_classes)} do not match the student's {list(classes)}")
+
+
+def cache_teacher_logits(train_ds, eval_tf, teacher_ckpt: Path, cache_path: Path, device: str,
+                         classes, batch_size: int = 64):
+    """Teacher logits for the whole train split, computed once and kept on disk.
+
+    The teacher sees the eval (non-augmented) view of every triplet, so the
+    cache is deterministic and valid for every epoch. The teacher's classes
+    must be the student's, in the same order.
+    """
+    key = split_fingerprint(train_ds, teacher_ckpt)
+
+    if cache_path.exists():
+        cached = torch.load(cache_path, map_location="cpu")
+        if cached.get("key") == key and cached.get("classes") is not None:
+            check_classes(cached["classes"], classes)
+            print(f"[DISTILL] teacher logits from cache: {cache_path}")
+            return cached["logits"]
+
+    teacher, teacher_classes, _ = load_model(teacher_ckpt, device)
+    check_classes(teacher_classes, classes)
+
+    clean_ds = copy.copy(train_ds)
+    clean_ds.transform = eval_tf
+    clean_ds.return_index = False
+    loader = DataLoader(clean_ds, batch_size=batch_size, shuffle=False, num_workers=4)
+
+    chunks = []
+    with torch.no_grad():
+        for x, _ in loader:
+            chunks.append(teacher(x.to(device)).float().cpu())
+
+    logits = torch.cat(chunks, dim=0)
+
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    torch.save({"key": key, "logits": logits, "classes": teacher_classes}, cache_path)
+    print(f"[DISTILL] cached teacher logits {tuple(logits.shape)} -> {cache_path}")
+
+    del teacher
+    if device == "cuda":
+        torch.cuda.empty_cache()
+
+    return logits
+
+
+def distillation_loss(student_logits, teacher_logits, y, alpha: float, temperature: float):
+    t = temperature
+    soft = F.kl_div(
+        F.log_softmax(student_logits / t, dim=1),
+        F.softmax(teacher_logits / t, dim=1),
+        reduction="batchmean",
+    ) * (t * t)
+    hard = F.cross_entropy(student_logits, y)
+    return alpha * soft + (1.0 - alpha) * hard
@@ -0,0 +1,545 @@
+#!/usr/bin/env python3
+"""
+Shared asyncio download engine for covers and gameplay screenshots.
+
+- One aiohttp session with a bounded connection pool (global + per host)
+- Global concurrency limit (semaphore), independent of thread count
+- Streaming writes through the atomic <dst>.part -> rename pattern; parts
+  with a validator survive interruptions and resume via Range/If-Range
+- Retries 429/5xx with backoff (Retry-After respected); with a HostRateLimiter
+  the limiter owns pacing and backoff instead (no stacked sleeps)
+- Cancellation-safe: a cancelled download removes its .part file unless it
+  can be resumed
+- Optional validator store (url_meta.UrlMetaStore): ETag/Last-Modified of
+  every 200 are recorded; revalidate=True turns "already on disk" into a
+  conditional GET (304 keeps the file, 200 replaces it)
+- In-stream validation (imgcheck.py): Content-Type, magic bytes on the first
+  chunk, Content-Length, header/dimension parse before the rename; rejected
+  URLs are remembered in the validator store with their reason
+- A revalidation that replaces a file re-links the copies recorded for it
+  (UrlMetaStore.link), which would otherwise keep the old inode
+- on_saved(path) hook after every file written (e.g. derive.Deriver.submit)
+- Every request, body byte, retry and failure reason is reported to the
+  process-wide telemetry (telemetry.py)
+
+Scripts stay synchronous and call run_downloads(...) or drive the engine
+inside their own asyncio.run(...).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import random
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass
+from email.utils import formatdate
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import aiohttp
+
+from blobstore import link_or_copy
+from imgcheck import (CONTENT_TYPE, NOT_IMAGE, SNIFF_BYTES, TOO_SMALL, TRANSIENT, TRUNCATED,
+                      acceptable_content_type, check_file, sniff)
+from ratelimit import HostRateLimiter, host_of, parse_retry_after
+from telemetry import Telemetry, default_telemetry
+
+try:
+    from tqdm import tqdm
+except ImportError:
+    tqdm = None
+
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                  "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept": "application/json,text/html;q=0.9,*/*;q=0.8",
+}
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+CHUNK = 256 * 1024
+
+_CONTENT_RANGE = re.compile(r"bytes\s+(\d+)-(\d+)/(\d+|\*)")
+
+
+@dataclass(frozen=True)
+class DownloadTask:
+    url: str
+    path: Path
+    # extra URLs tried in order if the first one fails (e.g. cover templates)
+    fallbacks: Tuple[str, ...] = ()
+
+
+def parse_content_range(value: Optional[str]) -> Tuple[Optional[int], Optional[int]]:
+    """(first byte, complete length) from 'bytes 100-199/1000'; None where unknown."""
+    m = _CONTENT_RANGE.match(value or "")
+    if not m:
+        return None, None
+    return int(m.group(1)), int(m.group(3)) if m.group(3) != "*" else None
+
+
+def _unlink(p: Path) -> None:
+    try:
+        p.unlink(missing_ok=True)
+    except Exception:
+        pass
+
+
+class DownloadEngine:
+    def __init__(
+        self,
+        concurrency: int = 64,
+        per_host: int = 16,
+        timeout: float = 45.0,
+        retries: int = 4,
+        headers: Optional[Dict[str, str]] = None,
+        cookies: Optional[Dict[str, str]] = None,
+        limiter: Optional[HostRateLimiter] = None,
+        validators=None,
+        revalidate: bool = False,
+        on_saved: Optional[Callable[[Path], None]] = None,
+        validate: bool = True,
+        min_side: int = 64,
+        telemetry: Optional[Telemetry] = None,
+    ):
+        self.concurrency = max(1, concurrency)
+        self.per_host = max(1, per_host)
+        self.timeout = timeout
+        self.retries = max(1, retries)
+        self.headers = dict(DEFAULT_HEADERS if headers is None else headers)
+        self.cookies = cookies or {}
+        self.limiter = limiter
+        self.validators = validators
+        self.revalidate = revalidate and validators is not None
+        self.on_saved = on_saved
+        self.validate = validate
+        self.min_side = min_side
+        self.counters = {"fetched": 0, "not_modified": 0, "bytes": 0, "rejected": 0,
+                         "resumed": 0, "resumed_bytes": 0}
+        # failure reason -> count, for run summaries
+        self.reasons: Counter = Counter()
+        self.telemetry = telemetry or default_telemetry()
+        self.session: Optional[aiohttp.ClientSession] = None
+        self._sem: Optional[asyncio.Semaphore] = None
+
+    async def __aenter__(self) -> "DownloadEngine":
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.per_host, ttl_dns_cache=300)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            headers=self.headers,
+            cookies=self.cookies,
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=15, sock_read=self.timeout),
+        )
+        self._sem = asyncio.Semaphore(self.concurrency)
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _pace(self, url: str) -> None:
+        if self.limiter is not None:
+            await self.limiter.acquire_async(host_of(url))
+
+    def _ok(self, url: str) -> None:
+        if self.limiter is not None:
+            self.limiter.on_success(host_of(url))
+
+    def _failed(self, reason: str) -> str:
+        self.reasons[reason] += 1
+        self.telemetry.failure(reason)
+        return reason
+
+    async def _backoff(self, url: str, attempt: int, retry_after: Optional[str] = None,
+                       cause: object = "error") -> None:
+        self.telemetry.retry(url, cause)
+        ra = parse_retry_after(retry_after)
+        if self.limiter is not None:
+            # the limiter slows the host down and the next _pace() waits for it
+            self.limiter.on_throttle(host_of(url), ra)
+            return
+        if ra is not None:
+            await asyncio.sleep(min(60.0, ra))
+            return
+        await asyncio.sleep(min(30.0, 0.8 * (2 ** attempt)) + random.random() * 0.3)
+
+    async def get_json(self, url: str, params: Optional[Dict] = None):
+        """GET url and decode JSON; None on failure after retries."""
+        for attempt in range(self.retries):
+            await self._pace(url)
+            cause: object = "error"
+            try:
+                async with self._sem:
+                    t0, seen = time.perf_counter(), False
+                    try:
+                        async with self.session.get(url, params=params) as r:
+                            seen = True
+                            self.telemetry.request(url, r.status, time.perf_counter() - t0)
+                            if r.status in RETRY_STATUS:
+                                retry_after, cause = r.headers.get("Retry-After"), r.status
+                            elif r.status != 200:
+                                return None
+                            else:
+                                self._ok(url)
+                                body = await r.read()
+                                self.telemetry.received(url, len(body))
+                                return json.loads(body)
+                    except (aiohttp.ClientError, asyncio.TimeoutError):
+                        if not seen:
+                            self.telemetry.request(url, "error", time.perf_counter() - t0)
+                        raise
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                retry_after = None
+            await self._backoff(url, attempt, retry_after, cause)
+        return None
+
+    def _resume_point(self, url: str, part: Path, side: Path) -> Tuple[int, Dict[str, str]]:
+        """(offset, Range/If-Range headers) to continue a kept .part, or (0, {}) after discarding it."""
+        try:
+            size = part.stat().st_size
+            meta = json.loads(side.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            size, meta = 0, None
+        if not isinstance(meta, dict):
+            meta = {}
+        etag = meta.get("etag")
+        # If-Range needs a strong validator
+        validator = etag if etag and not etag.startswith("W/") else meta.get("last_modified")
+        total = meta.get("total")
+        if not size or meta.get("url") != url or not validator or (total and size >= total):
+            _unlink(part)
+            _unlink(side)
+            return 0, {}
+        return size, {"Range": f"bytes={size}-", "If-Range": validator}
+
+    async def _fetch_once(self, url: str, part: Path, side: Path, headers: Dict[str, str], offset: int):
+        """One streaming attempt into part, appending when a 206 continues it.
+
+        Returns (file size, status, response headers, reject reason, expected
+        size). With validation on, junk is cut off as early as possible: a
+        non-image Content-Type before the body, a bad magic number after the
+        first bytes, a short body against Content-Length, and an unparsable or
+        tiny header before the caller renames the file into place.
+        While a body is streaming, its validators sit in the side file, so an
+        interrupted transfer can be resumed with Range by the next attempt or
+        run.
+        """
+        t0 = time.perf_counter()
+        try:
+            r = await self.session.get(url, headers=headers or None)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self.telemetry.request(url, "error", time.perf_counter() - t0)
+            raise
+        self.telemetry.request(url, r.status, time.perf_counter() - t0)
+        async with r:
+            if r.status not in (200, 206):
+                return 0, r.status, r.headers, None, None
+            if self.validate and not acceptable_content_type(r.headers.get("Content-Type")):
+                return 0, 200, r.headers, CONTENT_TYPE, None
+
+            identity = "Content-Encoding" not in r.headers
+            if r.status == 206:
+                start, total = parse_content_range(r.headers.get("Content-Range"))
+                if start != offset:
+                    return 0, 416, r.headers, None, None  # not the range we asked for: start over
+                mode = "ab"
+                with open(part, "rb") as f:
+                    head = f.read(SNIFF_BYTES)
+                self.counters["resumed"] += 1
+                self.counters["resumed_bytes"] += offset
+                self.telemetry.count("resumed")
+            else:
+                offset = 0
+                mode = "wb"
+                head = b""
+                # aiohttp decodes Content-Encoding, the length then no longer applies
+                total = r.content_length if identity else None
+
+            etag, last_modified = r.headers.get("ETag"), r.headers.get("Last-Modified")
+            ranges = r.status == 206 or (r.headers.get("Accept-Ranges") or "").lower() == "bytes"
+            if (etag or last_modified) and identity and ranges:
+                side.write_text(json.dumps({"url": url, "etag": etag, "last_modified": last_modified,
+                                            "total": total}), encoding="utf-8")
+            else:
+                _unlink(side)
+
+            size = offset
+            kind = sniff(head) if head else None
+            with open(part, mode) as f:
+                async for chunk in r.content.iter_chunked(CHUNK):
+                    if self.validate and kind is None:
+                        head += chunk[:SNIFF_BYTES]
+                        if len(head) >= SNIFF_BYTES:
+                            kind = sniff(head)
+                            if kind is None:
+                                return size, 200, r.headers, NOT_IMAGE, total
+                    f.write(chunk)
+                    size += len(chunk)
+                    self.counters["bytes"] += len(chunk)
+                    self.telemetry.received(url, len(chunk))
+            if total is not None and size != total:
+                return size, 200, r.headers, TRUNCATED, total
+            if not self.validate:
+                return size, 200, r.headers, None, total
+            if kind is None:
+                return size, 200, r.headers, NOT_IMAGE, total  # body shorter than a magic number
+            return size, 200, r.headers, check_file(part, kind, self.min_side), total
+
+    def _conditional_headers(self, url: str, dst: Path) -> Dict[str, str]:
+        headers: Dict[str, str] = {}
+        etag, last_modified = self.validators.get(url) or (None, None)
+        if etag:
+            headers["If-None-Match"] = etag
+        # our own mtime is never older than the upstream change we fetched
+        headers["If-Modified-Since"] = last_modified or formatdate(dst.stat().st_mtime, usegmt=True)
+        return headers
+
+    def _relink(self, dst: Path) -> List[Path]:
+        """Point the recorded linked copies of a replaced dst at its new bytes."""
+        out = []
+        for p in self.validators.links(dst):
+            # a copy deleted since (trash, subsampling) stays deleted
+            if p != dst.resolve() and p.exists():
+                link_or_copy(dst, p)
+                out.append(p)
+        return out
+
+    def _reject(self, url: str, reason: str) -> str:
+        self.counters["rejected"] += 1
+        if self.validators is not None:
+            self.validators.reject(url, reason)
+        return self._failed(reason)
+
+    async def fetch(self, url: str, dst: Path, min_bytes: int = 6_000) -> Optional[str]:
+        """Download url to dst atomically. None on success, else a short failure reason.
+
+        The body goes to <dst>.part and is renamed into place once complete:
+        equal to Content-Length when the server sends one, at least min_bytes
+        otherwise. An interrupted .part whose server sent a validator and
+        Accept-Ranges is kept and continued with Range/If-Range (by the next
+        attempt, or the next run); a 200 instead of 206 simply starts over.
+
+        Content rejections (not an image, too small, ...) are remembered per URL
+        in the validator store and not requested again, except when revalidating.
+        """
+        dst.parent.mkdir(parents=True, exist_ok=True)
+
+        cond = None
+        if dst.exists() and dst.stat().st_size >= min_bytes:
+            if not self.revalidate:
+                return None
+            cond = self._conditional_headers(url, dst)
+        elif self.validators is not None and not self.revalidate:
+            known = self.validators.rejected(url)
+            if known:
+                return self._failed(known)
+
+        part = dst.with_name(dst.name + ".part")
+        side = dst.with_name(dst.name + ".part.json")
+
+        reason = "retries"
+        try:
+            for attempt in range(self.retries):
+                if cond is None:
+                    offset, headers = self._resume_point(url, part, side)
+                else:
+                    # revalidation replaces a complete file, no partial state
+                    offset, headers = 0, dict(cond)
+                    _unlink(part)
+                await self._pace(url)
+                try:
+                    async with self._sem:
+                        size, status, resp, bad, expected = await self._fetch_once(url, part, side, headers, offset)
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    # a resumable .part stays for the next attempt
+                    await self._backoff(url, attempt, cause="error")
+                    continue
+
+                if status == 304 and cond is not None:
+                    self._ok(url)
+                    self.counters["not_modified"] += 1
+                    self.telemetry.count("not_modified")
+                    self.validators.touch(url)
+                    return None
+
+                if status == 416:
+                    # the kept part no longer matches (or is already whole): drop it, refetch
+                    _unlink(part)
+                    _unlink(side)
+                    continue
+
+                if status == 200:
+                    self._ok(url)
+                    if bad is None and expected is None and size < min_bytes:
+                        bad = TOO_SMALL
+                    if bad is not None:
+                        if bad in TRANSIENT:
+                            reason = bad
+                            self.telemetry.retry(url, bad)
+                            continue
+                        _unlink(part)
+                        _unlink(side)
+                        return self._reject(url, bad)
+                    part.replace(dst)
+                    _unlink(side)
+                    self.counters["fetched"] += 1
+                    self.telemetry.count("ok")
+                    saved = [dst]
+                    if self.validators is not None:
+                        self.validators.put(url, dst, resp.get("ETag"), resp.get("Last-Modified"), size)
+                        if cond is not None:
+                            saved += self._relink(dst)
+                    if self.on_saved is not None:
+                        for p in saved:
+                            self.on_saved(p)
+                    return None
+
+                if status in RETRY_STATUS:
+                    await self._backoff(url, attempt, resp.get("Retry-After"), status)
+                    continue
+                _unlink(part)
+                _unlink(side)
+                return self._failed(f"http_{status}")
+            return self._failed(reason)
+        finally:
+            # failures, exhausted retries and cancellation: only a resumable part survives
+            if part.exists() and not side.exists():
+                _unlink(part)
+
+    async def download(self, url: str, dst: Path, min_bytes: int = 6_000) -> bool:
+        return await self.fetch(url, dst, min_bytes) is None
+
+    async def fetch_task(self, task: DownloadTask, min_bytes: int = 6_000) -> Optional[str]:
+        """None once any URL of the task succeeds, else the reason of the first URL."""
+        first = None
+        for url in (task.url,) + tuple(task.fallbacks):
+            reason = await self.fetch(url, task.path, min_bytes)
+            if reason is None:
+                return None
+            first = first or reason
+        return first
+
+    async def download_task(self, task: DownloadTask, min_bytes: int = 6_000) -> bool:
+        return await self.fetch_task(task, min_bytes) is None
+
+    async def run(
+        self,
+        tasks: Iterable[DownloadTask],
+        min_bytes: int = 6_000,
+        on_result: Optional[Callable[[DownloadTask, bool, str], bool]] = None,
+        desc: str = "Downloading",
+        window: Optional[int] = None,
+    ) -> Tuple[int, int]:
+        """Download tasks concurrently through a bounded submission window.
+
+        At most `window` tasks (default 4x concurrency) exist at once and the
+        window is refilled as results arrive, so memory stays flat however
+        long `tasks` is (it may be a lazy iterator). on_result(task, ok, reason)
+        is called as results arrive (reason is "" on success); returning True
+        stops the run and cancels everything still in flight.
+        """
+        ok = 0
+        fail = 0
+        window = max(1, window or self.concurrency * 4)
+        total = len(tasks) if hasattr(tasks, "__len__") else None
+        bar = tqdm(total=total, desc=desc, unit="img") if tqdm else None
+
+        async def one(t: DownloadTask):
+            return t, await self.fetch_task(t, min_bytes)
+
+        it = iter(tasks)
+        pending = set()
+
+        def fill() -> None:
+            while len(pending) < window:
+                t = next(it, None)
+                if t is None:
+                    return
+                pending.add(asyncio.ensure_future(one(t)))
+
+        fill()
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                stop = False
+                for fut in done:
+                    try:
+                        task, reason = fut.result()
+                    except Exception as e:
+                        task, reason = None, f"error:{type(e).__name__}"
+                    if reason is None:
+                        ok += 1
+                    else:
+                        fail += 1
+                    if bar:
+                        bar.update(1)
+                    if on_result is not None and task is not None and on_result(task, reason is None, reason or ""):
+                        stop = True
+                if stop:
+                    break
+                fill()
+        finally:
+            for fut in pending:
+                fut.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            if bar:
+                bar.close()
+
+        return ok, fail
+
+    async def run_queue(
+        self,
+        q: "asyncio.Queue[Optional[DownloadTask]]",
+        workers: int,
+        min_bytes: int = 6_000,
+        on_result: Optional[Callable[[DownloadTask, bool, str], object]] = None,
+    ) -> None:
+        """Consume tasks from q with `workers` coroutines; each stops on a None.
+
+        Lets producers (e.g. metadata lookups) feed downloads as they go instead
+        of building the full task list first.
+        """
+        async def worker():
+            while True:
+                task = await q.get()
+                if task is None:
+                    return
+                try:
+                    reason = await self.fetch_task(task, min_bytes)
+                except Exception as e:
+                    reason = f"error:{type(e).__name__}"
+                if on_result is not None:
+                    on_result(task, reason is None, reason or "")
+
+        await asyncio.gather(*(worker() for _ in range(max(1, workers))))
+
+
+def run_downloads(
+    tasks: Iterable[DownloadTask],
+    concurrency: int = 64,
+    per_host: int = 16,
+    min_bytes: int = 6_000,
+    timeout: float = 45.0,
+    on_result: Optional[Callable[[DownloadTask, bool, str], bool]] = None,
+    desc: str = "Downloading",
+    headers: Optional[Dict[str, str]] = None,
+    window: Optional[int] = None,
+    validators=None,
+    revalidate: bool = False,
+    on_saved: Optional[Callable[[Path], None]] = None,
+) -> Tuple[int, int]:
+    """Synchronous entry point for scripts; Ctrl+C cancels cleanly.
+
+    tasks may be a generator; it is consumed lazily through the run window.
+    """
+    async def _main():
+        async with DownloadEngine(concurrency=concurrency, per_host=per_host, timeout=timeout, headers=headers,
+                                  validators=validators, revalidate=revalidate, on_saved=on_saved) as eng:
+            return await eng.run(tasks, min_bytes=min_bytes, on_result=on_result, desc=desc, window=window)
+
+    return asyncio.run(_main())
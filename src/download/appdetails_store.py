@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Single-file SQLite cache for Steam appdetails, shared by every downloader.
+
+Replaces data/splits/appdetails_cache/<appid>.json (one file per app).
+
+- WAL mode: concurrent readers and writers across threads and processes
+- Per-app row: extracted columns we actually use (type, genres, header_image,
+  screenshot URLs) + the zlib-compressed payload minus long text fields
+- fetched_at timestamp for TTL-based refresh
+- genre_index(): appid -> (type, genres) of everything cached, in one query,
+  so crawlers can route known apps without a request; a request made with
+  genres (with_genres=True) stores [] when Steam lists none, so such apps
+  are known and never refetched for their genres
+- One-shot migration from the old JSON directory:
+    python src/download/appdetails_store.py --migrate data/splits/appdetails_cache
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+BASE_DIR = Path(__file__).resolve().parents[2]
+DB_PATH = BASE_DIR / "data" / "splits" / "appdetails.sqlite"
+LEGACY_JSON_DIR = BASE_DIR / "data" / "splits" / "appdetails_cache"
+
+# (type, lower-cased genre descriptions)
+# genres is None when the row was cached by a request without genres
+GenreEntry = Tuple[Optional[str], Optional[FrozenSet[str]]]
+
+# big HTML/text blobs nobody downstream reads
+STRIP_FIELDS = (
+    "detailed_description", "about_the_game", "short_description", "legal_notice",
+    "pc_requirements", "mac_requirements", "linux_requirements", "reviews",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS appdetails (
+    appid        INTEGER PRIMARY KEY,
+    fetched_at   REAL    NOT NULL,
+    success      INTEGER NOT NULL,
+    type         TEXT,
+    genres       TEXT,
+    header_image TEXT,
+    screenshots  TEXT,
+    payload      BLOB
+);
+CREATE INDEX IF NOT EXISTS appdetails_type ON appdetails(type);
+"""
+
+
+def _extract(node: Dict, with_genres: bool = False) -> Dict:
+    data = node.get("data") if isinstance(node, dict) else None
+    if not node.get("success") or not isinstance(data, dict):
+        return {"success": 0, "type": None, "genres": None, "header_image": None, "screenshots": None}
+
+    # Steam omits the key for apps without genres; only a request that asked
+    # for them can tell that apart from a filtered one
+    genres = [] if with_genres else None
+    if isinstance(data.get("genres"), list):
+        genres = [g.get("description") for g in data["genres"] if isinstance(g, dict) and g.get("description")]
+
+    shots = None
+    if isinstance(data.get("screenshots"), list):
+        shots = []
+        for s in data["screenshots"]:
+            if isinstance(s, dict):
+                u = s.get("path_full") or s.get("path_thumbnail")
+                if isinstance(u, str) and u:
+                    shots.append(u)
+
+    header = data.get("header_image")
+    return {
+        "success": 1,
+        "type": data.get("type"),
+        "genres": json.dumps(genres) if genres is not None else None,
+        "header_image": header if isinstance(header, str) and header else None,
+        "screenshots": json.dumps(shots) if shots is not None else None,
+    }
+
+
+def _compress(node: Dict) -> bytes:
+    data = node.get("data")
+    if isinstance(data, dict):
+        node = dict(node, data={k: v for k, v in data.items() if k not in STRIP_FIELDS})
+    return zlib.compress(json.dumps(node, separators=(",", ":")).encode("utf-8"), 6)
+
+
+class AppDetailsCache:
+    def __init__(self, path: Path = DB_PATH, ttl_days: Optional[float] = None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl_days * 86400.0 if ttl_days else None
+        self._tls = threading.local()
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections are per thread; WAL lets them run side by side
+        conn = getattr(self._tls, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._tls.conn = conn
+        return conn
+
+    def _fresh(self, fetched_at: float, max_age: Optional[float]) -> bool:
+        max_age = self.ttl if max_age is None else max_age
+        return max_age is None or time.time() - fetched_at <= max_age
+
+    def get_payload(self, appid: int, max_age: Optional[float] = None) -> Optional[Dict]:
+        """Cached {"success": ..., "data": ...} node, or None if missing/stale."""
+        row = self._conn().execute(
+            "SELECT fetched_at, payload FROM appdetails WHERE appid = ?", (appid,)
+        ).fetchone()
+        if row is None or not self._fresh(row[0], max_age):
+            return None
+        try:
+            return json.loads(zlib.decompress(row[1]).decode("utf-8"))
+        except Exception:
+            return None
+
+    def get_details(self, appid: int, require_genres: bool = False) -> Tuple[bool, Optional[Dict]]:
+        """(hit, data) for the crawlers.
+
+        hit=False means "go fetch it" (missing, stale, or cached by a filtered
+        request without genres for an app that may be a game); on a hit, data
+        is None for apps Steam has no details for.
+        """
+        row = self.get_row(appid)
+        if row is None or (require_genres and row["success"] and row["genres"] is None
+                           and row["type"] in (None, "game")):
+            return False, None
+        if not row["success"]:
+            return True, None
+        node = self.get_payload(appid)
+        if node is None:
+            return False, None
+        data = node.get("data")
+        return True, data if isinstance(data, dict) else None
+
+    def get_row(self, appid: int, max_age: Optional[float] = None) -> Optional[Dict]:
+        """Extracted columns only (no decompression)."""
+        row = self._conn().execute(
+            "SELECT fetched_at, success, type, genres, header_image, screenshots FROM appdetails WHERE appid = ?",
+            (appid,),
+        ).fetchone()
+        if row is None or not self._fresh(row[0], max_age):
+            return None
+        return {
+            "appid": appid,
+            "fetched_at": row[0],
+            "success": bool(row[1]),
+            "type": row[2],
+            "genres": json.loads(row[3]) if row[3] is not None else None,
+            "header_image": row[4],
+            "screenshots": json.loads(row[5]) if row[5] is not None else None,
+        }
+
+    def put_payload(self, appid: int, node: Dict, fetched_at: Optional[float] = None,
+                    with_genres: bool = False) -> None:
+        """Store one appdetails node; with_genres=True when the request asked for genres."""
+        self.put_many([(appid, node, fetched_at)], with_genres)
+
+    def put_many(self, items: Iterable, with_genres: bool = False) -> int:
+        rows = []
+        now = time.time()
+        for appid, node, fetched_at in items:
+            if not isinstance(node, dict):
+                continue
+            ex = _extract(node, with_genres)
+            rows.append((int(appid), fetched_at or now, ex["success"], ex["type"], ex["genres"],
+                         ex["header_image"], ex["screenshots"], _compress(node)))
+        if not rows:
+            return 0
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO appdetails "
+                "(appid, fetched_at, success, type, genres, header_image, screenshots, payload) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+    def genre_index(self, max_age: Optional[float] = None) -> Dict[int, Optional[GenreEntry]]:
+        """appid -> (type, lower-cased genres) from the extracted columns, no payload decompression.
+
+        Covers every app any downloader cached with genres or a type; None
+        marks apps Steam has no details for, genres None apps cached by a
+        filtered request without genres. Stale rows are left out, i.e. unknown.
+        """
+        rows = self._conn().execute(
+            "SELECT appid, fetched_at, success, type, genres FROM appdetails "
+            "WHERE success = 0 OR genres IS NOT NULL OR type IS NOT NULL"
+        )
+        out: Dict[int, Optional[GenreEntry]] = {}
+        # few distinct (type, genres) combinations: share one tuple per combination
+        shared: Dict[Tuple[Optional[str], Optional[str]], GenreEntry] = {}
+        for appid, fetched_at, success, typ, genres in rows:
+            if not self._fresh(fetched_at, max_age):
+                continue
+            if not success:
+                out[appid] = None
+                continue
+            key = (typ, genres)
+            entry = shared.get(key)
+            if entry is None:
+                gs = frozenset(g.lower() for g in json.loads(genres)) if genres is not None else None
+                entry = shared[key] = (typ, gs)
+            out[appid] = entry
+        return out
+
+    def screenshot_urls(self, appid: int, n: int) -> List[str]:
+        row = self.get_row(appid)
+        if not row or not row["success"] or not row["screenshots"]:
+            return []
+        return row["screenshots"][:n]
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM appdetails").fetchone()[0]
+
+
+_default: Optional[AppDetailsCache] = None
+_default_lock = threading.Lock()
+
+
+def default_cache() -> AppDetailsCache:
+    """Process-wide cache at DB_PATH, opened on first use."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = AppDetailsCache()
+        return _default
+
+
+def migrate_json_dir(cache: AppDetailsCache, json_dir: Path, batch: int = 1000) -> int:
+    """Import <appid>.json response files; fetched_at is taken from file mtime."""
+    total = 0
+    pending = []
+    for p in Path(json_dir).glob("*.json"):
+        if not p.stem.isdigit():
+            continue
+        try:
+            j = json.loads(p.read_text(encoding="utf-8"))
+        except Exception:
+            continue
+        node = j.get(p.stem) if isinstance(j, dict) else None
+        if not isinstance(node, dict):
+            continue
+        pending.append((int(p.stem), node, p.stat().st_mtime))
+        if len(pending) >= batch:
+            total += cache.put_many(pending)
+            pending = []
+    total += cache.put_many(pending)
+    return total
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--db", type=Path, default=DB_PATH)
+    ap.add_argument("--migrate", type=Path, nargs="?", const=LEGACY_JSON_DIR, default=None,
+                    help=f"Import the old per-app JSON cache (default dir: {LEGACY_JSON_DIR}).")
+    args = ap.parse_args()
+
+    cache = AppDetailsCache(args.db)
+    if args.migrate is not None:
+        t0 = time.time()
+        n = migrate_json_dir(cache, args.migrate)
+        print(f"[DONE] migrated {n} apps from {args.migrate} in {time.time() - t0:.1f}s")
+    print(f"[INFO] {args.db}: {len(cache)} apps cached, {len(cache.genre_index())} with known type/genres")
+
+
+if __name__ == "__main__":
+    main()
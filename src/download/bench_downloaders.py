@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Offline throughput benchmark of the real downloaders against fake_steam.py.
+
+Each downloader runs unmodified as a subprocess with STEAM_BASE_URL pointing
+at a local stand-in server, writing into a temp dir. Per run it reports:
+
+  img/s     images that ended up on disk / wall time
+  req/s     requests the server answered / wall time (all routes)
+  retries   429 + 5xx the server injected (each one cost the client a retry)
+  resumes   206 answers, i.e. interrupted bodies continued with Range
+  cpu       client CPU seconds (user + sys of the subprocess), also per image
+
+Scenarios vary the server (clean, throttled, slow links, flaky links that
+drop image bodies halfway). --save writes the
+rows as JSON; --baseline compares img/s against a saved run and exits 1 when
+any row got slower than --tolerance, so regressions show up offline.
+
+Run:
+  python src/download/bench_downloaders.py --apps 3000 --images 600 --workers 32
+  python src/download/bench_downloaders.py --save outputs/bench_dl.json
+  python src/download/bench_downloaders.py --baseline outputs/bench_dl.json --tolerance 0.15
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from dataclasses import replace
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from fake_steam import FakeConfig, start, synthetic_jpeg
+
+HERE = Path(__file__).resolve().parent
+IMG_EXTS = {".jpg", ".jpeg", ".png", ".webp"}
+
+SCENARIOS: Dict[str, Dict] = {
+    "clean": {},
+    "throttled": {"p429": 0.03, "p5xx": 0.01, "retry_after": 0.5},
+    "slow": {"latency_ms": 120.0, "jitter_ms": 40.0, "bandwidth": 2_000_000.0},
+    "flaky": {"p_cut": 0.2, "bandwidth": 4_000_000.0},
+}
+
+# (name, build argv + seed files in tmp) -> argv
+Setup = Callable[[Path, argparse.Namespace, List[int]], List[str]]
+
+
+def _dataset(tmp: Path, args: argparse.Namespace, appids: List[int]) -> List[str]:
+    per_genre = max(1, args.images // 2)
+    return [str(HERE / "download_steam_dataset.py"), "--out-dir", str(tmp / "raw"),
+            "--state", str(tmp / "state.jsonl"), "--cache-db", str(tmp / "meta.sqlite"),
+            "--caps", f"Action={per_genre}", f"Strategy={per_genre}", "--workers", str(args.workers)]
+
+
+def _gameplay(tmp: Path, args: argparse.Namespace, appids: List[int]) -> List[str]:
+    # covers to attach screenshots to (per_app=2 -> images/2 apps)
+    cover = synthetic_jpeg(20_000, 460, 215)
+    d = tmp / "raw" / "Action"
+    d.mkdir(parents=True)
+    for a in appids[: max(1, args.images // 2)]:
+        (d / f"{a}.jpg").write_bytes(cover)
+    return [str(HERE / "download_steam_gameplay.py"), "--covers-dir", str(tmp / "raw"), "--per-app", "2",
+            "--workers", str(args.workers), "--cache-db", str(tmp / "appdetails.sqlite"),
+            "--rate", str(args.meta_rate), "--max-rate", str(args.meta_rate * 2), "--max-total-images", "0"]
+
+
+def _triplets(tmp: Path, args: argparse.Namespace, appids: List[int]) -> List[str]:
+    return [str(HERE / "fetch_strategy_triplets_v2.py"), "--out-dir", str(tmp / "raw" / "Strategy"),
+            "--target-triplets", str(max(1, args.images // 3)), "--state", str(tmp / "state.jsonl"),
+            "--cache-db", str(tmp / "appdetails.sqlite"), "--pages", "1", "--page-size", str(args.apps),
+            "--workers", str(args.workers), "--rate", str(args.meta_rate), "--max-rate", str(args.meta_rate * 2)]
+
+
+DOWNLOADERS: Dict[str, Setup] = {
+    "dataset": _dataset,
+    "gameplay": _gameplay,
+    "triplets": _triplets,
+}
+
+
+def server_stats(base: str, reset: bool = False) -> Dict[str, int]:
+    with urllib.request.urlopen(f"{base}/{'__reset' if reset else '__stats'}", timeout=10) as r:
+        body = r.read()
+    return json.loads(body) if body else {}
+
+
+def count_images(root: Path) -> int:
+    return sum(1 for p in root.rglob("*") if p.suffix.lower() in IMG_EXTS and p.is_file())
+
+
+def run_one(name: str, setup: Setup, base: str, args: argparse.Namespace, appids: List[int]) -> Dict:
+    tmp = Path(tempfile.mkdtemp(prefix=f"bench_{name}_"))
+    try:
+        argv = setup(tmp, args, appids)
+        seeded = count_images(tmp)
+        env = dict(os.environ, STEAM_BASE_URL=base, STEAM_WEB_API_KEY="bench", PYTHONUNBUFFERED="1")
+        server_stats(base, reset=True)
+
+        ru0 = resource.getrusage(resource.RUSAGE_CHILDREN)
+        t0 = time.perf_counter()
+        proc = subprocess.run([sys.executable] + argv, env=env, cwd=tmp, capture_output=True, text=True,
+                              timeout=args.timeout)
+        wall = time.perf_counter() - t0
+        ru1 = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+        if proc.returncode != 0:
+            tail = "\n".join((proc.stderr or proc.stdout).splitlines()[-15:])
+            print(f"[WARN] {name} exited with {proc.returncode}:\n{tail}")
+
+        srv = server_stats(base)
+        images = count_images(tmp) - seeded
+        cpu = (ru1.ru_utime - ru0.ru_utime) + (ru1.ru_stime - ru0.ru_stime)
+        return {
+            "downloader": name, "images": images, "wall_s": round(wall, 2),
+            "img_per_s": round(images / max(wall, 1e-9), 1),
+            "req_per_s": round(srv.get("requests", 0) / max(wall, 1e-9), 1),
+            "retries": srv.get("injected_429", 0) + srv.get("injected_503", 0),
+            "resumes": srv.get("status_206", 0),
+            "mb_per_s": round(srv.get("bytes_out", 0) / 1e6 / max(wall, 1e-9), 1),
+            "cpu_s": round(cpu, 2), "cpu_ms_per_img": round(1000.0 * cpu / max(1, images), 2),
+            "rc": proc.returncode,
+        }
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def compare(rows: List[Dict], baseline: Path, tolerance: float) -> int:
+    old = {(r["scenario"], r["downloader"]): r for r in json.loads(baseline.read_text(encoding="utf-8"))}
+    worse = 0
+    for r in rows:
+        b = old.get((r["scenario"], r["downloader"]))
+        if not b or not b["img_per_s"]:
+            continue
+        change = r["img_per_s"] / b["img_per_s"] - 1.0
+        flag = "REGRESSION" if change < -tolerance else "ok"
+        worse += flag != "ok"
+        print(f"  {r['scenario']:<10} {r['downloader']:<9} {b['img_per_s']:8.1f} -> {r['img_per_s']:8.1f} img/s "
+              f"({change:+.0%}) {flag}")
+    return worse
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    ap.add_argument("--only", nargs="+", default=list(DOWNLOADERS), choices=list(DOWNLOADERS))
+    ap.add_argument("--apps", type=int, default=3000, help="Apps in the fake catalogue.")
+    ap.add_argument("--images", type=int, default=600, help="Roughly how many images each downloader should fetch.")
+    ap.add_argument("--workers", type=int, default=32)
+    ap.add_argument("--meta-rate", type=float, default=200.0,
+                    help="appdetails requests/sec for the limiter (the real default would dominate wall time).")
+    ap.add_argument("--latency-ms", type=float, default=None, help="Override the scenario latency.")
+    ap.add_argument("--port", type=int, default=8766)
+    ap.add_argument("--timeout", type=float, default=900.0, help="Per downloader run, seconds.")
+    ap.add_argument("--save", type=Path, default=None, help="Write the result rows as JSON.")
+    ap.add_argument("--baseline", type=Path, default=None, help="Compare against rows saved with --save.")
+    ap.add_argument("--tolerance", type=float, default=0.15, help="Allowed img/s drop vs the baseline.")
+    args = ap.parse_args()
+
+    rows: List[Dict] = []
+    for scenario in args.scenarios:
+        cfg = replace(FakeConfig(apps=args.apps), **SCENARIOS[scenario])
+        if args.latency_ms is not None:
+            cfg = replace(cfg, latency_ms=args.latency_ms)
+        appids = list(range(cfg.first_appid, cfg.first_appid + cfg.apps))
+        server, base = start(cfg, args.port)
+        try:
+            for name in args.only:
+                row = dict(run_one(name, DOWNLOADERS[name], base, args, appids), scenario=scenario)
+                rows.append(row)
+                print(f"[{scenario:<9}] {name:<9} {row['img_per_s']:8.1f} img/s {row['req_per_s']:8.1f} req/s "
+                      f"retries={row['retries']:<5} resumes={row['resumes']:<5} {row['mb_per_s']:6.1f} MB/s  cpu={row['cpu_s']:.2f}s "
+                      f"({row['cpu_ms_per_img']:.2f} ms/img)  images={row['images']}")
+        finally:
+            server.terminate()
+            server.join(5)
+
+    if args.save:
+        args.save.parent.mkdir(parents=True, exist_ok=True)
+        args.save.write_text(json.dumps(rows, indent=2), encoding="utf-8")
+        print(f"[INFO] saved -> {args.save}")
+    if args.baseline:
+        print(f"[INFO] vs baseline {args.baseline}:")
+        if compare(rows, args.baseline, args.tolerance):
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Benchmark: thread-pool + requests (old downloaders) vs the asyncio engine.
+
+Starts a local stand-in image server in a separate process, downloads the same
+set of synthetic images with both clients into temp dirs and reports
+images/sec and client CPU seconds (server CPU is not counted).
+
+Run:
+  python src/download/bench_engine.py --images 2000 --size 300000 --latency-ms 40 --workers 32
+"""
+
+from __future__ import annotations
+
+import argparse
+import multiprocessing as mp
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import List, Tuple
+
+import requests
+
+from aio_engine import DownloadTask, run_downloads
+from fake_steam import synthetic_jpeg
+
+
+def serve_images(port: int, size: int, latency_ms: float, ready) -> None:
+    # must pass the engine's in-stream image validation
+    body = synthetic_jpeg(size, 1920, 1080)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def do_GET(self):
+            if latency_ms:
+                time.sleep(latency_ms / 1000.0)
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+        request_queue_size = 1024
+
+    srv = Server(("127.0.0.1", port), Handler)
+    ready.set()
+    srv.serve_forever()
+
+
+_tls = threading.local()
+
+
+def _thread_download(url: str, dst: Path, min_bytes: int) -> bool:
+    # same shape as the old per-script atomic_download
+    s = getattr(_tls, "s", None)
+    if s is None:
+        s = requests.Session()
+        _tls.s = s
+    tmp = dst.with_suffix(dst.suffix + ".tmp")
+    try:
+        with s.get(url, stream=True, timeout=45) as r:
+            if r.status_code != 200:
+                return False
+            total = 0
+            with open(tmp, "wb") as f:
+                for chunk in r.iter_content(chunk_size=256 * 1024):
+                    f.write(chunk)
+                    total += len(chunk)
+        if total < min_bytes:
+            tmp.unlink(missing_ok=True)
+            return False
+        tmp.replace(dst)
+        return True
+    except Exception:
+        tmp.unlink(missing_ok=True)
+        return False
+
+
+def bench_threads(tasks: List[DownloadTask], workers: int) -> Tuple[int, int]:
+    ok = fail = 0
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        futs = [ex.submit(_thread_download, t.url, t.path, 1000) for t in tasks]
+        for fut in as_completed(futs):
+            if fut.result():
+                ok += 1
+            else:
+                fail += 1
+    return ok, fail
+
+
+def bench_engine(tasks: List[DownloadTask], workers: int) -> Tuple[int, int]:
+    return run_downloads(tasks, concurrency=workers, per_host=workers, min_bytes=1000, desc="engine")
+
+
+def measure(name: str, fn, tasks: List[DownloadTask], workers: int) -> dict:
+    cpu0 = time.process_time()
+    t0 = time.perf_counter()
+    ok, fail = fn(tasks, workers)
+    wall = time.perf_counter() - t0
+    cpu = time.process_time() - cpu0
+    return {"client": name, "ok": ok, "fail": fail, "wall_s": wall, "cpu_s": cpu,
+            "img_per_s": ok / max(wall, 1e-9), "cpu_ms_per_img": 1000.0 * cpu / max(1, ok)}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--images", type=int, default=2000)
+    ap.add_argument("--size", type=int, default=300_000, help="Bytes per synthetic image.")
+    ap.add_argument("--latency-ms", type=float, default=40.0, help="Server-side delay per request.")
+    ap.add_argument("--workers", type=int, nargs="+", default=[16, 32, 64])
+    ap.add_argument("--port", type=int, default=8765)
+    args = ap.parse_args()
+
+    ready = mp.Event()
+    server = mp.Process(target=serve_images, args=(args.port, args.size, args.latency_ms, ready), daemon=True)
+    server.start()
+    ready.wait(10)
+
+    try:
+        for workers in args.workers:
+            for name, fn in (("threads+requests", bench_threads), ("asyncio engine", bench_engine)):
+                tmp = Path(tempfile.mkdtemp(prefix="bench_dl_"))
+                tasks = [DownloadTask(url=f"http://127.0.0.1:{args.port}/img/{i}.jpg", path=tmp / f"{i}.jpg")
+                         for i in range(args.images)]
+                row = measure(name, fn, tasks, workers)
+                row["workers"] = workers
+                shutil.rmtree(tmp, ignore_errors=True)
+                print(f"[{name:<16}] workers={workers:<3} {row['img_per_s']:8.1f} img/s  "
+                      f"cpu={row['cpu_s']:.2f}s ({row['cpu_ms_per_img']:.2f} ms/img)  fail={row['fail']}")
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
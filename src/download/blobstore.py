@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Content-addressed image store: every distinct image is kept once, by hash.
+
+  data/blobs/objects/<2 hex>/<sha256><ext>   the bytes, one inode per content
+  data/blobs/index.sqlite                    path -> digest (+ size/mtime)
+
+Class trees (data/raw, data/balanced_raw, any later subset) are views: their
+files are hard links to blobs, so a game in three genre folders or the same
+screenshot under two appids costs the disk once, and building a subset means
+writing links instead of copying gigabytes.
+
+- ingest(root) adopts an existing tree in place: each file is hashed (only if
+  its size/mtime changed since the last run) and either becomes the blob or
+  is replaced by a link to the blob that already holds the same bytes
+- link_or_copy(blob, dst) materializes a view entry atomically; it falls
+  back to a copy across filesystems
+- manifests (CSV rel_path,digest) describe a view without any files and can
+  be materialized again later
+- gc() drops blobs no view links to anymore
+
+Downloaders always write <dst>.tmp and rename, so a linked file is replaced,
+never modified in place, and other views keep the old bytes.
+
+Run after downloading (and before subsample.py):
+  python src/download/blobstore.py --ingest data/raw
+  python src/download/blobstore.py --manifest data/balanced_raw --out outputs/balanced_raw.csv
+  python src/download/blobstore.py --materialize outputs/balanced_raw.csv --to data/balanced_raw --gc
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import hashlib
+import os
+import shutil
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+BASE_DIR = Path(__file__).resolve().parents[2]
+BLOB_ROOT = BASE_DIR / "data" / "blobs"
+
+# same set as dir_index.IMG_EXTS; kept local so src/ scripts can import this module
+IMG_EXTS = {".jpg", ".jpeg", ".png", ".webp"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path     TEXT PRIMARY KEY,
+    digest   TEXT NOT NULL,
+    size     INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+"""
+
+
+def link_or_copy(src: Path, dst: Path) -> None:
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_name(dst.name + ".tmp")
+    try:
+        tmp.unlink(missing_ok=True)
+        os.link(src, tmp)
+    except OSError:
+        shutil.copy2(src, tmp)
+    tmp.replace(dst)
+
+
+def hash_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def iter_images(root: Path) -> Iterator[os.DirEntry]:
+    stack = [str(root)]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for e in it:
+                if e.is_dir(follow_symlinks=False):
+                    stack.append(e.path)
+                elif e.is_file(follow_symlinks=False) and os.path.splitext(e.name)[1].lower() in IMG_EXTS:
+                    yield e
+
+
+class BlobStore:
+    def __init__(self, root: Path = BLOB_ROOT):
+        self.root = Path(root)
+        self.objects = self.root / "objects"
+        self.objects.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(self.root / "index.sqlite", timeout=30.0)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self.stats = {"files": 0, "hashed": 0, "new_blobs": 0, "deduped": 0, "saved_bytes": 0}
+
+    def close(self) -> None:
+        self.db.commit()
+        self.db.close()
+
+    def __enter__(self) -> "BlobStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def blob_path(self, digest: str, ext: str) -> Path:
+        return self.objects / digest[:2] / f"{digest}{ext.lower()}"
+
+    def _remember(self, path: str, digest: str, st: os.stat_result) -> None:
+        self.db.execute(
+            "INSERT OR REPLACE INTO files (path, digest, size, mtime_ns) VALUES (?, ?, ?, ?)",
+            (path, digest, st.st_size, st.st_mtime_ns),
+        )
+
+    def digest_of(self, path: Path, st: Optional[os.stat_result] = None) -> str:
+        """sha256 of path; reused from the index while size and mtime match."""
+        key = str(Path(path).resolve())
+        st = st or os.stat(key)
+        row = self.db.execute("SELECT digest, size, mtime_ns FROM files WHERE path = ?", (key,)).fetchone()
+        if row and row[1] == st.st_size and row[2] == st.st_mtime_ns:
+            return row[0]
+        digest = hash_file(Path(key))
+        self.stats["hashed"] += 1
+        self._remember(key, digest, st)
+        return digest
+
+    def adopt(self, path: Path) -> Path:
+        """Make path a link to its blob (creating the blob from it if new); returns the blob."""
+        path = Path(path)
+        st = path.stat()
+        digest = self.digest_of(path, st)
+        blob = self.blob_path(digest, path.suffix)
+        self.stats["files"] += 1
+        try:
+            bst = blob.stat()
+        except FileNotFoundError:
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                os.link(path, blob)
+            except FileExistsError:
+                pass  # another process adopted the same bytes meanwhile
+            except OSError:
+                shutil.copy2(path, blob)  # blob root on another filesystem
+            self.stats["new_blobs"] += 1
+            return blob
+        if not os.path.samestat(st, bst):
+            link_or_copy(blob, path)
+            self.stats["deduped"] += 1
+            self.stats["saved_bytes"] += st.st_size
+            self._remember(str(path.resolve()), digest, path.stat())
+        return blob
+
+    def ingest(self, root: Path, commit_every: int = 2000) -> Dict[str, int]:
+        # staged/partial files (.tmp, .tmp_*) are not image extensions, never adopted
+        for i, e in enumerate(iter_images(Path(root)), start=1):
+            self.adopt(Path(e.path))
+            if i % commit_every == 0:
+                self.db.commit()
+        self.db.commit()
+        return self.stats
+
+    def manifest(self, root: Path) -> Iterator[Tuple[str, str]]:
+        """(path relative to root, digest) for every image of a view."""
+        root = Path(root)
+        for e in iter_images(root):
+            yield Path(e.path).relative_to(root).as_posix(), self.digest_of(Path(e.path), e.stat())
+
+    def materialize(self, entries: Iterable[Tuple[str, str]], out_root: Path) -> int:
+        """Write a view: one link per (rel_path, digest) entry."""
+        n = 0
+        for rel, digest in entries:
+            blob = self.blob_path(digest, os.path.splitext(rel)[1])
+            if not blob.exists():
+                raise FileNotFoundError(f"blob {digest} for {rel} is not in {self.objects}")
+            link_or_copy(blob, Path(out_root) / rel)
+            n += 1
+        return n
+
+    def gc(self) -> Tuple[int, int]:
+        """Remove blobs no view uses and index rows of vanished files.
+
+        A blob goes only if nothing links to it (link count 1) and no indexed
+        file still has its digest, so copies made across filesystems keep
+        their blob alive.
+        """
+        gone, live = [], set()
+        for p, digest in self.db.execute("SELECT path, digest FROM files").fetchall():
+            if os.path.exists(p):
+                live.add(digest)
+            else:
+                gone.append(p)
+        self.db.executemany("DELETE FROM files WHERE path = ?", ((p,) for p in gone))
+        self.db.commit()
+
+        removed = freed = 0
+        for e in iter_images(self.objects):
+            st = e.stat()
+            if st.st_nlink <= 1 and os.path.splitext(e.name)[0] not in live:
+                os.unlink(e.path)
+                removed += 1
+                freed += st.st_size
+        return removed, freed
+
+    def usage(self) -> Tuple[int, int]:
+        """(blob count, bytes on disk for blobs)."""
+        n = size = 0
+        for e in iter_images(self.objects):
+            n += 1
+            size += e.stat().st_size
+        return n, size
+
+
+def read_manifest(path: Path) -> Iterator[Tuple[str, str]]:
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            yield row["path"], row["digest"]
+
+
+def write_manifest(entries: Iterable[Tuple[str, str]], path: Path) -> int:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    n = 0
+    with open(path, "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["path", "digest"])
+        for rel, digest in entries:
+            w.writerow([rel, digest])
+            n += 1
+    return n
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--root", type=Path, default=BLOB_ROOT, help=f"Blob store (default: {BLOB_ROOT}).")
+    ap.add_argument("--ingest", type=Path, nargs="*", default=[], help="Trees to adopt in place (e.g. data/raw).")
+    ap.add_argument("--manifest", type=Path, default=None, help="Write the manifest of this view to --out.")
+    ap.add_argument("--out", type=Path, default=None)
+    ap.add_argument("--materialize", type=Path, default=None, help="Manifest CSV to link into --to.")
+    ap.add_argument("--to", type=Path, default=None)
+    ap.add_argument("--gc", action="store_true", help="Delete blobs no view links to.")
+    args = ap.parse_args()
+
+    with BlobStore(args.root) as store:
+        for tree in args.ingest:
+            t0 = time.perf_counter()
+            s = store.ingest(tree)
+            print(f"[INGEST] {tree}: files={s['files']} hashed={s['hashed']} new_blobs={s['new_blobs']} "
+                  f"deduped={s['deduped']} saved={s['saved_bytes'] / 1e6:.1f}MB in {time.perf_counter() - t0:.1f}s")
+        if args.manifest is not None:
+            if args.out is None:
+                raise SystemExit("[ERROR] --manifest needs --out")
+            n = write_manifest(store.manifest(args.manifest), args.out)
+            print(f"[MANIFEST] {n} entries -> {args.out}")
+        if args.materialize is not None:
+            if args.to is None:
+                raise SystemExit("[ERROR] --materialize needs --to")
+            t0 = time.perf_counter()
+            n = store.materialize(read_manifest(args.materialize), args.to)
+            print(f"[VIEW] {n} links -> {args.to} in {time.perf_counter() - t0:.1f}s")
+        if args.gc:
+            removed, freed = store.gc()
+            print(f"[GC] removed {removed} blobs, freed {freed / 1e6:.1f}MB")
+        n, size = store.usage()
+        print(f"[INFO] blobs={n} size={size / 1e6:.1f}MB in {store.objects}")
+
+
+if __name__ == "__main__":
+    main()
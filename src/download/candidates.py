@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Cached SteamSpy genre -> appid lists (candidate store).
+
+Lives in the appdetails SQLite file (tables genre_lists, genre_apps), like
+url_meta, so every downloader shares one copy:
+
+- get(genre, fetch) answers from the cache; a list older than max_age is
+  still returned at once and queued for one background thread that
+  refreshes stale genres one at a time for the next run; only a genre never
+  fetched (or refresh=True) waits for the network
+- refreshes are incremental: each appid keeps first_seen/last_seen, the
+  current list is what the last refresh returned, and a refresh reports how
+  many apps were added and dropped; an empty answer never wipes a cached
+  list, only an explicit refresh can
+- pending(genre, done, failed, ...) is the cached list minus any number of
+  appid sets, so picking candidates is a set difference, not a request
+
+  python src/download/candidates.py                       # list cached genres
+  python src/download/candidates.py --refresh Action RPG  # refetch now
+"""
+
+from __future__ import annotations
+
+import argparse
+import atexit
+import queue
+import random
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Set, Tuple
+
+import requests
+
+from appdetails_store import DB_PATH
+from endpoints import STEAMSPY_URL
+from telemetry import default_telemetry, record_response
+
+MAX_AGE_DAYS = 7.0
+# background refreshes run one at a time, this far apart (SteamSpy allows
+# about one genre request per minute)
+REFRESH_INTERVAL = 60.0
+# how long a finished run waits at exit for a refresh already under way
+EXIT_WAIT = 30.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS genre_lists (
+    genre      TEXT PRIMARY KEY,
+    fetched_at REAL    NOT NULL,
+    count      INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS genre_apps (
+    genre      TEXT    NOT NULL,
+    appid      INTEGER NOT NULL,
+    first_seen REAL    NOT NULL,
+    last_seen  REAL    NOT NULL,
+    PRIMARY KEY (genre, appid)
+) WITHOUT ROWID;
+"""
+
+# genre -> appids, None when the list could not be fetched (keeps the old list)
+Fetcher = Callable[[str], Optional[Iterable[int]]]
+
+
+def steamspy_genre(genre: str, session: Optional[requests.Session] = None, tries: int = 8) -> Optional[List[int]]:
+    """Appids SteamSpy lists for genre, or None after tries failed attempts."""
+    session = session or requests.Session()
+    tel = default_telemetry()
+    for t in range(tries):
+        try:
+            r = session.get(STEAMSPY_URL, params={"request": "genre", "genre": genre}, timeout=60)
+            record_response(r)
+            data = r.json() if r.status_code == 200 and r.text.strip() else None
+            # an empty or non-object 200 is an outage page, not an empty genre
+            if isinstance(data, dict) and data:
+                return [int(k) for k in data if str(k).isdigit()]
+            tel.retry(STEAMSPY_URL, r.status_code if r.status_code != 200 else "empty")
+        except (requests.RequestException, ValueError):
+            tel.retry(STEAMSPY_URL, "error")
+        # SteamSpy allows about one genre request per minute
+        time.sleep(min(60.0, 2.0 * (2 ** t)) + random.random())
+    return None
+
+
+class CandidateStore:
+    def __init__(self, path: Path = DB_PATH, max_age_days: float = MAX_AGE_DAYS):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_age = max_age_days * 86400.0
+        self._tls = threading.local()
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._queue: "queue.Queue[Tuple[str, Fetcher]]" = queue.Queue()
+        self._queued: Set[str] = set()
+        self._worker: Optional[threading.Thread] = None
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._tls, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._tls.conn = conn
+        return conn
+
+    def fetched_at(self, genre: str) -> Optional[float]:
+        row = self._conn().execute("SELECT fetched_at FROM genre_lists WHERE genre = ?", (genre,)).fetchone()
+        return row[0] if row else None
+
+    def appids(self, genre: str) -> Optional[List[int]]:
+        """The list as of the last refresh, or None if genre was never fetched."""
+        fetched_at = self.fetched_at(genre)
+        if fetched_at is None:
+            return None
+        rows = self._conn().execute(
+            "SELECT appid FROM genre_apps WHERE genre = ? AND last_seen >= ?", (genre, fetched_at)
+        )
+        return [r[0] for r in rows.fetchall()]
+
+    def put(self, genre: str, appids: Iterable[int], force: bool = False) -> Optional[Tuple[int, int]]:
+        """Store a freshly fetched list; returns (added, dropped) against the previous one.
+
+        An empty list never replaces a non-empty one unless force is set
+        (an explicit refresh); None when the put was refused.
+        """
+        now = time.time()
+        ids = {int(a) for a in appids}
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT fetched_at FROM genre_lists WHERE genre = ?", (genre,)).fetchone()
+            before = {r[0] for r in conn.execute(
+                "SELECT appid FROM genre_apps WHERE genre = ? AND last_seen >= ?", (genre, row[0])
+            )} if row else set()
+            if not ids and before and not force:
+                conn.execute("ROLLBACK")
+                return None
+            conn.executemany(
+                "INSERT INTO genre_apps (genre, appid, first_seen, last_seen) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(genre, appid) DO UPDATE SET last_seen = excluded.last_seen",
+                ((genre, a, now, now) for a in ids),
+            )
+            conn.execute("INSERT OR REPLACE INTO genre_lists (genre, fetched_at, count) VALUES (?, ?, ?)",
+                         (genre, now, len(ids)))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(ids - before), len(before - ids)
+
+    def refresh(self, genre: str, fetch: Fetcher, force: bool = False) -> Optional[Tuple[int, int]]:
+        """Fetch genre now; (added, dropped), or None if the fetch failed or came back empty."""
+        ids = fetch(genre)
+        if ids is None:
+            print(f"[WARN] candidates: {genre} list could not be fetched, keeping the cached one")
+            return None
+        res = self.put(genre, ids, force)
+        if res is None:
+            print(f"[WARN] candidates: {genre} list came back empty, keeping the cached one")
+            return None
+        added, dropped = res
+        print(f"[INFO] candidates: {genre} refreshed, +{added} -{dropped}")
+        return added, dropped
+
+    def _refresh_later(self, genre: str, fetch: Fetcher) -> None:
+        with self._lock:
+            if genre in self._queued:
+                return
+            self._queued.add(genre)
+            if self._worker is None:
+                # a daemon, so a slow SteamSpy never keeps a finished run alive;
+                # _at_exit gives a refresh under way a bounded grace period
+                self._worker = threading.Thread(target=self._refresh_loop, name="candidates-refresh", daemon=True)
+                self._worker.start()
+                atexit.register(self._at_exit)
+        self._queue.put((genre, fetch))
+
+    def _refresh_loop(self) -> None:
+        last = 0.0
+        while True:
+            genre, fetch = self._queue.get()
+            time.sleep(max(0.0, last + REFRESH_INTERVAL - time.time()))
+            try:
+                self.refresh(genre, fetch)
+            except Exception as e:
+                print(f"[WARN] candidates: {genre} refresh failed: {type(e).__name__}: {e}")
+            finally:
+                last = time.time()
+                with self._idle:
+                    self._queued.discard(genre)
+                    self._idle.notify_all()
+
+    def _at_exit(self) -> None:
+        left = self.wait(EXIT_WAIT)
+        if left:
+            print(f"[WARN] candidates: refresh abandoned at exit for {', '.join(sorted(left))}; "
+                  "the cached lists stay and are refreshed on the next run")
+
+    def get(self, genre: str, fetch: Fetcher, refresh: bool = False) -> List[int]:
+        """Cached list for genre; stale lists are refreshed in the background."""
+        fetched_at = self.fetched_at(genre)
+        if fetched_at is None or refresh:
+            self.refresh(genre, fetch, force=refresh)
+            return self.appids(genre) or []
+        if time.time() - fetched_at > self.max_age:
+            self._refresh_later(genre, fetch)
+        return self.appids(genre) or []
+
+    def pending(self, genre: str, fetch: Fetcher, *exclude: Set[int], refresh: bool = False) -> List[int]:
+        """get(genre) minus every appid in the exclude sets (done, failed, ...)."""
+        skip = set().union(*exclude)
+        return [a for a in self.get(genre, fetch, refresh) if a not in skip]
+
+    def wait(self, timeout: Optional[float] = None) -> List[str]:
+        """Wait for queued background refreshes; returns the genres still pending."""
+        with self._idle:
+            self._idle.wait_for(lambda: not self._queued, timeout)
+            return list(self._queued)
+
+    def status(self) -> List[Tuple[str, float, int]]:
+        """(genre, fetched_at, count) of every cached list."""
+        rows = self._conn().execute("SELECT genre, fetched_at, count FROM genre_lists ORDER BY genre")
+        return rows.fetchall()
+
+
+_default: Optional[CandidateStore] = None
+_default_lock = threading.Lock()
+
+
+def default_candidates() -> CandidateStore:
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = CandidateStore()
+        return _default
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--db", type=Path, default=DB_PATH)
+    ap.add_argument("--refresh", nargs="+", default=[], metavar="GENRE", help="Refetch these genre lists now.")
+    args = ap.parse_args()
+
+    store = CandidateStore(args.db)
+    session = requests.Session()
+    for genre in args.refresh:
+        store.refresh(genre, lambda g: steamspy_genre(g, session), force=True)
+    now = time.time()
+    for genre, fetched_at, count in store.status():
+        print(f"[INFO] {genre}: {count} appids, fetched {(now - fetched_at) / 86400.0:.1f} days ago")
+
+
+if __name__ == "__main__":
+    main()
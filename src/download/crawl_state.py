@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Crash-safe crawl state: append-only JSONL journal + periodic compaction.
+
+Replaces "rewrite the whole sorted JSON after every result".
+
+- record(appid, outcome, reason) / set(key, value) append one line; the last
+  line for an appid or key wins
+- loading is a single pass over the journal (O(N)); a torn last line from a
+  killed process is dropped, a corrupt line elsewhere is skipped and logged
+- once the journal holds far more lines than live entries it is rewritten as
+  a snapshot (tmp + fsync + rename), so size stays proportional to the state
+- an old <name>.json state file is imported on first open
+
+Outcomes used by the crawlers: "done", "failed", "skipped" (looked at, not a
+failure, e.g. wrong genre - retried on the next run) and "seen" (queued).
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+SEEN = "seen"
+
+
+class CrawlState:
+    def __init__(self, path: Path, legacy_json: Optional[Path] = None,
+                 compact_min: int = 10_000, fsync_every: int = 200):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.compact_min = compact_min
+        self.fsync_every = max(1, fsync_every)
+        self.outcomes: Dict[int, Tuple[str, str]] = {}
+        self.kv: Dict[str, Any] = {}
+        self._lines = 0
+        self._unsynced = 0
+        self._lock = threading.Lock()
+
+        if self.path.exists():
+            self._load()
+        elif legacy_json is not None and Path(legacy_json).exists():
+            self._import_legacy(Path(legacy_json))
+            self._write_snapshot()
+
+        self._f = open(self.path, "a", encoding="utf-8")
+        if self._needs_compaction():
+            self.compact()
+
+    # ---- loading ----
+
+    def _apply(self, rec: Dict) -> None:
+        if "a" in rec:
+            self.outcomes[int(rec["a"])] = (rec.get("o", DONE), rec.get("r", ""))
+        elif "k" in rec:
+            self.kv[rec["k"]] = rec.get("v")
+
+    def _load(self) -> None:
+        good_end = 0
+        bad = []
+        with open(self.path, "rb") as f:
+            for n, raw in enumerate(f, 1):
+                if not raw.endswith(b"\n"):
+                    break  # torn write from a killed process, always the last line
+                good_end += len(raw)
+                self._lines += 1
+                try:
+                    self._apply(json.loads(raw))
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    # a corrupt line mid-journal loses only itself; compaction drops it
+                    bad.append(n)
+        if bad:
+            print(f"[WARN] {self.path.name}: skipped {len(bad)} corrupt lines (line {', '.join(map(str, bad[:10]))}"
+                  f"{', ...' if len(bad) > 10 else ''})")
+        if good_end != self.path.stat().st_size:
+            with open(self.path, "r+b") as f:
+                f.truncate(good_end)
+
+    def _import_legacy(self, p: Path) -> None:
+        try:
+            old = json.loads(p.read_text(encoding="utf-8"))
+        except Exception:
+            return
+        if not isinstance(old, dict):
+            return
+        for key, outcome in (("seen", SEEN), ("failed", FAILED), ("done", DONE), ("done_appids", DONE)):
+            for a in old.get(key) or []:
+                self.outcomes[int(a)] = (outcome, "legacy")
+        for k, v in old.items():
+            if k not in ("seen", "failed", "done", "done_appids"):
+                self.kv[k] = v
+
+    # ---- writing ----
+
+    def _append(self, rec: Dict) -> None:
+        self._f.write(json.dumps(rec, separators=(",", ":")) + "\n")
+        self._f.flush()
+        self._lines += 1
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every:
+            os.fsync(self._f.fileno())
+            self._unsynced = 0
+        if self._needs_compaction():
+            self._compact_locked()
+
+    def record(self, appid: int, outcome: str, reason: str = "") -> None:
+        with self._lock:
+            self.outcomes[int(appid)] = (outcome, reason)
+            self._append({"a": int(appid), "o": outcome, "r": reason})
+
+    def record_many(self, appids: Iterable[int], outcome: str, reason: str = "") -> None:
+        with self._lock:
+            for a in appids:
+                self.outcomes[int(a)] = (outcome, reason)
+                self._f.write(json.dumps({"a": int(a), "o": outcome, "r": reason}, separators=(",", ":")) + "\n")
+                self._lines += 1
+            self._f.flush()
+            os.fsync(self._f.fileno())
+            self._unsynced = 0
+            if self._needs_compaction():
+                self._compact_locked()
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self.kv[key] = value
+            self._append({"k": key, "v": value})
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.kv.get(key, default)
+
+    def _needs_compaction(self) -> bool:
+        live = len(self.outcomes) + len(self.kv)
+        return self._lines > max(self.compact_min, 2 * live)
+
+    def _write_snapshot(self) -> None:
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            for k, v in self.kv.items():
+                f.write(json.dumps({"k": k, "v": v}, separators=(",", ":")) + "\n")
+            for a, (o, r) in self.outcomes.items():
+                f.write(json.dumps({"a": a, "o": o, "r": r}, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        tmp.replace(self.path)
+        self._lines = len(self.kv) + len(self.outcomes)
+
+    def _compact_locked(self) -> None:
+        self._f.close()
+        self._write_snapshot()
+        self._f = open(self.path, "a", encoding="utf-8")
+        self._unsynced = 0
+
+    def compact(self) -> None:
+        with self._lock:
+            self._compact_locked()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._f.closed:
+                return
+            self._f.flush()
+            os.fsync(self._f.fileno())
+            self._f.close()
+
+    def __enter__(self) -> "CrawlState":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # ---- queries ----
+
+    def with_outcome(self, *outcomes: str) -> Set[int]:
+        return {a for a, (o, _) in self.outcomes.items() if o in outcomes}
+
+    def done(self) -> Set[int]:
+        return self.with_outcome(DONE)
+
+    def failed(self) -> Set[int]:
+        return self.with_outcome(FAILED)
+
+    def seen(self) -> Set[int]:
+        return set(self.outcomes)
+
+    def outcome(self, appid: int) -> Optional[Tuple[str, str]]:
+        return self.outcomes.get(int(appid))
+
+
+def open_state(path: Path) -> CrawlState:
+    """Journal for path; a legacy .json path maps to <stem>.jsonl and is imported once."""
+    p = Path(path)
+    journal = p.with_suffix(".jsonl") if p.suffix == ".json" else p
+    return CrawlState(journal, legacy_json=journal.with_suffix(".json"))
@@ -1,30 +1,16 @@
-import re
 from pathlib import Path
 
+from dir_index import DirIndex
+
 BASE_DIR = Path("data/raw")
 DO_DELETE = False
 
-exts = {".jpg", ".jpeg", ".png", ".webp"}
-
-cover_files = []
-gp1_bases = set()
-gp2_bases = set()
-
-gp_re = re.compile(r"^(?P<base>.+?)_gp(?P<n>[12])(?:_\d+)?$", re.IGNORECASE)
-
-all_files = [p for p in BASE_DIR.rglob("*") if p.is_file() and p.suffix.lower() in exts]
+index = DirIndex(BASE_DIR)
+apps = list(index.apps())
 
-for p in all_files:
-    stem = p.stem
-    m = gp_re.match(stem)
-    if m:
-        base = m.group("base")
-        if m.group("n") == "1":
-            gp1_bases.add(base)
-        else:
-            gp2_bases.add(base)
-    else:
-        cover_files.append(p)
+cover_files = [a.cover_path for a in apps if a.cover is not None]
+gp1_bases = {a.base for a in apps if 1 in a.gps}
+gp2_bases = {a.base for a in apps if 2 in a.gps}
 
 to_delete = []
 for cover in cover_files:
@@ -33,7 +19,7 @@ for cover in cover_files:
         to_delete.append(cover)
 
 print(f"BASE_DIR: {BASE_DIR.resolve()}")
-print(f"Ukupno slika: {len(all_files)}")
+print(f"Ukupno slika: {index.count_images()}")
 print(f"Covers: {len(cover_files)} | gp1 baze: {len(gp1_bases)} | gp2 baze: {len(gp2_bases)}")
 print(f"Za brisanje covera: {len(to_delete)}")
 
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Derived training-resolution copies of downloaded images.
+
+Training squashes every image to IMG x IMG (224), yet the raw tree holds
+multi-megapixel screenshots and 600x900@2x covers that each epoch decodes in
+full. This writes a parallel tree (e.g. data/raw_256) with the same layout:
+
+- each axis capped at --max-side independently; training resizes to a square
+  anyway, so no axis ends up below what Resize((IMG, IMG)) needs
+- JPEG decode uses PIL's draft mode (DCT scaling), so the big originals are
+  never fully decoded
+- quality-controlled JPEG or WebP, written atomically; up-to-date outputs
+  (newer than their source) are skipped
+- raw originals are never modified, re-derive any time with other settings
+
+Downloaders hand finished files to a Deriver (background process pool) via
+the engine's on_saved hook; existing trees are backfilled with:
+  python src/download/derive.py --src data/raw --out data/raw_256 --max-side 256 --format webp
+
+Point training at the derived tree with --data-dir.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Optional
+
+from PIL import Image
+
+from dir_index import DirIndex
+
+FORMATS = {"jpeg": ".jpg", "webp": ".webp"}
+
+
+def derived_path(src: Path, src_root: Path, out_root: Path, fmt: str = "jpeg") -> Path:
+    rel = Path(src).relative_to(src_root)
+    return (Path(out_root) / rel).with_suffix(FORMATS[fmt])
+
+
+def derive_one(src: Path, dst: Path, max_side: int = 256, fmt: str = "jpeg", quality: int = 90) -> bool:
+    """Write the derived copy of src; False if it was already up to date."""
+    src, dst = Path(src), Path(dst)
+    try:
+        if dst.stat().st_mtime >= src.stat().st_mtime:
+            return False
+    except FileNotFoundError:
+        pass
+
+    with Image.open(src) as im:
+        im.draft("RGB", (max_side, max_side))
+        im = im.convert("RGB")
+        w, h = im.size
+        size = (min(w, max_side), min(h, max_side))
+        if size != (w, h):
+            im = im.resize(size, Image.LANCZOS)
+
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dst.with_name(dst.name + ".tmp")
+        if fmt == "webp":
+            im.save(tmp, format="WEBP", quality=quality, method=4)
+        else:
+            im.save(tmp, format="JPEG", quality=quality, optimize=True)
+    tmp.replace(dst)
+    return True
+
+
+class Deriver:
+    """Background process pool: submit() returns immediately, close() waits."""
+
+    def __init__(self, src_root: Path, out_root: Path, max_side: int = 256, fmt: str = "jpeg",
+                 quality: int = 90, workers: Optional[int] = None):
+        self.src_root = Path(src_root).resolve()
+        self.out_root = Path(out_root)
+        self.max_side = max_side
+        self.fmt = fmt
+        self.quality = quality
+        self.pool = ProcessPoolExecutor(max_workers=workers or max(1, (os.cpu_count() or 2) // 2))
+        self.futures: List[Future] = []
+        self.written = 0
+        self.errors = 0
+
+    def submit(self, src: Path) -> None:
+        src = Path(src).resolve()
+        try:
+            dst = derived_path(src, self.src_root, self.out_root, self.fmt)
+        except ValueError:
+            return  # not under src_root
+        self.futures.append(self.pool.submit(derive_one, src, dst, self.max_side, self.fmt, self.quality))
+        if len(self.futures) >= 1024:
+            # keep the backlog bounded: drain fully if the pool fell far behind
+            self._reap(block=len(self.futures) >= 4096)
+
+    def _reap(self, block: bool) -> None:
+        keep = []
+        for f in self.futures:
+            if not block and not f.done():
+                keep.append(f)
+                continue
+            try:
+                self.written += bool(f.result())
+            except Exception:
+                self.errors += 1
+        self.futures = keep
+
+    def close(self) -> None:
+        self._reap(block=True)
+        self.pool.shutdown(wait=True)
+
+
+def add_derive_args(ap: argparse.ArgumentParser) -> None:
+    ap.add_argument("--derive-to", type=Path, default=None,
+                    help="Also write training-resolution copies into this parallel tree (e.g. data/raw_256).")
+    ap.add_argument("--derive-max-side", type=int, default=256)
+    ap.add_argument("--derive-format", choices=sorted(FORMATS), default="jpeg")
+    ap.add_argument("--derive-quality", type=int, default=90)
+
+
+def deriver_from_args(args, src_root: Path) -> Optional[Deriver]:
+    if args.derive_to is None:
+        return None
+    return Deriver(src_root, args.derive_to, args.derive_max_side, args.derive_format, args.derive_quality)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--src", type=Path, default=Path("data/raw"))
+    ap.add_argument("--out", type=Path, default=Path("data/raw_256"))
+    ap.add_argument("--max-side", type=int, default=256)
+    ap.add_argument("--format", choices=sorted(FORMATS), default="jpeg")
+    ap.add_argument("--quality", type=int, default=90)
+    ap.add_argument("--workers", type=int, default=None)
+    args = ap.parse_args()
+
+    index = DirIndex(args.src)
+    srcs = [p for a in index.apps() for p in [a.cover_path] + [a.gp_path(n) for n in sorted(a.gps)] if p]
+    print(f"[INFO] {len(srcs)} images under {args.src}")
+
+    t0 = time.perf_counter()
+    d = Deriver(args.src, args.out, args.max_side, args.format, args.quality, args.workers)
+    try:
+        for p in srcs:
+            d.submit(p)
+    finally:
+        d.close()
+    print(f"[DONE] written={d.written} up_to_date={len(srcs) - d.written - d.errors} errors={d.errors} "
+          f"in {time.perf_counter() - t0:.1f}s -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
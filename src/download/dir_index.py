@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+In-memory index of an image tree (data/raw/<GENRE>/<APPID>[_gpN].<ext>).
+
+- Built with one os.scandir pass per directory; files are grouped by base
+  name (appid) into cover + gameplay screenshots, with sizes
+- Replaces per-app glob(f"{appid}_gp*.*") and repeated rglob walks, so target
+  computation is O(files) instead of O(apps x files per dir)
+- refresh() only rescans directories whose mtime changed (new/renamed/deleted
+  files); note() records a finished download without touching the disk
+"""
+
+from __future__ import annotations
+
+import os
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+IMG_EXTS = {".jpg", ".jpeg", ".png", ".webp"}
+
+# <base>_gp<N>, optionally with a _<k> duplicate suffix
+GP_RE = re.compile(r"^(?P<base>.+?)_gp(?P<n>\d+)(?:_\d+)?$", re.IGNORECASE)
+
+
+@dataclass
+class AppFiles:
+    base: str
+    dir: Path
+    # (file name, size); full paths are built on demand, Path() per file is
+    # the dominant cost of indexing a large tree
+    cover: Optional[Tuple[str, int]] = None
+    gps: Dict[int, Tuple[str, int]] = field(default_factory=dict)
+
+    @property
+    def appid(self) -> Optional[int]:
+        return int(self.base) if self.base.isdigit() else None
+
+    @property
+    def cover_path(self) -> Optional[Path]:
+        return self.dir / self.cover[0] if self.cover is not None else None
+
+    def gp_path(self, n: int) -> Optional[Path]:
+        return self.dir / self.gps[n][0] if n in self.gps else None
+
+
+@dataclass
+class _Dir:
+    mtime_ns: int
+    files: Dict[str, int]          # file name -> size
+    subdirs: Tuple[str, ...]
+    apps: Dict[str, AppFiles]
+
+
+def _group(d: Path, files: Dict[str, int]) -> Dict[str, AppFiles]:
+    apps: Dict[str, AppFiles] = {}
+    for name, size in files.items():
+        stem, ext = os.path.splitext(name)
+        if ext.lower() not in IMG_EXTS:
+            continue
+        m = None if stem.isdigit() else GP_RE.match(stem)
+        base = m.group("base") if m else stem
+        a = apps.get(base)
+        if a is None:
+            a = apps[base] = AppFiles(base=base, dir=d)
+        if m:
+            n = int(m.group("n"))
+            # keep the canonical <base>_gpN over duplicates
+            if n not in a.gps or stem.lower() == f"{base}_gp{n}".lower():
+                a.gps[n] = (name, size)
+        else:
+            a.cover = (name, size)
+    return apps
+
+
+class DirIndex:
+    def __init__(self, root: Path, recursive: bool = True):
+        self.root = Path(root)
+        self.recursive = recursive
+        self._dirs: Dict[Path, _Dir] = {}
+        if self.root.is_dir():
+            self._scan_tree(self.root)
+
+    def _scan_dir(self, d: Path) -> Optional[_Dir]:
+        try:
+            mtime_ns = os.stat(d).st_mtime_ns
+            files: Dict[str, int] = {}
+            subdirs = []
+            with os.scandir(d) as it:
+                for e in it:
+                    try:
+                        if e.is_dir(follow_symlinks=False):
+                            subdirs.append(e.name)
+                        elif e.is_file():
+                            files[e.name] = e.stat().st_size
+                    except OSError:
+                        continue
+        except OSError:
+            return None
+        entry = _Dir(mtime_ns=mtime_ns, files=files, subdirs=tuple(subdirs), apps=_group(d, files))
+        self._dirs[d] = entry
+        return entry
+
+    def _scan_tree(self, d: Path) -> int:
+        stack = [d]
+        n = 0
+        while stack:
+            cur = stack.pop()
+            entry = self._scan_dir(cur)
+            if entry is None:
+                continue
+            n += 1
+            if self.recursive:
+                stack.extend(cur / s for s in entry.subdirs)
+        return n
+
+    def refresh(self) -> int:
+        """Rescan directories changed since the last scan; returns how many."""
+        rescanned = 0
+        if not self._dirs and self.root.is_dir():
+            return self._scan_tree(self.root)
+        for d, entry in list(self._dirs.items()):
+            try:
+                mtime_ns = os.stat(d).st_mtime_ns
+            except OSError:
+                del self._dirs[d]
+                continue
+            if mtime_ns == entry.mtime_ns:
+                continue
+            old_subdirs = set(entry.subdirs)
+            new = self._scan_dir(d)
+            rescanned += 1
+            if new is not None and self.recursive:
+                for s in set(new.subdirs) - old_subdirs:
+                    rescanned += self._scan_tree(d / s)
+        return rescanned
+
+    def note(self, path: Path, size: Optional[int] = None) -> None:
+        """Record a file written by this process (e.g. a finished download)."""
+        path = Path(path)
+        d = path.parent
+        entry = self._dirs.get(d)
+        if entry is None:
+            self._scan_dir(d)
+            return
+        if size is None:
+            try:
+                size = path.stat().st_size
+            except OSError:
+                return
+        entry.files[path.name] = size
+        for base, a in _group(d, {path.name: size}).items():
+            cur = entry.apps.setdefault(base, AppFiles(base=base, dir=d))
+            if a.cover is not None:
+                cur.cover = a.cover
+            cur.gps.update(a.gps)
+
+    # ---- queries ----
+
+    def dirs(self) -> Iterator[Path]:
+        return iter(self._dirs)
+
+    def _entries(self, d: Optional[Path]):
+        if d is None:
+            return self._dirs.values()
+        entry = self._dirs.get(Path(d))
+        return [entry] if entry is not None else []
+
+    def apps(self, d: Optional[Path] = None) -> Iterator[AppFiles]:
+        for entry in self._entries(d):
+            yield from entry.apps.values()
+
+    def app(self, d: Path, base) -> Optional[AppFiles]:
+        entry = self._dirs.get(Path(d))
+        return entry.apps.get(str(base)) if entry is not None else None
+
+    def covers(self) -> Dict[int, Path]:
+        """appid -> directory for every numeric cover image."""
+        out: Dict[int, Path] = {}
+        for a in self.apps():
+            if a.cover is not None and a.appid is not None:
+                out[a.appid] = a.dir
+        return out
+
+    def gp_count(self, d: Path, appid) -> int:
+        a = self.app(d, appid)
+        return len(a.gps) if a is not None else 0
+
+    def has_triplet(self, d: Path, appid) -> bool:
+        a = self.app(d, appid)
+        return a is not None and a.cover is not None and 1 in a.gps and 2 in a.gps
+
+    def count_triplets(self, d: Optional[Path] = None) -> int:
+        return sum(1 for a in self.apps(d) if a.cover is not None and 1 in a.gps and 2 in a.gps)
+
+    def count_images(self, d: Optional[Path] = None, exts=IMG_EXTS) -> int:
+        return sum(1 for e in self._entries(d) for name in e.files if os.path.splitext(name)[1].lower() in exts)
+
+    def size_of(self, path: Path) -> Optional[int]:
+        path = Path(path)
+        entry = self._dirs.get(path.parent)
+        return entry.files.get(path.name) if entry is not None else None
@@ -1,30 +1,32 @@
-import json
+import argparse
 import random
 import time
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
-
-import requests
+from typing import Dict, Iterator
+
+from aio_engine import DownloadTask, run_downloads
+from appdetails_store import DB_PATH
+from candidates import MAX_AGE_DAYS, CandidateStore, default_candidates, steamspy_genre
+from crawl_state import DONE, FAILED, CrawlState, open_state
+from derive import Deriver, add_derive_args, deriver_from_args
+from dir_index import DirIndex
+from endpoints import COVER_URLS
+from telemetry import add_telemetry_args, telemetry_session
+from url_meta import UrlMetaStore, default_store
 
 # =========================
 # PODESAVANJA
 # =========================
 BASE_DIR = Path(__file__).resolve().parents[2]
 OUT_DIR = BASE_DIR / "data" / "raw"
-OUT_DIR.mkdir(parents=True, exist_ok=True)
 
 STATE_DIR = BASE_DIR / "data" / "splits"
-STATE_DIR.mkdir(parents=True, exist_ok=True)
-STATE_FILE = STATE_DIR / "download_state_fast.json"
-
-STEAMSPY_URL = "https://steamspy.com/api.php"
+# append-only journal; the old download_state_fast.json is imported once
+STATE_FILE = STATE_DIR / "download_state_fast.jsonl"
 
-COVER_URLS = [
-    "https://steamcdn-a.akamaihd.net/steam/apps/{appid}/library_600x900_2x.jpg",
-    "https://steamcdn-a.akamaihd.net/steam/apps/{appid}/header.jpg",
-]
+# COVER_URLS dolaze iz endpoints.py (env override za lokalni fake_steam.py)
 
-# Koliko paralelnih download-a
+# Koliko paralelnih download-a (async engine, ukupno i po hostu)
 WORKERS = 32
 
 # Koliko appid kandidata da uzmemo po žanru (uzmi više od "need" zbog failova)
@@ -43,51 +45,15 @@ GENRE_CAPS = {
     "Strategy": 598,
 }
 
-# =========================
-# STATE
-# =========================
-def load_state() -> dict:
-    if STATE_FILE.exists():
-        try:
-            return json.loads(STATE_FILE.read_text(encoding="utf-8"))
-        except Exception:
-            pass
-    return {"per_genre": {}, "done_appids": []}
-
-
-def save_state(state: dict) -> None:
-    STATE_FILE.write_text(json.dumps(state, indent=2), encoding="utf-8")
-
-
 # =========================
 # STEAMSPY
 # =========================
-def get_json_with_retry(params: dict, tries: int = 6) -> dict:
-    for t in range(tries):
-        try:
-            r = requests.get(STEAMSPY_URL, params=params, timeout=60)
-            if r.status_code == 429:
-                time.sleep(2.0 + t * 2.0 + random.random())
-                continue
-            if r.status_code >= 500:
-                time.sleep(1.0 + t * 1.5 + random.random())
-                continue
-            if r.status_code != 200:
-                time.sleep(0.5 + t * 0.8 + random.random())
-                continue
-            return r.json() if r.text.strip() else {}
-        except Exception:
-            time.sleep(1.0 + t * 1.2 + random.random())
-    return {}
-
-
-def get_appids_for_genre(genre: str) -> list[int]:
-    # SteamSpy: request=genre&genre=Action
-    data = get_json_with_retry({"request": "genre", "genre": genre})
-    appids = []
-    for k in data.keys():
-        if str(k).isdigit():
-            appids.append(int(k))
+def get_appids_for_genre(genre: str, store: CandidateStore | None = None, exclude: set[int] = frozenset(),
+                         refresh: bool = False) -> list[int]:
+    # SteamSpy lista (request=genre) iz lokalnog cache-a; zastarjela se osvjezava u pozadini.
+    # Razlika skupova: appid-jevi iz exclude (vec probani) se ne vracaju.
+    store = store or default_candidates()
+    appids = store.pending(genre, steamspy_genre, exclude, refresh=refresh)
     random.shuffle(appids)
     return appids
 
@@ -95,102 +61,148 @@ def get_appids_for_genre(genre: str) -> list[int]:
 # =========================
 # DOWNLOAD COVERS
 # =========================
-def download_cover(appid: int, out_path: Path) -> bool:
-    for tpl in COVER_URLS:
-        url = tpl.format(appid=appid)
-        try:
-            r = requests.get(url, timeout=60)
-            if r.status_code == 200 and r.content and len(r.content) > 10_000:
-                out_path.write_bytes(r.content)
-                return True
-        except Exception:
-            pass
-    return False
-
-
-def cover_task(appid: int, genre: str, done_set: set[int]) -> tuple[int, bool]:
-    # ako smo ga već pokušali ranije, preskoči
-    if appid in done_set:
-        return appid, False
-
-    genre_dir = OUT_DIR / genre
+def cover_tasks(candidates: list[int], genre_dir: Path, done_set: set[int], index: DirIndex,
+                state: CrawlState) -> Iterator[DownloadTask]:
+    # generator: the engine pulls tasks through its bounded window, so the
+    # candidates behind the cap are never even turned into tasks
     genre_dir.mkdir(parents=True, exist_ok=True)
-    out_path = genre_dir / f"{appid}.jpg"
 
-    if out_path.exists():
-        done_set.add(appid)
-        return appid, True
-
-    ok = download_cover(appid, out_path)
-    done_set.add(appid)
-    return appid, ok
+    for appid in candidates:
+        # ako smo ga već pokušali ranije, preskoči
+        if appid in done_set:
+            continue
+        out_path = genre_dir / f"{appid}.jpg"
+        # vec je na disku, pa je vec uracunat u count_existing_from_disk
+        if index.size_of(out_path) is not None:
+            done_set.add(appid)
+            state.record(appid, DONE, "on_disk")
+            continue
+        urls = [tpl.format(appid=appid) for tpl in COVER_URLS]
+        yield DownloadTask(url=urls[0], path=out_path, fallbacks=tuple(urls[1:]))
 
 
-def count_existing_from_disk() -> dict:
+def count_existing_from_disk(index: DirIndex, out_dir: Path, caps: Dict[str, int]) -> dict:
     # Brojimo koliko već ima .jpg po folderu (da state ne laže)
-    per = {}
-    for g in GENRE_CAPS.keys():
-        d = OUT_DIR / g
-        if d.exists() and d.is_dir():
-            per[g] = len(list(d.glob("*.jpg")))
-        else:
-            per[g] = 0
-    return per
+    return {g: index.count_images(out_dir / g, exts={".jpg"}) for g in caps.keys()}
 
 
 # =========================
 # MAIN
 # =========================
-def main():
-    state = load_state()
-    done_set = set(state.get("done_appids", []))
+def crawl(state: CrawlState, out_dir: Path = OUT_DIR, caps: Dict[str, int] = GENRE_CAPS,
+          validators: UrlMetaStore | None = None, workers: int = WORKERS,
+          candidates_store: CandidateStore | None = None, refresh_candidates: bool = False,
+          deriver: Deriver | None = None) -> None:
+    # svi appid-jevi koje smo vec probali (uspjeh ili ne)
+    done_set = state.seen()
 
     # Uskladi per_genre sa realnim fajlovima na disku (najjednostavnije i najtačnije)
-    per_genre = count_existing_from_disk()
+    out_dir.mkdir(parents=True, exist_ok=True)
+    index = DirIndex(out_dir)
+    per_genre = count_existing_from_disk(index, out_dir, caps)
 
     print("Current counts:")
-    for g in GENRE_CAPS:
-        print(f"  {g}: {per_genre[g]}/{GENRE_CAPS[g]}")
+    for g in caps:
+        print(f"  {g}: {per_genre[g]}/{caps[g]}")
 
-    for genre, cap in GENRE_CAPS.items():
+    for genre, cap in caps.items():
         need = cap - per_genre.get(genre, 0)
         if need <= 0:
             continue
 
         print(f"\n[GENRE] {genre} missing {need} covers...")
 
-        appids = get_appids_for_genre(genre)
+        # samo appid-jevi koje jos nismo probali (done/failed iz journala)
+        appids = get_appids_for_genre(genre, candidates_store, done_set, refresh_candidates)
+        print(f"[INFO] {genre}: {len(appids)} neprobanih kandidata")
         # uzmi prvih need*CANDIDATE_MULT kandidata (da imamo buffer za failove)
         candidates = appids[: max(need * CANDIDATE_MULT, need)]
 
         added = 0
-        with ThreadPoolExecutor(max_workers=WORKERS) as ex:
-            futures = [ex.submit(cover_task, appid, genre, done_set) for appid in candidates]
-
-            for fut in as_completed(futures):
-                appid, ok = fut.result()
-                if ok:
-                    per_genre[genre] += 1
-                    added += 1
 
-                    if per_genre[genre] % 20 == 0 or per_genre[genre] >= cap:
-                        print(f"  {genre}: {per_genre[genre]}/{cap}")
-
-                    if per_genre[genre] >= cap:
-                        break
+        def on_result(task: DownloadTask, ok: bool, reason: str) -> bool:
+            nonlocal added
+            appid = int(task.path.stem)
+            done_set.add(appid)
+            # razlog odbijanja (not_image, http_404, ...) ide u journal
+            state.record(appid, DONE if ok else FAILED, genre if ok else f"{genre}:{reason}")
+            if not ok:
+                return False
+
+            index.note(task.path)
+            per_genre[genre] += 1
+            added += 1
+
+            if per_genre[genre] % 20 == 0 or per_genre[genre] >= cap:
+                print(f"  {genre}: {per_genre[genre]}/{cap}")
+
+            # cap dostignut -> engine otkazuje sve sto je jos u letu
+            return per_genre[genre] >= cap
+
+        genre_dir = out_dir / genre
+        genre_dir.mkdir(parents=True, exist_ok=True)
+        run_downloads(
+            cover_tasks(candidates, genre_dir, done_set, index, state),
+            concurrency=workers, per_host=workers, min_bytes=10_001,
+            timeout=60, on_result=on_result, desc=genre, headers={},
+            # ETag/Last-Modified for later `url_meta.py --revalidate` sweeps
+            validators=validators,
+            # --derive-to: training-resolution kopija svakog novog covera
+            on_saved=deriver.submit if deriver else None,
+        )
 
         print(f"[DONE] {genre} added {added}, now {per_genre[genre]}/{cap}")
 
-        # save after each genre
-        state["done_appids"] = list(done_set)
-        state["per_genre"] = per_genre
-        save_state(state)
+        state.set("per_genre", per_genre)
 
         time.sleep(SLEEP_BETWEEN_GENRES)
 
     print("\nALL DONE. Final counts:")
-    for g in GENRE_CAPS:
-        print(f"  {g}: {per_genre[g]}/{GENRE_CAPS[g]}")
+    for g in caps:
+        print(f"  {g}: {per_genre[g]}/{caps[g]}")
+
+
+def parse_caps(items: list[str]) -> Dict[str, int]:
+    caps = {}
+    for it in items:
+        name, sep, cap = it.partition("=")
+        if not sep or not cap.isdigit():
+            raise SystemExit(f"[ERROR] expected GENRE=CAP, got {it!r}")
+        caps[name] = int(cap)
+    return caps
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--out-dir", type=Path, default=OUT_DIR)
+    ap.add_argument("--state", type=Path, default=STATE_FILE)
+    ap.add_argument("--cache-db", type=Path, default=None,
+                    help="url_meta store (default: the shared appdetails SQLite file).")
+    ap.add_argument("--caps", nargs="+", default=None, help="GENRE=CAP ... (default: GENRE_CAPS).")
+    ap.add_argument("--workers", type=int, default=WORKERS)
+    ap.add_argument("--candidates-max-age", type=float, default=MAX_AGE_DAYS,
+                    help="Days before a cached SteamSpy genre list is refreshed (in the background).")
+    ap.add_argument("--refresh-candidates", action="store_true",
+                    help="Refetch the SteamSpy genre lists before crawling.")
+    add_derive_args(ap)
+    add_telemetry_args(ap)
+    args = ap.parse_args()
+
+    caps = parse_caps(args.caps) if args.caps else GENRE_CAPS
+    validators = UrlMetaStore(args.cache_db) if args.cache_db else default_store()
+    store = CandidateStore(args.cache_db or DB_PATH, max_age_days=args.candidates_max_age)
+    state = open_state(args.state)
+    deriver = deriver_from_args(args, args.out_dir)
+    try:
+        with telemetry_session(args, "steam_dataset"):
+            crawl(state, args.out_dir, caps, validators, max(1, args.workers), store, args.refresh_candidates,
+                  deriver)
+    finally:
+        state.close()
+        if deriver:
+            deriver.close()
+    if deriver:
+        print(f"[INFO] Derived copies: written={deriver.written} errors={deriver.errors} -> {args.derive_to}")
 
 
 if __name__ == "__main__":
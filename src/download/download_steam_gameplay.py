@@ -11,9 +11,13 @@ Default behavior:
     ...
 
 Speed-ups:
-- Fetches appdetails in BATCHES (one request for many appids)
-- Downloads images concurrently (ThreadPoolExecutor)
+- Pipelined: appdetails lookups (cache hits included) feed a bounded queue that
+  download workers consume right away, so images start flowing immediately
+  and wall time is ~max(metadata, download) instead of their sum
+- Downloads images concurrently on the shared asyncio engine (aio_engine.py)
 - Resume is automatic: if _gp1/_gp2 already exist (and file looks valid), it skips
+- --derive-to data/raw_256 also writes training-resolution copies (derive.py)
+  in a background process pool as each screenshot lands
 
 Run:
   python src/download_steam_gameplay.py --covers-dir data/raw --per-app 2 --workers 32 --batch-size 50
@@ -22,18 +26,23 @@ Run:
 from __future__ import annotations
 
 import argparse
-import random
-import threading
+import asyncio
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, Iterable, List, Tuple
+from typing import Dict, List, Optional, Tuple
 from urllib.parse import urlparse
 
 import requests
 from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+
+from aio_engine import DEFAULT_HEADERS, DownloadEngine, DownloadTask
+from appdetails_store import DB_PATH, AppDetailsCache, default_cache
+from derive import Deriver, add_derive_args, deriver_from_args
+from dir_index import IMG_EXTS, DirIndex
+from endpoints import APPDETAILS_URL
+from url_meta import UrlMetaStore
+from ratelimit import FileCoordinator, HostRateLimiter, host_of, parse_retry_after
+from telemetry import CountingRetry, add_telemetry_args, default_telemetry, record_response, telemetry_session
 
 try:
     from tqdm import tqdm
@@ -41,38 +50,12 @@ except ImportError:
     tqdm = None
 
 
-APPDETAILS_URL = "https://store.steampowered.com/api/appdetails"
-
-BASE_DIR = Path(__file__).resolve().parents[2]
-CACHE_DIR = BASE_DIR / "data" / "splits" / "appdetails_cache"
-CACHE_DIR.mkdir(parents=True, exist_ok=True)
-
-_meta_lock = threading.Lock()
-_meta_next_time = 0.0
-
-def rate_limit(min_interval: float):
-    global _meta_next_time
-    with _meta_lock:
-        now = time.time()
-        if now < _meta_next_time:
-            time.sleep(_meta_next_time - now)
-        _meta_next_time = time.time() + min_interval
-
-def cache_path_for(appid: int) -> Path:
-    return CACHE_DIR / f"{appid}.json"
-
-
-IMG_EXTS = {".jpg", ".jpeg", ".png", ".webp"}
-DEFAULT_HEADERS = {
-    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-                  "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-    "Accept": "application/json,text/html;q=0.9,*/*;q=0.8",
-}
+# appdetails budget; main() replaces it according to --rate / --rate-state
+META_LIMITER = HostRateLimiter(rate=1.0 / 0.6)
 
-_tls = threading.local()
 
-
-def make_session(pool_maxsize: int = 64, add_age_gate_cookies: bool = True) -> requests.Session:
+def make_session(pool_maxsize: int = 64, add_age_gate_cookies: bool = True,
+                 retry_status: bool = True) -> requests.Session:
     s = requests.Session()
     s.headers.update(DEFAULT_HEADERS)
 
@@ -81,12 +64,14 @@ def make_session(pool_maxsize: int = 64, add_age_gate_cookies: bool = True) -> r
         s.cookies.set("lastagecheckage", "1-January-1980")
         s.cookies.set("wants_mature_content", "1")
 
-    retry = Retry(
+    # retry_status=False leaves 429/5xx to the caller (e.g. the rate limiter),
+    # otherwise urllib3 backoff and the caller's own handling multiply
+    retry = CountingRetry(
         total=7,
         connect=7,
         read=7,
         backoff_factor=0.8,
-        status_forcelist=(429, 500, 502, 503, 504),
+        status_forcelist=(429, 500, 502, 503, 504) if retry_status else (),
         allowed_methods=("GET",),
         raise_on_status=False,
         respect_retry_after_header=True,
@@ -94,145 +79,64 @@ def make_session(pool_maxsize: int = 64, add_age_gate_cookies: bool = True) -> r
     adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_maxsize, pool_maxsize=pool_maxsize)
     s.mount("http://", adapter)
     s.mount("https://", adapter)
+    s.hooks["response"].append(record_response)
     return s
 
 
-def get_thread_session() -> requests.Session:
-    sess = getattr(_tls, "session", None)
-    if sess is None:
-        sess = make_session()
-        _tls.session = sess
-    return sess
-
-
-def chunks(lst: List, n: int) -> Iterable[List]:
-    for i in range(0, len(lst), n):
-        yield lst[i:i + n]
-
-
 def safe_suffix_from_url(url: str) -> str:
     path = urlparse(url).path
     suf = Path(path).suffix.lower()
     return suf if suf in IMG_EXTS else ".jpg"
 
 
-def atomic_download(url: str, dst: Path, timeout: int = 45, min_bytes: int = 6_000) -> bool:
-    dst.parent.mkdir(parents=True, exist_ok=True)
-
-    if dst.exists() and dst.stat().st_size >= min_bytes:
-        return True
-
-    tmp = dst.with_suffix(dst.suffix + ".tmp")
-    if tmp.exists():
-        try:
-            tmp.unlink()
-        except Exception:
-            pass
-
-    sess = get_thread_session()
-    try:
-        with sess.get(url, stream=True, timeout=timeout) as r:
-            if r.status_code != 200:
-                return False
-
-            total = 0
-            with open(tmp, "wb") as f:
-                for chunk in r.iter_content(chunk_size=256 * 1024):
-                    if not chunk:
-                        continue
-                    f.write(chunk)
-                    total += len(chunk)
-
-        if total < min_bytes:
-            try:
-                tmp.unlink(missing_ok=True)
-            except Exception:
-                pass
-            return False
-
-        tmp.replace(dst)
-        return True
-    except Exception:
-        try:
-            tmp.unlink(missing_ok=True)
-        except Exception:
-            pass
-        return False
-
-
-def scan_covers(covers_dir: Path) -> Dict[int, Path]:
-    mapping: Dict[int, Path] = {}
-    for p in covers_dir.rglob("*"):
-        if not p.is_file():
-            continue
-        if p.suffix.lower() not in IMG_EXTS:
-            continue
-
-        name = p.stem
-        if "_gp" in name:
-            continue
-
-        if not name.isdigit():
-            continue
-
-        appid = int(name)
-        mapping[appid] = p.parent
-
-    return mapping
-
-
-def existing_gp_count(genre_dir: Path, appid: int) -> int:
-    return len(list(genre_dir.glob(f"{appid}_gp*.*")))
-
-
-def fetch_appdetails_single(appid: int, sess: requests.Session, timeout: int = 20, min_interval: float = 0.6) -> Dict:
-    cp = cache_path_for(appid)
-    if cp.exists() and cp.stat().st_size > 10:
-        try:
-            import json
-            return json.loads(cp.read_text(encoding="utf-8"))
-        except Exception:
-            pass
+def fetch_appdetails_single(appid: int, sess: requests.Session, timeout: int = 20,
+                            limiter: HostRateLimiter | None = None,
+                            cache: AppDetailsCache | None = None) -> Dict:
+    if cache is None:
+        cache = default_cache()
+    node = cache.get_payload(appid)
+    if node is not None:
+        return {str(appid): node}
 
+    # genres is cheap to include and lets the genre crawlers reuse this row
     params = {
         "appids": str(appid),
         "l": "english",
         "cc": "us",
-        "filters": "basic,screenshots",
+        "filters": "basic,genres,screenshots",
     }
 
-    rate_limit(min_interval)
+    limiter = limiter or META_LIMITER
+    host = host_of(APPDETAILS_URL)
 
-    backoff = 2.0
+    # every attempt takes a token; 429/5xx slow the shared rate down instead of
+    # sleeping here, so the next token already carries the backoff
     for _ in range(6):
+        limiter.acquire(host)
         try:
             r = sess.get(APPDETAILS_URL, params=params, timeout=timeout)
         except Exception:
-            time.sleep(backoff)
-            backoff = min(30.0, backoff * 1.7)
+            default_telemetry().retry(host, "error")
+            limiter.on_throttle(host)
             continue
 
         if r.status_code == 200:
+            limiter.on_success(host)
             try:
                 j = r.json()
             except Exception:
                 return {}
-            try:
-                cp.write_text(__import__("json").dumps(j), encoding="utf-8")
-            except Exception:
-                pass
+            node = j.get(str(appid)) if isinstance(j, dict) else None
+            if isinstance(node, dict):
+                try:
+                    cache.put_payload(appid, node, with_genres=True)
+                except Exception:
+                    pass
             return j
 
         if r.status_code in (429, 500, 502, 503, 504):
-            ra = r.headers.get("Retry-After")
-            if ra:
-                try:
-                    time.sleep(float(ra))
-                except Exception:
-                    time.sleep(backoff)
-            else:
-                time.sleep(backoff)
-            backoff = min(30.0, backoff * 1.7)
+            default_telemetry().retry(host, r.status_code)
+            limiter.on_throttle(host, parse_retry_after(r.headers.get("Retry-After")))
             continue
 
         return {}
@@ -241,22 +145,6 @@ def fetch_appdetails_single(appid: int, sess: requests.Session, timeout: int = 2
 
 
 
-def fetch_appdetails_batch(appids: List[int], sess: requests.Session, timeout: int = 20, debug: bool = False) -> Dict:
-    merged: Dict = {}
-    for a in appids:
-        one = fetch_appdetails_single(a, sess, timeout=timeout, min_interval=0.6)
-        if isinstance(one, dict) and one:
-            merged.update(one)
-    return merged
-
-
-
-
-@dataclass(frozen=True)
-class DownloadTask:
-    url: str
-    path: Path
-
 def build_tasks_for_app(app_payload: Dict, genre_dir: Path, appid: int, per_app: int) -> List[DownloadTask]:
     if not app_payload or not app_payload.get("success"):
         return []
@@ -287,12 +175,94 @@ def build_tasks_for_app(app_payload: Dict, genre_dir: Path, appid: int, per_app:
     return tasks
 
 
-def count_images(root: Path) -> int:
-    c = 0
-    for p in root.rglob("*"):
-        if p.is_file() and p.suffix.lower() in IMG_EXTS:
-            c += 1
-    return c
+async def pipeline(
+    targets: List[Tuple[int, Path]],
+    meta_sess: requests.Session,
+    limiter: HostRateLimiter,
+    cache: AppDetailsCache,
+    index: DirIndex,
+    per_app: int,
+    workers: int,
+    meta_workers: int,
+    min_bytes: int,
+    dry_run: bool,
+    debug_left: int,
+    revalidate: bool = False,
+    deriver: Optional[Deriver] = None,
+) -> Dict:
+    """appdetails producers -> bounded queue -> download workers, all at once."""
+    q: asyncio.Queue = asyncio.Queue(maxsize=workers * 4)
+    stats = {"planned": 0, "ok": 0, "fail": 0, "first_image_s": None}
+    t0 = time.perf_counter()
+    targets_it = iter(targets)
+
+    bar_meta = tqdm(total=len(targets), desc="Fetching appdetails", unit="app", position=0) if tqdm else None
+    bar_dl = tqdm(desc="Downloading screenshots", unit="img", position=1) if tqdm and not dry_run else None
+
+    async def producer():
+        nonlocal debug_left
+        # the iterator is shared, every producer pulls the next target
+        for appid, genre_dir in targets_it:
+            # blocking requests + limiter sleep run in a thread, not on the loop
+            batch_data = await asyncio.to_thread(fetch_appdetails_single, appid, meta_sess, 20, limiter, cache)
+            payload = batch_data.get(str(appid)) or {}
+
+            if debug_left > 0:
+                succ = payload.get("success")
+                d = payload.get("data")
+                ss_len = 0
+                if isinstance(d, dict):
+                    ss = d.get("screenshots")
+                    if isinstance(ss, list):
+                        ss_len = len(ss)
+                print(f"[DEBUG] appid={appid} success={succ} screenshots={ss_len}")
+                debug_left -= 1
+
+            for t in build_tasks_for_app(payload, genre_dir, appid, per_app):
+                # Skip tasks that already exist (resume-friendly)
+                if not revalidate and (index.size_of(t.path) or 0) >= min_bytes:
+                    continue
+                stats["planned"] += 1
+                if dry_run:
+                    if stats["planned"] <= 40:
+                        print("  ", t.path, "<-", t.url)
+                    continue
+                await q.put(t)
+
+            if bar_meta:
+                bar_meta.update(1)
+
+    def on_result(task: DownloadTask, ok: bool, reason: str) -> None:
+        if ok:
+            index.note(task.path)
+            stats["ok"] += 1
+            if stats["first_image_s"] is None:
+                stats["first_image_s"] = time.perf_counter() - t0
+        else:
+            stats["fail"] += 1
+        if bar_dl:
+            bar_dl.update(1)
+
+    try:
+        async with DownloadEngine(concurrency=workers, per_host=workers,
+                                  validators=UrlMetaStore(cache.path), revalidate=revalidate,
+                                  on_saved=deriver.submit if deriver else None) as eng:
+            consumers = asyncio.ensure_future(eng.run_queue(q, workers, min_bytes, on_result))
+            try:
+                await asyncio.gather(*(producer() for _ in range(meta_workers)))
+            finally:
+                for _ in range(workers):
+                    await q.put(None)
+            await consumers
+            stats.update(eng.counters)
+            stats["reasons"] = dict(eng.reasons)
+    finally:
+        if bar_meta:
+            bar_meta.close()
+        if bar_dl:
+            bar_dl.close()
+
+    return stats
 
 
 def main():
@@ -300,12 +270,28 @@ def main():
     ap.add_argument("--covers-dir", type=Path, default=Path("data/raw"),
                     help="Root folder that contains genre subfolders with cover images (default: data/raw).")
     ap.add_argument("--per-app", type=int, default=2, help="How many gameplay screenshots per game (default: 2).")
-    ap.add_argument("--workers", type=int, default=32, help="Concurrent image download workers (default: 32).")
-    ap.add_argument("--batch-size", type=int, default=50, help="How many appids per appdetails request (default: 50).")
+    ap.add_argument("--workers", type=int, default=32, help="Concurrent image downloads (default: 32).")
+    ap.add_argument("--meta-workers", type=int, default=4,
+                    help="Concurrent appdetails lookups feeding the download queue (default: 4). "
+                         "The rate limiter still bounds requests/sec.")
+    ap.add_argument("--batch-size", type=int, default=50, help="Deprecated, ignored (lookups are pipelined).")
     ap.add_argument("--max-total-images", type=int, default=15000,
                     help="Safety cap for total images in covers-dir (default: 15000). Use 0 to disable.")
     ap.add_argument("--min-bytes", type=int, default=6000,
                     help="Minimum file size to consider a download valid (default: 6000).")
+    ap.add_argument("--rate", type=float, default=1.0 / 0.6,
+                    help="Initial appdetails requests/sec; adapts up/down (AIMD) from there (default: ~1.67).")
+    ap.add_argument("--max-rate", type=float, default=4.0, help="Upper bound for the adaptive rate (default: 4).")
+    ap.add_argument("--rate-state", type=Path, default=None,
+                    help="Shared limiter state file, lets several crawler processes share one budget.")
+    ap.add_argument("--cache-db", type=Path, default=DB_PATH, help=f"appdetails cache (default: {DB_PATH}).")
+    ap.add_argument("--cache-ttl-days", type=float, default=None,
+                    help="Refetch appdetails cached longer ago than this (default: never expire).")
+    ap.add_argument("--revalidate", action="store_true",
+                    help="Also re-check screenshots already on disk with conditional GETs "
+                         "(ETag/Last-Modified); only changed ones are transferred again.")
+    add_derive_args(ap)
+    add_telemetry_args(ap)
     ap.add_argument("--dry-run", action="store_true", help="Only print what would be downloaded.")
     ap.add_argument("--debug-samples", type=int, default=0,
                     help="Print debug for first N appids that return no screenshots.")
@@ -314,14 +300,15 @@ def main():
     covers_dir: Path = args.covers_dir
     per_app: int = max(1, args.per_app)
     workers: int = max(1, args.workers)
-    batch_size: int = max(1, args.batch_size)
     max_total: int = args.max_total_images
     min_bytes: int = max(1000, args.min_bytes)
 
     if not covers_dir.exists():
         raise SystemExit(f"[ERROR] covers-dir not found: {covers_dir}")
 
-    app_to_genre = scan_covers(covers_dir)
+    t_scan = time.perf_counter()
+    index = DirIndex(covers_dir)
+    app_to_genre = index.covers()
     if not app_to_genre:
         raise SystemExit(
             f"[ERROR] No cover images found under {covers_dir}. "
@@ -330,12 +317,13 @@ def main():
 
     targets: List[Tuple[int, Path]] = []
     for appid, genre_dir in app_to_genre.items():
-        if existing_gp_count(genre_dir, appid) >= per_app:
+        if not args.revalidate and index.gp_count(genre_dir, appid) >= per_app:
             continue
         targets.append((appid, genre_dir))
 
-    if max_total and max_total > 0:
-        current = count_images(covers_dir)
+    # the cap is about new files; a revalidation pass only replaces existing ones
+    if max_total and max_total > 0 and not args.revalidate:
+        current = index.count_images()
         room = max_total - current
         if room <= 0:
             print(f"[INFO] Already at/over max-total-images={max_total}. Nothing to do.")
@@ -348,94 +336,56 @@ def main():
             targets = targets[:max_apps]
             print(f"[INFO] Capped to {len(targets)} apps to stay <= {max_total} total images.")
 
-    print(f"[INFO] Covers found: {len(app_to_genre)}")
+    print(f"[INFO] Covers found: {len(app_to_genre)} (index built in {time.perf_counter() - t_scan:.2f}s)")
     print(f"[INFO] Apps missing gameplay: {len(targets)} (per_app={per_app})")
 
     if not targets:
         print("[INFO] Nothing to download. (All apps already have gameplay screenshots.)")
         return
 
-    meta_sess = make_session(pool_maxsize=32, add_age_gate_cookies=True)
-
-    all_tasks: List[DownloadTask] = []
-    debug_left = max(0, args.debug_samples)
-
-    it_batches = list(chunks(targets, batch_size))
-    bar_batches = tqdm(it_batches, desc="Fetching appdetails", unit="batch") if tqdm else it_batches
-
-    for batch in bar_batches:
-        batch_appids = [appid for appid, _ in batch]
-        batch_data = fetch_appdetails_batch(batch_appids, meta_sess, debug=(args.debug_samples > 0))
-
-        if not batch_data:
-            if args.debug_samples > 0:
-                print("[DEBUG] Batch returned empty dict after fallback too.")
-            continue
-
-        for appid, genre_dir in batch:
-            payload = batch_data.get(str(appid)) or {}
-
-            if debug_left > 0:
-                succ = payload.get("success")
-                d = payload.get("data")
-                ss_len = 0
-                if isinstance(d, dict):
-                    ss = d.get("screenshots")
-                    if isinstance(ss, list):
-                        ss_len = len(ss)
-                print(f"[DEBUG] appid={appid} success={succ} screenshots={ss_len}")
-                debug_left -= 1
-
-            tasks = build_tasks_for_app(payload, genre_dir, appid, per_app)
-
-            # Skip tasks that already exist (resume-friendly)
-            filtered: List[DownloadTask] = []
-            for t in tasks:
-                if t.path.exists() and t.path.stat().st_size >= min_bytes:
-                    continue
-                filtered.append(t)
-
-            all_tasks.extend(filtered)
+    meta_sess = make_session(pool_maxsize=32, add_age_gate_cookies=True, retry_status=False)
+    limiter = HostRateLimiter(
+        rate=args.rate, max_rate=args.max_rate,
+        coordinator=FileCoordinator(args.rate_state) if args.rate_state else None,
+    )
+    cache = AppDetailsCache(args.cache_db, ttl_days=args.cache_ttl_days)
+    deriver = None if args.dry_run else deriver_from_args(args, covers_dir)
 
+    t0 = time.perf_counter()
+    try:
+        with telemetry_session(args, "steam_gameplay"):
+            stats = asyncio.run(pipeline(
+                targets, meta_sess, limiter, cache, index, per_app, workers, max(1, args.meta_workers),
+                min_bytes, args.dry_run, max(0, args.debug_samples), args.revalidate, deriver,
+            ))
+    finally:
+        if deriver:
+            deriver.close()
+    wall = time.perf_counter() - t0
 
     if args.dry_run:
-        print("[DRY RUN] Tasks to download:", len(all_tasks))
-        for t in all_tasks[:40]:
-            print("  ", t.path, "<-", t.url)
-        if len(all_tasks) > 40:
-            print("  ...")
+        print("[DRY RUN] Tasks to download:", stats["planned"])
         return
 
-    if not all_tasks:
+    if not stats["planned"]:
         print("[INFO] No new screenshots to download. "
               "Try --debug-samples 5 to see why screenshots are missing.")
         return
 
-    print(f"[INFO] Total screenshot files to download: {len(all_tasks)}")
-
-    ok = 0
-    fail = 0
-
-    bar_dl = tqdm(total=len(all_tasks), desc="Downloading screenshots", unit="img") if tqdm else None
-
-    with ThreadPoolExecutor(max_workers=workers) as ex:
-        futures = [ex.submit(atomic_download, task.url, task.path, 45, min_bytes) for task in all_tasks]
-        for fut in as_completed(futures):
-            try:
-                res = bool(fut.result())
-            except Exception:
-                res = False
-            if res:
-                ok += 1
-            else:
-                fail += 1
-            if bar_dl:
-                bar_dl.update(1)
-
-    if bar_dl:
-        bar_dl.close()
+    first = stats["first_image_s"]
+    first_txt = f"{first:.1f}s" if first is not None else "-"
+    print(f"[INFO] Screenshot files queued: {stats['planned']} | "
+          f"time to first image: {first_txt} | wall: {wall:.1f}s")
 
+    ok, fail = stats["ok"], stats["fail"]
     print(f"[DONE] Downloaded OK: {ok} | Failed: {fail}")
+    if args.revalidate:
+        print(f"[INFO] Revalidated: not modified={stats.get('not_modified', 0)} | "
+              f"changed/new={stats.get('fetched', 0)} | bytes={stats.get('bytes', 0)}")
+    if stats.get("reasons"):
+        print("[INFO] Failure reasons: " + " ".join(f"{r}={n}" for r, n in sorted(stats["reasons"].items())))
+    if deriver:
+        print(f"[INFO] Derived copies: written={deriver.written} errors={deriver.errors} -> {args.derive_to}")
     if fail:
         print("[TIP] Failures are usually region locked / missing screenshots / temporary Steam issues. "
               "Re-run later; resume works automatically.")
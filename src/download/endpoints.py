@@ -0,0 +1,33 @@
+"""
+Steam / SteamSpy base URLs, overridable from the environment.
+
+  STEAM_BASE_URL     one base for everything (e.g. the local fake_steam.py
+                     server: http://127.0.0.1:8766)
+  STEAM_STORE_URL    store.steampowered.com  (appdetails)
+  STEAM_API_URL      api.steampowered.com    (IStoreService/GetAppList)
+  STEAMSPY_BASE_URL  steamspy.com            (api.php)
+  STEAM_CDN_URL      steamcdn-a.akamaihd.net (cover images)
+
+The specific variables win over STEAM_BASE_URL. Read once at import, so set
+them before starting a downloader.
+"""
+
+import os
+
+
+def _base(var: str, default: str) -> str:
+    return (os.environ.get(var) or os.environ.get("STEAM_BASE_URL") or default).rstrip("/")
+
+
+STORE = _base("STEAM_STORE_URL", "https://store.steampowered.com")
+API = _base("STEAM_API_URL", "https://api.steampowered.com")
+STEAMSPY = _base("STEAMSPY_BASE_URL", "https://steamspy.com")
+CDN = _base("STEAM_CDN_URL", "https://steamcdn-a.akamaihd.net")
+
+APPDETAILS_URL = f"{STORE}/api/appdetails"
+APP_LIST_URL = f"{API}/IStoreService/GetAppList/v1/"
+STEAMSPY_URL = f"{STEAMSPY}/api.php"
+COVER_URLS = [
+    f"{CDN}/steam/apps/{{appid}}/library_600x900_2x.jpg",
+    f"{CDN}/steam/apps/{{appid}}/header.jpg",
+]
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Steam / SteamSpy endpoints the downloaders use.
+
+Serves, from one port and fully synthetic / deterministic (per --seed):
+  /api/appdetails?appids=N            store appdetails (genres, header, screenshots)
+  /IStoreService/GetAppList/v1/       paged app list (last_appid / max_results)
+  /api.php?request=genre&genre=G      SteamSpy genre lists
+  /steam/apps/<appid>/<name>.jpg      covers (library_600x900_2x / header)
+  /img/<appid>/ss_<k>.jpg             screenshots
+  /__stats, /__reset                  request counters for benchmarks
+
+Knobs: per-request latency (+ jitter), injected 429 (with Retry-After) and
+5xx rates, a per-response bandwidth cap, image bodies cut off halfway
+(flaky links), apps without details, screenshots or the tall cover
+(exercises the cover fallback). Images carry ETag, Last-Modified and
+Accept-Ranges, answer conditional GETs with 304 and Range/If-Range with 206.
+
+Images are valid JPEG *headers* (SOF with real dimensions, EOI at the end)
+around random entropy data: they pass the engine's in-stream validation but
+do not decode, so do not combine with --derive-to.
+
+Point the downloaders at it through endpoints.py:
+  python src/download/fake_steam.py --port 8766 --p429 0.02 --latency-ms 40
+  STEAM_BASE_URL=http://127.0.0.1:8766 python src/download/download_steam_gameplay.py ...
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing as mp
+import random
+import re
+import struct
+import threading
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+GENRES = ("Action", "Adventure", "Racing", "RPG", "Simulation", "Strategy")
+SEND_CHUNK = 64 * 1024
+
+
+@dataclass
+class FakeConfig:
+    apps: int = 5000
+    first_appid: int = 10
+    genres: Tuple[str, ...] = GENRES
+    screenshots: int = 4
+    cover_bytes: int = 120_000
+    screenshot_bytes: int = 300_000
+    latency_ms: float = 30.0
+    jitter_ms: float = 10.0
+    p429: float = 0.0
+    p5xx: float = 0.0
+    retry_after: float = 1.0
+    bandwidth: float = 0.0        # bytes/sec per response, 0 = unlimited
+    p_cut: float = 0.0            # image bodies that stop halfway (connection dropped)
+    p_missing: float = 0.05       # appdetails success=false
+    p_no_screens: float = 0.05
+    p_no_tall_cover: float = 0.10
+    seed: int = 0
+    # fixed Last-Modified for every image, so revalidation gets 304s
+    last_modified: float = field(default=1_600_000_000.0)
+
+
+def synthetic_jpeg(nbytes: int, width: int, height: int, seed: int = 0) -> bytes:
+    """SOI, JFIF, SOF0 (width x height), SOS, ~nbytes of 0xFF-free noise, EOI."""
+    app0 = b"\xff\xe0" + struct.pack(">H", 16) + b"JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00"
+    sof = b"\xff\xc0" + struct.pack(">HBHHB", 17, 8, height, width, 3) + b"\x01\x22\x00\x02\x11\x01\x03\x11\x01"
+    sos = b"\xff\xda" + struct.pack(">HB", 12, 3) + b"\x01\x00\x02\x11\x03\x11\x00\x3f\x00"
+    head = b"\xff\xd8" + app0 + sof + sos
+    noise = random.Random(seed).randbytes(max(0, nbytes - len(head) - 2)).replace(b"\xff", b"\x00")
+    return head + noise + b"\xff\xd9"
+
+
+class FakeSteam:
+    """Synthetic catalogue + counters; the HTTP handler only routes to it."""
+
+    def __init__(self, cfg: FakeConfig):
+        self.cfg = cfg
+        self.appids = list(range(cfg.first_appid, cfg.first_appid + cfg.apps))
+        self.apps = {a: self._make_app(a) for a in self.appids}
+        self.tall = synthetic_jpeg(cfg.cover_bytes, 600, 900, cfg.seed)
+        self.header = synthetic_jpeg(max(6_000, cfg.cover_bytes // 4), 460, 215, cfg.seed + 1)
+        self.screen = synthetic_jpeg(cfg.screenshot_bytes, 1920, 1080, cfg.seed + 2)
+        self.last_modified = formatdate(cfg.last_modified, usegmt=True)
+        self.counters: Counter = Counter()
+        self._lock = threading.Lock()
+        self._rng = random.Random(cfg.seed)
+
+    def _make_app(self, appid: int) -> Dict:
+        r = random.Random(self.cfg.seed * 1_000_003 + appid)
+        return {
+            "type": "game" if r.random() < 0.9 else "dlc",
+            "genres": r.sample(self.cfg.genres, k=r.randint(1, min(3, len(self.cfg.genres)))),
+            "missing": r.random() < self.cfg.p_missing,
+            "screens": 0 if r.random() < self.cfg.p_no_screens else self.cfg.screenshots,
+            "tall_cover": r.random() >= self.cfg.p_no_tall_cover,
+        }
+
+    def count(self, **kv: int) -> None:
+        with self._lock:
+            self.counters.update(kv)
+
+    def inject(self) -> Optional[int]:
+        """429 / 503 to inject for this request, or None."""
+        with self._lock:
+            x = self._rng.random()
+        if x < self.cfg.p429:
+            return 429
+        if x < self.cfg.p429 + self.cfg.p5xx:
+            return 503
+        return None
+
+    def cut(self) -> bool:
+        with self._lock:
+            return self._rng.random() < self.cfg.p_cut
+
+    def delay(self) -> float:
+        with self._lock:
+            j = self._rng.uniform(-self.cfg.jitter_ms, self.cfg.jitter_ms)
+        return max(0.0, self.cfg.latency_ms + j) / 1000.0
+
+    # ---- JSON routes ----
+
+    def appdetails(self, base: str, appid: int) -> Dict:
+        app = self.apps.get(appid)
+        if app is None or app["missing"]:
+            return {str(appid): {"success": False}}
+        data = {
+            "type": app["type"],
+            "name": f"Game {appid}",
+            "steam_appid": appid,
+            "genres": [{"id": str(GENRES.index(g) + 1) if g in GENRES else "0", "description": g}
+                       for g in app["genres"]],
+            "header_image": f"{base}/steam/apps/{appid}/header.jpg",
+            "screenshots": [
+                {"id": k, "path_full": f"{base}/img/{appid}/ss_{k}.jpg",
+                 "path_thumbnail": f"{base}/img/{appid}/ss_{k}.600x338.jpg"}
+                for k in range(app["screens"])
+            ],
+        }
+        return {str(appid): {"success": True, "data": data}}
+
+    def applist(self, last_appid: int, max_results: int) -> Dict:
+        page = [a for a in self.appids if a > last_appid][:max(1, max_results)]
+        more = bool(page) and page[-1] < self.appids[-1]
+        return {"response": {"apps": [{"appid": a, "name": f"Game {a}"} for a in page],
+                             "have_more_results": more}}
+
+    def steamspy_genre(self, genre: str) -> Dict:
+        return {str(a): {"appid": a, "name": f"Game {a}"}
+                for a, app in self.apps.items() if genre in app["genres"]}
+
+    # ---- images ----
+
+    def image(self, path: str) -> Optional[Tuple[bytes, str]]:
+        """(body, etag) for an image path, None for 404."""
+        parts = path.strip("/").split("/")
+        try:
+            if parts[:2] == ["steam", "apps"] and len(parts) == 4:
+                appid, name = int(parts[2]), parts[3]
+                app = self.apps.get(appid)
+                if app is None:
+                    return None
+                if name == "library_600x900_2x.jpg":
+                    return (self.tall, f'"{appid}-tall"') if app["tall_cover"] else None
+                if name == "header.jpg":
+                    return self.header, f'"{appid}-header"'
+            elif parts[0] == "img" and len(parts) == 3:
+                appid = int(parts[1])
+                app = self.apps.get(appid)
+                k = int(parts[2].split(".")[0].removeprefix("ss_"))
+                if app is not None and k < app["screens"]:
+                    return self.screen, f'"{appid}-ss{k}"'
+        except ValueError:
+            return None
+        return None
+
+
+def make_handler(fake: FakeSteam):
+    cfg = fake.cfg
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _send(self, status: int, body: bytes = b"", ctype: str = "application/json",
+                  headers: Optional[Dict[str, str]] = None, cut: bool = False) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            if cut:
+                # announce the full length, deliver half, drop the connection
+                body = body[: len(body) // 2]
+                self.close_connection = True
+                fake.count(cut=1)
+            if cfg.bandwidth > 0:
+                for i in range(0, len(body), SEND_CHUNK):
+                    chunk = body[i:i + SEND_CHUNK]
+                    self.wfile.write(chunk)
+                    time.sleep(len(chunk) / cfg.bandwidth)
+            else:
+                self.wfile.write(body)
+            fake.count(**{"requests": 1, f"status_{status}": 1, "bytes_out": len(body)})
+
+        def _json(self, obj) -> None:
+            self._send(200, json.dumps(obj, separators=(",", ":")).encode())
+
+        def do_GET(self):
+            u = urlparse(self.path)
+            q = {k: v[0] for k, v in parse_qs(u.query).items()}
+
+            if u.path == "/__stats":
+                with fake._lock:
+                    body = json.dumps(dict(fake.counters)).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            if u.path == "/__reset":
+                with fake._lock:
+                    fake.counters.clear()
+                self.send_response(204)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            time.sleep(fake.delay())
+            injected = fake.inject()
+            if injected is not None:
+                fake.count(**{f"injected_{injected}": 1})
+                hdrs = {"Retry-After": f"{cfg.retry_after:g}"} if injected == 429 else {}
+                self._send(injected, b"", "text/plain", hdrs)
+                return
+
+            base = f"http://{self.headers.get('Host', '127.0.0.1')}"
+            if u.path == "/api/appdetails":
+                try:
+                    appid = int(q.get("appids", "").split(",")[0])
+                except ValueError:
+                    self._json(None)
+                    return
+                self._json(fake.appdetails(base, appid))
+            elif u.path.rstrip("/") == "/IStoreService/GetAppList/v1":
+                self._json(fake.applist(int(q.get("last_appid", 0) or 0), int(q.get("max_results", 10000) or 0)))
+            elif u.path == "/api.php" and q.get("request") == "genre":
+                self._json(fake.steamspy_genre(q.get("genre", "")))
+            else:
+                hit = fake.image(u.path)
+                if hit is None:
+                    self._send(404, b"<html>not found</html>", "text/html")
+                    return
+                body, etag = hit
+                validators = {"ETag": etag, "Last-Modified": fake.last_modified, "Accept-Ranges": "bytes"}
+                if self.headers.get("If-None-Match") == etag:
+                    self._send(304, b"", "image/jpeg", validators)
+                    return
+                m = re.fullmatch(r"bytes=(\d+)-", self.headers.get("Range") or "")
+                if_range = self.headers.get("If-Range")
+                if m and if_range in (None, etag, fake.last_modified):
+                    start = int(m.group(1))
+                    if start >= len(body):
+                        self._send(416, b"", "text/plain", {"Content-Range": f"bytes */{len(body)}"})
+                        return
+                    rng = {"Content-Range": f"bytes {start}-{len(body) - 1}/{len(body)}"}
+                    self._send(206, body[start:], "image/jpeg", dict(validators, **rng), cut=fake.cut())
+                    return
+                self._send(200, body, "image/jpeg", validators, cut=fake.cut())
+
+    return Handler
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def serve(cfg: FakeConfig, port: int, ready=None) -> None:
+    srv = _Server(("127.0.0.1", port), make_handler(FakeSteam(cfg)))
+    if ready is not None:
+        ready.set()
+    srv.serve_forever()
+
+
+def start(cfg: FakeConfig, port: int) -> Tuple[mp.Process, str]:
+    """Run the server in a child process (its CPU is not the client's); returns (process, base URL)."""
+    ready = mp.Event()
+    proc = mp.Process(target=serve, args=(cfg, port, ready), daemon=True)
+    proc.start()
+    if not ready.wait(30):
+        proc.terminate()
+        raise RuntimeError(f"fake steam server did not start on port {port}")
+    return proc, f"http://127.0.0.1:{port}"
+
+
+def main():
+    d = FakeConfig()
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", type=int, default=8766)
+    ap.add_argument("--apps", type=int, default=d.apps)
+    ap.add_argument("--screenshots", type=int, default=d.screenshots)
+    ap.add_argument("--cover-bytes", type=int, default=d.cover_bytes)
+    ap.add_argument("--screenshot-bytes", type=int, default=d.screenshot_bytes)
+    ap.add_argument("--latency-ms", type=float, default=d.latency_ms)
+    ap.add_argument("--jitter-ms", type=float, default=d.jitter_ms)
+    ap.add_argument("--p429", type=float, default=d.p429, help="Share of requests answered 429 (with Retry-After).")
+    ap.add_argument("--p5xx", type=float, default=d.p5xx, help="Share of requests answered 503.")
+    ap.add_argument("--retry-after", type=float, default=d.retry_after)
+    ap.add_argument("--bandwidth", type=float, default=d.bandwidth, help="Bytes/sec per response (0 = unlimited).")
+    ap.add_argument("--p-cut", type=float, default=d.p_cut, help="Share of image bodies cut off halfway.")
+    ap.add_argument("--seed", type=int, default=d.seed)
+    args = ap.parse_args()
+
+    cfg = FakeConfig(apps=args.apps, screenshots=args.screenshots, cover_bytes=args.cover_bytes,
+                     screenshot_bytes=args.screenshot_bytes, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                     p429=args.p429, p5xx=args.p5xx, retry_after=args.retry_after, bandwidth=args.bandwidth,
+                     p_cut=args.p_cut, seed=args.seed)
+    print(f"[INFO] fake steam on http://127.0.0.1:{args.port}  {json.dumps(asdict(cfg))}")
+    print(f"[INFO] export STEAM_BASE_URL=http://127.0.0.1:{args.port}")
+    serve(cfg, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,573 @@
+#!/usr/bin/env python3
+"""
+Genre-agnostic triplet crawler: <APPID>.jpg + <APPID>_gp1.jpg + <APPID>_gp2.jpg.
+
+- Parameterized by target genres with per-genre caps (total triplets per
+  genre folder); one appdetails lookup routes an app into EVERY bucket it
+  qualifies for, so one crawl fills all classes
+- Pooled connections: one aiohttp session for appdetails (paced by the
+  adaptive HostRateLimiter) and one for images (aio_engine.DownloadEngine)
+- Cover and both screenshots download concurrently; the triplet is staged
+  in .tmp_* files and only renamed into place when all three arrived
+- An app that lands in several buckets is downloaded once and hard-linked
+  (copied if linking fails) into the other genre folders
+- appdetails come from the shared SQLite cache when possible; outcomes go to
+  the crawl journal (crawl_state.py), "skipped" apps are retried next run
+- before the crawl, the cache's genre index (every appdetails row any
+  downloader stored) drops apps known not to match and puts known matches
+  first, so only unknown apps cost an appdetails request
+- --derive-to data/raw_256 also writes training-resolution copies (derive.py)
+  of every file that lands in a genre folder
+
+Candidate sources:
+  steamspy  SteamSpy genre lists for the target genres (the list an app comes
+            from counts as that genre, like the old v1 crawler), cached in
+            candidates.py and refreshed in the background once stale
+  applist   IStoreService/GetAppList pages (needs STEAM_WEB_API_KEY); genre
+            comes from appdetails only, resumes from the stored last_appid
+
+Run:
+  python src/download/fetch_triplets.py --genres Strategy=1200 RPG=633 Racing=581 --source steamspy
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Set, Tuple
+
+import requests
+
+from aio_engine import DownloadEngine
+from appdetails_store import DB_PATH, AppDetailsCache
+from blobstore import link_or_copy
+from candidates import MAX_AGE_DAYS, CandidateStore, default_candidates, steamspy_genre
+from crawl_state import DONE, FAILED, SKIPPED, CrawlState
+from derive import Deriver, add_derive_args, deriver_from_args
+from dir_index import DirIndex
+# overridable from the environment, e.g. to run against fake_steam.py
+from endpoints import APP_LIST_URL, APPDETAILS_URL
+from ratelimit import FileCoordinator, HostRateLimiter
+from shards import Shard, in_shard, open_shard_state, parse_shard, shard_root
+from telemetry import add_telemetry_args, default_telemetry, record_response, telemetry_session
+from url_meta import UrlMetaStore
+
+AGE_GATE_COOKIES = {
+    "birthtime": "315532801",
+    "lastagecheckage": "1-January-1980",
+    "wants_mature_content": "1",
+}
+
+TRIPLET_NAMES = ("{appid}.jpg", "{appid}_gp1.jpg", "{appid}_gp2.jpg")
+STAGE_NAMES = ("{appid}.tmp_cover", "{appid}.tmp_gp1", "{appid}.tmp_gp2")
+
+Candidate = Tuple[int, FrozenSet[str]]
+
+
+@dataclass
+class Bucket:
+    genre: str
+    dir: Path
+    cap: int
+    have: int = 0
+    pending: int = 0
+
+    def room(self) -> int:
+        return self.cap - self.have - self.pending
+
+
+def parse_genre_caps(items: Sequence[str]) -> Dict[str, int]:
+    caps: Dict[str, int] = {}
+    for it in items:
+        name, sep, cap = it.partition("=")
+        if not sep or not name or not cap.isdigit():
+            raise SystemExit(f"[ERROR] expected GENRE=CAP, got {it!r}")
+        caps[name] = int(cap)
+    return caps
+
+
+# =========================
+# CANDIDATES (sync, before the crawl)
+# =========================
+def get_json(session: requests.Session, url: str, params: dict | None, tries: int = 6, base_sleep: float = 0.8):
+    last = None
+    for i in range(tries):
+        try:
+            r = session.get(url, params=params, timeout=60)
+            record_response(r)
+            if r.status_code in (429, 500, 502, 503, 504):
+                default_telemetry().retry(url, r.status_code)
+                time.sleep(base_sleep * (2 ** i))
+                continue
+            r.raise_for_status()
+            if not r.text:
+                return None
+            return r.json()
+        except Exception as e:
+            last = e
+            default_telemetry().retry(url, "error")
+            time.sleep(base_sleep * (2 ** i))
+    raise last
+
+
+def steamspy_candidates(session: requests.Session, genres: Iterable[str], store: Optional[CandidateStore] = None,
+                        refresh: bool = False) -> List[Candidate]:
+    """Genre lists come from the candidate store; only missing ones wait for SteamSpy."""
+    store = store or default_candidates()
+    hints: Dict[int, set] = {}
+    for g in genres:
+        for a in store.get(g, lambda genre: steamspy_genre(genre, session), refresh):
+            hints.setdefault(a, set()).add(g)
+    return [(a, frozenset(h)) for a, h in hints.items()]
+
+
+def get_applist_page(session: requests.Session, key: str, last_appid: int, max_results: int):
+    params = {
+        "key": key,
+        "include_games": "1",
+        "include_dlc": "0",
+        "include_software": "0",
+        "include_videos": "0",
+        "include_hardware": "0",
+        "max_results": str(max_results),
+        "last_appid": str(last_appid),
+    }
+    data = get_json(session, APP_LIST_URL, params=params, tries=6)
+    resp = data.get("response", {})
+    apps = resp.get("apps", [])
+    out = []
+    last = last_appid
+    for a in apps:
+        appid = a.get("appid")
+        if isinstance(appid, int) and appid > 0:
+            out.append(appid)
+            if appid > last:
+                last = appid
+    have_more = bool(resp.get("have_more_results"))
+    return out, last, have_more
+
+
+def applist_candidates(session: requests.Session, key: str, state: CrawlState,
+                       pages: int, page_size: int) -> List[Candidate]:
+    last_appid = int(state.get("last_appid", 0))
+    out: List[Candidate] = []
+    have_more = True
+    n = 0
+    while have_more and n < pages:
+        page, last_appid, have_more = get_applist_page(session, key, last_appid, page_size)
+        n += 1
+        out.extend((a, frozenset()) for a in page)
+        state.set("last_appid", last_appid)
+        print(f"[INFO] applist page={n} got={len(page)} last_appid={last_appid} have_more={have_more}")
+    return out
+
+
+# =========================
+# ROUTING
+# =========================
+def store_genres(details: dict) -> set:
+    """Lower-cased Steam genre descriptions, only for type == game."""
+    if details.get("type") != "game":
+        return set()
+    out = set()
+    for g in details.get("genres") or []:
+        if isinstance(g, dict):
+            d = g.get("description")
+            if isinstance(d, str):
+                out.add(d.lower())
+    return out
+
+
+def pick_urls(details: dict) -> Tuple[Optional[Tuple[str, str, str]], str]:
+    header = details.get("header_image")
+    if not isinstance(header, str) or not header:
+        return None, "no_header"
+    urls = []
+    for s in details.get("screenshots") or []:
+        if isinstance(s, dict):
+            u = s.get("path_full") or s.get("path_thumbnail")
+            if isinstance(u, str) and u:
+                urls.append(u)
+        if len(urls) >= 2:
+            break
+    if len(urls) < 2:
+        return None, "no_screens"
+    return (header, urls[0], urls[1]), ""
+
+
+# =========================
+# CRAWLER
+# =========================
+class TripletCrawler:
+    def __init__(
+        self,
+        buckets: Dict[str, Bucket],
+        state: CrawlState,
+        cache: AppDetailsCache,
+        limiter: HostRateLimiter,
+        workers: int = 16,
+        min_bytes: int = 1000,
+        deriver: Optional[Deriver] = None,
+    ):
+        self.buckets = buckets
+        self.by_lower = {g.lower(): b for g, b in buckets.items()}
+        self.state = state
+        self.cache = cache
+        self.limiter = limiter
+        self.workers = max(1, workers)
+        self.min_bytes = min_bytes
+        self.deriver = deriver
+        for b in buckets.values():
+            b.dir.mkdir(parents=True, exist_ok=True)
+        self.index = DirIndex(Path(os.path.commonpath([str(b.dir) for b in buckets.values()])))
+        for b in buckets.values():
+            b.have = self.index.count_triplets(b.dir)
+        self.validators = UrlMetaStore(cache.path)
+        self.stats = {"tried": 0, "new": 0, "links": 0}
+        self.meta: Optional[DownloadEngine] = None
+        self.img: Optional[DownloadEngine] = None
+
+    def _saved(self, p: Path) -> None:
+        self.index.note(p)
+        if self.deriver is not None:
+            self.deriver.submit(p)
+
+    def full(self) -> bool:
+        return all(b.have >= b.cap for b in self.buckets.values())
+
+    async def _details(self, appid: int) -> Optional[dict]:
+        hit, inner = self.cache.get_details(appid, require_genres=True)
+        if hit:
+            return inner
+        params = {"appids": str(appid), "l": "english", "cc": "us", "filters": "basic,genres,screenshots"}
+        data = await self.meta.get_json(APPDETAILS_URL, params=params)
+        node = data.get(str(appid)) if isinstance(data, dict) else None
+        if not isinstance(node, dict):
+            return None
+        self.cache.put_payload(appid, node, with_genres=True)
+        inner = node.get("data")
+        return inner if node.get("success") and isinstance(inner, dict) else None
+
+    def _route(self, details: dict, hints: FrozenSet[str]) -> List[Bucket]:
+        names = store_genres(details) | {h.lower() for h in hints}
+        return [self.by_lower[n] for n in names if n in self.by_lower]
+
+    async def _download(self, appid: int, urls: Tuple[str, str, str], d: Path) -> Optional[str]:
+        """None once the triplet is in place, else why a part was rejected."""
+        stage = [d / n.format(appid=appid) for n in STAGE_NAMES]
+        try:
+            res = await asyncio.gather(
+                *(self.img.fetch(u, p, self.min_bytes) for u, p in zip(urls, stage)),
+                return_exceptions=True,
+            )
+            for part, r in zip(("cover", "gp1", "gp2"), res):
+                if isinstance(r, BaseException):
+                    return f"{part}:error:{type(r).__name__}"
+                if r is not None:
+                    return f"{part}:{r}"
+            for p, n in zip(stage, TRIPLET_NAMES):
+                dst = d / n.format(appid=appid)
+                p.replace(dst)
+                self.validators.move(p, dst)
+                self._saved(dst)
+            return None
+        finally:
+            # resumable .part files are kept by fetch(); a failed or cancelled
+            # app is not resumed from here, so they go too
+            for p in stage:
+                for f in (p, p.with_name(p.name + ".part"), p.with_name(p.name + ".part.json")):
+                    f.unlink(missing_ok=True)
+
+    async def make_triplet(self, appid: int, hints: FrozenSet[str]) -> Tuple[str, str]:
+        details = await self._details(appid)
+        if details is None:
+            return FAILED, "no_details"
+
+        targets = self._route(details, hints)
+        if not targets:
+            return SKIPPED, "no_genre_match"
+
+        have = [b for b in targets if self.index.has_triplet(b.dir, appid)]
+        missing = [b for b in targets if b not in have]
+        if not missing:
+            return DONE, "already"
+        todo = [b for b in missing if b.room() > 0]
+        if not todo:
+            return SKIPPED, "buckets_full"
+
+        src: Optional[Bucket] = have[0] if have else None
+        urls = None
+        if src is None:
+            urls, reason = pick_urls(details)
+            if urls is None:
+                return FAILED, reason
+
+        for b in todo:
+            b.pending += 1
+        try:
+            if src is None:
+                src = todo[0]
+                reason = await self._download(appid, urls, src.dir)
+                if reason is not None:
+                    return FAILED, f"dl:{reason}"
+                src.have += 1
+                self.stats["new"] += 1
+            for b in todo:
+                if b is src:
+                    continue
+                for n in TRIPLET_NAMES:
+                    dst = b.dir / n.format(appid=appid)
+                    link_or_copy(src.dir / n.format(appid=appid), dst)
+                    # a revalidation replacing the source re-links this copy
+                    self.validators.link(src.dir / n.format(appid=appid), dst)
+                    self._saved(dst)
+                b.have += 1
+                self.stats["links"] += 1
+        finally:
+            for b in todo:
+                b.pending -= 1
+        return DONE, ",".join(b.genre for b in todo)
+
+    def progress(self) -> str:
+        return " ".join(f"{b.genre}={b.have}/{b.cap}" for b in self.buckets.values())
+
+    async def _worker(self, it, target_met: asyncio.Event) -> None:
+        for appid, hints in it:
+            if self.full():
+                break
+            try:
+                outcome, reason = await self.make_triplet(appid, hints)
+            except Exception as e:
+                outcome, reason = FAILED, f"error:{type(e).__name__}"
+            self.state.record(appid, outcome, reason)
+            self.stats["tried"] += 1
+            if outcome == DONE:
+                print(f"[OK] appid={appid} {reason}  {self.progress()}")
+            elif self.stats["tried"] % 500 == 0:
+                print(f"[INFO] progress tried={self.stats['tried']} new={self.stats['new']}  {self.progress()}")
+        if self.full():
+            target_met.set()
+
+    async def run(self, candidates: Iterable[Candidate]) -> Dict:
+        """Workers pull from one shared iterator, so at most `workers` apps are
+        in flight and nothing is queued ahead. Once every cap is met the
+        remaining in-flight apps are cancelled (their staged files are removed
+        and they stay unjournaled, so the next run retries them)."""
+        it = iter(candidates)
+        target_met = asyncio.Event()
+        async with DownloadEngine(concurrency=self.workers, per_host=self.workers,
+                                  cookies=AGE_GATE_COOKIES, limiter=self.limiter) as meta, \
+                DownloadEngine(concurrency=self.workers * 3, per_host=self.workers * 3,
+                               validators=self.validators) as img:
+            self.meta, self.img = meta, img
+            workers = [asyncio.ensure_future(self._worker(it, target_met)) for _ in range(self.workers)]
+            all_done = asyncio.gather(*workers, return_exceptions=True)
+            stop = asyncio.ensure_future(target_met.wait())
+            try:
+                await asyncio.wait([all_done, stop], return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for w in workers:
+                    w.cancel()
+                stop.cancel()
+                await asyncio.gather(all_done, stop, return_exceptions=True)
+        if target_met.is_set():
+            self.stats["cancelled"] = sum(1 for w in workers if w.cancelled())
+        return self.stats
+
+
+def prefilter(candidates: Sequence[Candidate], index: Dict,
+              genres: Iterable[str]) -> Tuple[List[Candidate], List[Candidate], int]:
+    """Split candidates by the cached genre index: (known matches, unknown, dropped count).
+
+    Known matches route without an appdetails request; apps whose cached type
+    and genres miss every target (or that have no details) are dropped
+    without touching the network. A known type other than game decides on
+    its own, cached genres or not. Only unknown apps need a lookup.
+    """
+    targets = {g.lower() for g in genres}
+    known: List[Candidate] = []
+    unknown: List[Candidate] = []
+    dropped = 0
+    for c in candidates:
+        appid, hints = c
+        if appid not in index:
+            unknown.append(c)
+            continue
+        entry = index[appid]
+        if entry is None:
+            dropped += 1
+            continue
+        typ, app_genres = entry
+        # same rule as _route(): list hints count, store genres only for games
+        if any(h.lower() in targets for h in hints):
+            known.append(c)
+        elif typ == "game" and app_genres is None:
+            unknown.append(c)
+        elif typ == "game" and not app_genres.isdisjoint(targets):
+            known.append(c)
+        else:
+            dropped += 1
+    return known, unknown, dropped
+
+
+def sweep_stages(dirs: Iterable[Path], appids: Set[int]) -> int:
+    """Remove stage files (and their .part/.part.json) of the given appids; returns how many."""
+    n = 0
+    for d in dirs:
+        try:
+            with os.scandir(d) as it:
+                names = [e.name for e in it if ".tmp_" in e.name]
+        except OSError:
+            continue
+        for name in names:
+            base = name.partition(".tmp_")[0]
+            if base.isdigit() and int(base) in appids:
+                (Path(d) / name).unlink(missing_ok=True)
+                n += 1
+    return n
+
+
+def shard_buckets(buckets: Dict[str, Bucket], shard: Optional[Shard]) -> Dict[str, Bucket]:
+    """Buckets of one shard: output under the shard tree, cap an even share of what the merged tree lacks.
+
+    The crawler counts the shard's own triplets against its cap, so those are
+    added back: a triplet already merged into the main tree must not count
+    once in the merged tree and again in the shard tree.
+    """
+    if shard is None:
+        return buckets
+
+    def triplets(d: Path) -> Set[str]:
+        return {a.base for a in DirIndex(d).apps(d) if a.cover is not None and 1 in a.gps and 2 in a.gps}
+
+    out = {}
+    for g, b in buckets.items():
+        d = shard_root(b.dir.parent, shard) / b.dir.name
+        own = triplets(d)
+        missing = max(0, b.cap - len(triplets(b.dir) | own))
+        out[g] = Bucket(genre=g, dir=d, cap=len(own) + -(-missing // shard[1]))
+    return out
+
+
+def crawl(
+    buckets: Dict[str, Bucket],
+    state: CrawlState,
+    candidates: Sequence[Candidate],
+    cache: AppDetailsCache,
+    limiter: HostRateLimiter,
+    workers: int = 16,
+    seed: int = 42,
+    deriver: Optional[Deriver] = None,
+    shard: Optional[Shard] = None,
+) -> Dict:
+    """Filter candidates against the shard, the journal and the cached genres, then crawl to the caps."""
+    if shard is not None:
+        candidates = [c for c in candidates if in_shard(c[0], shard)]
+        print(f"[INFO] shard {shard[0]}/{shard[1]}: {len(candidates)} candidates")
+    crawler = TripletCrawler(buckets, state, cache, limiter, workers=workers, deriver=deriver)
+    for b in buckets.values():
+        print(f"[INFO] {b.genre}: {b.have}/{b.cap} triplets in {b.dir}")
+    if crawler.full():
+        print("[INFO] Already reached target.")
+        return crawler.stats
+
+    # done/failed are final; skipped (wrong genre, full bucket) get another look
+    finished = state.with_outcome(DONE, FAILED)
+    swept = sweep_stages((b.dir for b in buckets.values()), state.failed())
+    if swept:
+        print(f"[INFO] Removed {swept} leftover partial downloads of failed apps")
+    on_disk = [a for a, _ in candidates if a not in finished
+               and all(crawler.index.has_triplet(b.dir, a) for b in buckets.values())]
+    state.record_many(on_disk, DONE, "on_disk")
+    finished.update(on_disk)
+    todo = [c for c in candidates if c[0] not in finished]
+
+    # apps with cached details go first and need no request; known misses never do
+    t0 = time.perf_counter()
+    known, unknown, dropped = prefilter(todo, cache.genre_index(), buckets.keys())
+    rng = random.Random(seed)
+    rng.shuffle(known)
+    rng.shuffle(unknown)
+    todo = known + unknown
+    print(f"[INFO] Candidate appids: {len(todo)} (cached match={len(known)} unknown={len(unknown)}, "
+          f"dropped by cached genres={dropped} in {time.perf_counter() - t0:.1f}s)")
+
+    stats = asyncio.run(crawler.run(todo))
+    print(f"[DONE] tried={stats['tried']} new_triplets={stats['new']} linked={stats['links']}  {crawler.progress()}")
+    return stats
+
+
+def add_crawl_args(ap: argparse.ArgumentParser, workers: int = 16) -> None:
+    ap.add_argument("--workers", type=int, default=workers, help="Apps in flight at once.")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--rate", type=float, default=1.0 / 0.6,
+                    help="Initial appdetails requests/sec; adapts (AIMD) from there (default: ~1.67).")
+    ap.add_argument("--max-rate", type=float, default=4.0)
+    ap.add_argument("--rate-state", type=Path, default=None,
+                    help="Shared limiter state file, lets several crawler processes share one budget.")
+    ap.add_argument("--cache-db", type=Path, default=DB_PATH)
+    ap.add_argument("--shard", type=parse_shard, default=None, metavar="i/N",
+                    help="Only crawl appids that hash to shard i of N (0-based), with a per-shard journal "
+                         "and output tree; merge them with shards.py.")
+    ap.add_argument("--candidates-max-age", type=float, default=MAX_AGE_DAYS,
+                    help="Days before a cached SteamSpy genre list is refreshed (in the background).")
+    ap.add_argument("--refresh-candidates", action="store_true", help="Refetch the SteamSpy genre lists now.")
+    add_derive_args(ap)
+    add_telemetry_args(ap)
+
+
+def candidates_from_args(args) -> CandidateStore:
+    return CandidateStore(args.cache_db, max_age_days=args.candidates_max_age)
+
+
+def limiter_from_args(args) -> HostRateLimiter:
+    return HostRateLimiter(
+        rate=args.rate, max_rate=args.max_rate,
+        coordinator=FileCoordinator(args.rate_state) if args.rate_state else None,
+    )
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--genres", nargs="+", required=True, help="Targets as GENRE=CAP, e.g. Strategy=1200 RPG=633.")
+    ap.add_argument("--out-root", type=Path, default=Path("data/raw"), help="Genre folders go under here.")
+    ap.add_argument("--source", choices=("steamspy", "applist"), default="steamspy")
+    ap.add_argument("--state", type=Path, default=Path("outputs/triplets_state.jsonl"))
+    ap.add_argument("--page-size", type=int, default=50000)
+    ap.add_argument("--pages", type=int, default=6)
+    add_crawl_args(ap)
+    args = ap.parse_args()
+
+    caps = parse_genre_caps(args.genres)
+    buckets = {g: Bucket(genre=g, dir=args.out_root / g, cap=c) for g, c in caps.items()}
+    buckets = shard_buckets(buckets, args.shard)
+
+    state = open_shard_state(args.state, args.shard)
+    deriver = deriver_from_args(args, shard_root(args.out_root, args.shard))
+    try:
+        with telemetry_session(args, "triplets"):
+            session = requests.Session()
+            if args.source == "applist":
+                key = os.environ.get("STEAM_WEB_API_KEY", "").strip()
+                if not key:
+                    raise SystemExit("Missing STEAM_WEB_API_KEY environment variable")
+                candidates = applist_candidates(session, key, state, args.pages, args.page_size)
+            else:
+                candidates = steamspy_candidates(session, caps.keys(), candidates_from_args(args),
+                                                 args.refresh_candidates)
+            crawl(buckets, state, candidates, AppDetailsCache(args.cache_db), limiter_from_args(args),
+                  workers=args.workers, seed=args.seed, deriver=deriver, shard=args.shard)
+    finally:
+        if deriver:
+            deriver.close()
+        state.close()
+    print(f"state={state.path}")
+
+
+if __name__ == "__main__":
+    main()
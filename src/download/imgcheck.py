@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Cheap image checks for the download stream (no decoding, no PIL).
+
+- sniff(head): image type from the magic bytes of the first chunk, so HTML
+  error pages and other junk are aborted after a few bytes
+- dimensions(path, kind): width/height from the file header (JPEG SOF marker,
+  PNG IHDR, GIF screen descriptor, WebP VP8/VP8L/VP8X)
+- check_file(path, kind, min_side): reason string for a file that must not be
+  renamed into place, or None
+
+Reasons are short tokens that end up in url_meta and the crawl journals.
+"""
+
+from __future__ import annotations
+
+import struct
+from pathlib import Path
+from typing import Optional, Tuple
+
+# a rejected body is worth retrying only if the transfer itself went wrong
+NOT_IMAGE = "not_image"
+CONTENT_TYPE = "content_type"
+TRUNCATED = "truncated"
+TOO_SMALL = "too_small"
+BAD_HEADER = "bad_header"
+TINY = "tiny_dims"
+
+TRANSIENT = frozenset({TRUNCATED})
+
+SNIFF_BYTES = 12
+
+# SOFn markers carry the frame size; C4 (DHT), C8 (JPG) and CC (DAC) do not
+_SOF = frozenset({0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF})
+_NO_LENGTH = frozenset({0x01, 0xD8, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7})
+
+
+def sniff(head: bytes) -> Optional[str]:
+    """jpeg/png/gif/webp from the first SNIFF_BYTES bytes, None otherwise."""
+    if head[:3] == b"\xff\xd8\xff":
+        return "jpeg"
+    if head[:8] == b"\x89PNG\r\n\x1a\n":
+        return "png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def acceptable_content_type(value: Optional[str]) -> bool:
+    """Servers that send no type or a generic binary one get the magic check only."""
+    if not value:
+        return True
+    ctype = value.split(";", 1)[0].strip().lower()
+    return ctype.startswith("image/") or ctype in ("application/octet-stream", "binary/octet-stream")
+
+
+def _jpeg_size(f) -> Optional[Tuple[int, int]]:
+    f.seek(2)
+    while True:
+        if f.read(1) != b"\xff":
+            return None
+        marker = f.read(1)
+        while marker == b"\xff":  # fill bytes
+            marker = f.read(1)
+        if not marker:
+            return None
+        m = marker[0]
+        if m in _NO_LENGTH:
+            continue
+        seg = f.read(2)
+        if len(seg) < 2:
+            return None
+        length = struct.unpack(">H", seg)[0]
+        if m in _SOF:
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            h, w = struct.unpack(">HH", data[1:5])
+            return w, h
+        if m == 0xDA:  # scan data before any frame header
+            return None
+        f.seek(length - 2, 1)
+
+
+def _webp_size(head: bytes) -> Optional[Tuple[int, int]]:
+    chunk = head[12:16]
+    if chunk == b"VP8 " and head[23:26] == b"\x9d\x01\x2a":
+        w, h = struct.unpack("<HH", head[26:30])
+        return w & 0x3FFF, h & 0x3FFF
+    if chunk == b"VP8L" and head[20:21] == b"\x2f":
+        bits = struct.unpack("<I", head[21:25])[0]
+        return 1 + (bits & 0x3FFF), 1 + ((bits >> 14) & 0x3FFF)
+    if chunk == b"VP8X":
+        w = int.from_bytes(head[24:27], "little") + 1
+        h = int.from_bytes(head[27:30], "little") + 1
+        return w, h
+    return None
+
+
+def dimensions(path: Path, kind: str) -> Optional[Tuple[int, int]]:
+    """(width, height) parsed from the header, None if it does not parse."""
+    try:
+        with open(path, "rb") as f:
+            if kind == "jpeg":
+                return _jpeg_size(f)
+            head = f.read(32)
+    except (OSError, struct.error):
+        return None
+    try:
+        if kind == "png" and head[12:16] == b"IHDR":
+            return struct.unpack(">II", head[16:24])
+        if kind == "gif":
+            return struct.unpack("<HH", head[6:10])
+        if kind == "webp":
+            return _webp_size(head)
+    except struct.error:
+        return None
+    return None
+
+
+def _jpeg_complete(path: Path) -> bool:
+    # EOI near the end; a little trailing padding after it is common
+    with open(path, "rb") as f:
+        f.seek(0, 2)
+        f.seek(max(0, f.tell() - 1024))
+        return b"\xff\xd9" in f.read()
+
+
+def check_file(path: Path, kind: str, min_side: int = 0) -> Optional[str]:
+    """Reason the finished file must be rejected, or None if it looks fine."""
+    # first: a cut-off transfer (no Content-Length) must stay retryable
+    if kind == "jpeg" and not _jpeg_complete(path):
+        return TRUNCATED
+    size = dimensions(path, kind)
+    if size is None or min(size) <= 0:
+        return BAD_HEADER
+    if min(size) < min_side:
+        return TINY
+    return None
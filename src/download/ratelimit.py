@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Adaptive per-host rate limiter (token bucket + AIMD).
+
+- reserve(host) books the next slot and returns how long to wait; the lock is
+  only held for that bookkeeping, callers sleep outside of it
+- on_success raises the rate additively, on_throttle (429 / Retry-After) cuts
+  it multiplicatively and blocks the host until Retry-After (seconds or an
+  HTTP-date) has passed; callers queued behind a block leave at the rate
+- with a FileCoordinator the bucket state lives in a small JSON file guarded
+  by an OS file lock, so several crawler processes share one budget per host
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+from urllib.parse import urlparse
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def host_of(url: str) -> str:
+    return urlparse(url).netloc.lower()
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from Retry-After: delay-seconds or an HTTP-date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, when.timestamp() - time.time())
+
+
+class FileCoordinator:
+    """Shares bucket state between processes through <path> + <path>.lock."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock_path = self.path.with_suffix(self.path.suffix + ".lock")
+
+    @contextmanager
+    def transaction(self) -> Iterator[Dict[str, dict]]:
+        with open(self.lock_path, "a+b") as lf:
+            if fcntl is not None:
+                fcntl.flock(lf.fileno(), fcntl.LOCK_EX)
+            else:
+                lf.seek(0)
+                msvcrt.locking(lf.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                try:
+                    states = json.loads(self.path.read_text(encoding="utf-8"))
+                except Exception:
+                    states = {}
+                yield states
+                tmp = self.path.with_suffix(self.path.suffix + f".{os.getpid()}.tmp")
+                tmp.write_text(json.dumps(states), encoding="utf-8")
+                tmp.replace(self.path)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lf.fileno(), fcntl.LOCK_UN)
+                else:
+                    lf.seek(0)
+                    msvcrt.locking(lf.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class HostRateLimiter:
+    def __init__(
+        self,
+        rate: float = 1.0 / 0.6,
+        burst: float = 1.0,
+        min_rate: float = 0.05,
+        max_rate: float = 10.0,
+        increase: float = 0.02,
+        decrease: float = 0.5,
+        coordinator: Optional[FileCoordinator] = None,
+    ):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.min_rate = min_rate
+        self.max_rate = max(max_rate, rate)
+        self.increase = increase
+        self.decrease = decrease
+        self.coordinator = coordinator
+        self._lock = threading.Lock()
+        self._states: Dict[str, dict] = {}
+
+    @contextmanager
+    def _state(self, host: str) -> Iterator[dict]:
+        if self.coordinator is not None:
+            with self.coordinator.transaction() as states:
+                yield states.setdefault(host, self._new_state())
+        else:
+            with self._lock:
+                yield self._states.setdefault(host, self._new_state())
+
+    def _new_state(self) -> dict:
+        return {"tokens": self.burst, "last": time.time(), "rate": self.rate, "blocked_until": 0.0}
+
+    def reserve(self, host: str) -> float:
+        """Take one token for host and return the seconds to wait before using it."""
+        with self._state(host) as st:
+            now = time.time()
+            if st["blocked_until"] > now:
+                # the bucket restarts empty when the block ends, so callers
+                # queued during Retry-After leave one by one at the rate
+                if st["last"] < st["blocked_until"]:
+                    st["tokens"] = min(st["tokens"] + 1.0, 1.0)
+                    st["last"] = st["blocked_until"]
+            elif now > st["last"]:
+                st["tokens"] = min(self.burst, st["tokens"] + (now - st["last"]) * st["rate"])
+                st["last"] = now
+            st["tokens"] -= 1.0
+            # negative tokens = requests already booked ahead of us, counted from last
+            wait = -st["tokens"] / st["rate"] if st["tokens"] < 0 else 0.0
+            return max(0.0, st["last"] - now) + wait
+
+    def acquire(self, host: str) -> None:
+        delay = self.reserve(host)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self, host: str) -> None:
+        delay = self.reserve(host)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def on_success(self, host: str) -> None:
+        with self._state(host) as st:
+            st["rate"] = min(self.max_rate, st["rate"] + self.increase)
+
+    def on_throttle(self, host: str, retry_after: Optional[float] = None) -> None:
+        with self._state(host) as st:
+            st["rate"] = max(self.min_rate, st["rate"] * self.decrease)
+            # drop queued credit so the lower rate applies right away
+            st["tokens"] = min(st["tokens"], 0.0)
+            if retry_after:
+                st["blocked_until"] = max(st["blocked_until"], time.time() + retry_after)
+
+    def current_rate(self, host: str) -> float:
+        with self._state(host) as st:
+            return st["rate"]
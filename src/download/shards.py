@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Sharded crawling across machines: appid partitions and merging them back.
+
+Per-IP rate limits cap one crawler, so more throughput means more machines.
+With --shard i/N (0 <= i < N) a triplet crawler only takes the candidates
+whose appid hashes to i, which is stable across machines and runs, so N
+crawlers with the same N never look at the same app. Each shard keeps its
+own journal and file tree:
+
+  state   outputs/strategy_state_v2.jsonl -> outputs/strategy_state_v2.shard-1-of-4.jsonl
+  tree    data/raw/Strategy               -> data/raw.shard-1-of-4/Strategy
+
+Copy the shard journals, trees and (optionally) appdetails caches to one
+machine and merge them:
+
+  python src/download/shards.py --states outputs/strategy_state_v2.shard-*.jsonl \\
+      --into-state outputs/strategy_state_v2.jsonl \\
+      --trees data/raw.shard-*-of-4 --into-tree data/raw \\
+      --caches shard*/appdetails.sqlite --into-cache data/splits/appdetails.sqlite
+
+Conflicts are reported, never resolved silently:
+- an appid journaled done by one source and failed by another; done is
+  kept (skipped/seen entries are simply superseded: done > failed > skipped)
+- the same relative path with different bytes in two trees; the file
+  already in the target (or the first shard's) stays
+- differing journal keys; last_appid is not one, it becomes the shards'
+  minimum, so paging resumes where the slowest shard was
+--strict exits 1 before writing anything when there is a conflict.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sqlite3
+import zlib
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from appdetails_store import DB_PATH, AppDetailsCache
+from blobstore import hash_file, iter_images, link_or_copy
+from crawl_state import DONE, FAILED, SEEN, SKIPPED, CrawlState, open_state
+
+Shard = Tuple[int, int]  # (index, count)
+
+# higher wins when sources disagree
+RANK = {SEEN: 0, SKIPPED: 1, FAILED: 2, DONE: 3}
+MAX_EXAMPLES = 20
+
+
+def parse_shard(text: str) -> Shard:
+    i, sep, n = text.partition("/")
+    if not sep or not i.isdigit() or not n.isdigit() or not 0 <= int(i) < int(n):
+        raise argparse.ArgumentTypeError(f"expected i/N with 0 <= i < N, got {text!r}")
+    return int(i), int(n)
+
+
+def shard_of(appid: int, count: int) -> int:
+    # crc32, not hash(): the same on every machine and Python version
+    return zlib.crc32(str(int(appid)).encode("ascii")) % count
+
+
+def in_shard(appid: int, shard: Optional[Shard]) -> bool:
+    return shard is None or shard_of(appid, shard[1]) == shard[0]
+
+
+def shard_suffix(shard: Shard) -> str:
+    return f"shard-{shard[0]}-of-{shard[1]}"
+
+
+def shard_state_path(path: Path, shard: Optional[Shard]) -> Path:
+    """outputs/x.jsonl -> outputs/x.shard-i-of-N.jsonl"""
+    path = Path(path)
+    if shard is None:
+        return path
+    return path.with_name(f"{path.stem}.{shard_suffix(shard)}{path.suffix}")
+
+
+def shard_root(root: Path, shard: Optional[Shard]) -> Path:
+    """data/raw -> data/raw.shard-i-of-N (a sibling, so class folders under data/raw stay clean)"""
+    root = Path(root)
+    if shard is None:
+        return root
+    return root.with_name(f"{root.name}.{shard_suffix(shard)}")
+
+
+def open_shard_state(path: Path, shard: Optional[Shard]) -> CrawlState:
+    """Journal of one shard; a new one starts from the shard's entries of the unsharded journal."""
+    if shard is None:
+        return open_state(path)
+    base = Path(path)
+    base = base.with_suffix(".jsonl") if base.suffix == ".json" else base
+    own = shard_state_path(base, shard)
+    fresh = not own.exists()
+    state = open_state(own)
+    if fresh and base.exists():
+        with CrawlState(base) as old:
+            seeded, keys, _ = merge_states([old], state, shard)
+        apply_states(state, seeded, keys)
+        print(f"[INFO] {own.name}: {len(seeded)} appids carried over from {base.name}")
+    return state
+
+
+# =========================
+# STATES
+# =========================
+def merge_states(sources: Sequence[CrawlState], target: CrawlState,
+                 shard: Optional[Shard] = None) -> Tuple[Dict[int, Tuple[str, str]], Dict, List[str]]:
+    """(appid updates, key updates, conflict messages) to apply to target, optionally one shard's appids only."""
+    conflicts: List[str] = []
+    merged: Dict[int, Tuple[str, str]] = {}
+    origin: Dict[int, str] = {}
+    for src in sources:
+        for appid, (outcome, reason) in src.outcomes.items():
+            if not in_shard(appid, shard):
+                continue
+            have = merged.get(appid) or target.outcome(appid)
+            if have is None:
+                merged[appid], origin[appid] = (outcome, reason), src.path.name
+                continue
+            if {have[0], outcome} == {DONE, FAILED}:
+                conflicts.append(f"appid {appid}: {have[0]}({origin.get(appid, 'target')}) "
+                                 f"vs {outcome}({src.path.name})")
+            if RANK.get(outcome, 0) > RANK.get(have[0], 0):
+                merged[appid], origin[appid] = (outcome, reason), src.path.name
+
+    keys: Dict = {}
+    for src in sources:
+        for k, v in src.kv.items():
+            if k == "last_appid":
+                # shards page the same app list; resume where the slowest one is
+                keys[k] = min(int(keys.get(k, v)), int(v))
+                continue
+            have = keys.get(k, target.get(k))
+            if have is None or have == v:
+                keys[k] = v
+            else:
+                conflicts.append(f"key {k!r}: {have!r} vs {v!r}({src.path.name}), keeping {have!r}")
+    return merged, {k: v for k, v in keys.items() if target.get(k) != v}, conflicts
+
+
+def apply_states(target: CrawlState, merged: Dict[int, Tuple[str, str]], keys: Dict) -> None:
+    groups: Dict[Tuple[str, str], List[int]] = defaultdict(list)
+    for appid, (outcome, reason) in merged.items():
+        if target.outcome(appid) != (outcome, reason):
+            groups[(outcome, reason)].append(appid)
+    for (outcome, reason), appids in groups.items():
+        target.record_many(appids, outcome, reason)
+    for k, v in keys.items():
+        target.set(k, v)
+    target.compact()
+
+
+# =========================
+# TREES
+# =========================
+def plan_trees(trees: Sequence[Path], into: Path) -> Tuple[List[Tuple[Path, Path]], int, List[str]]:
+    """([(src, dst) to link], identical files skipped, conflict messages)."""
+    todo: Dict[str, Path] = {}
+    same, conflicts = 0, []
+
+    def identical(a: Path, b: Path) -> bool:
+        sa, sb = a.stat(), b.stat()
+        if os.path.samestat(sa, sb):
+            return True
+        return sa.st_size == sb.st_size and hash_file(a) == hash_file(b)
+
+    for tree in trees:
+        tree = Path(tree)
+        for e in iter_images(tree):
+            src = Path(e.path)
+            rel = src.relative_to(tree).as_posix()
+            other = todo.get(rel)
+            if other is None and (into / rel).exists():
+                other = into / rel
+            if other is None:
+                todo[rel] = src
+            elif identical(src, other):
+                same += 1
+            else:
+                conflicts.append(f"{rel}: {src} differs from {other}")
+    return [(src, into / rel) for rel, src in todo.items()], same, conflicts
+
+
+# =========================
+# APPDETAILS CACHES
+# =========================
+def merge_caches(caches: Iterable[Path], into: Path) -> int:
+    """Copy appdetails rows into the target cache; the newer fetch of an app wins."""
+    AppDetailsCache(into)  # creates the schema in a new target
+    conn = sqlite3.connect(into, timeout=30.0, isolation_level=None)
+    total = 0
+    try:
+        for i, db in enumerate(caches):
+            conn.execute(f"ATTACH DATABASE ? AS s{i}", (str(db),))
+            before = conn.total_changes
+            conn.execute(
+                f"INSERT INTO appdetails SELECT * FROM s{i}.appdetails WHERE true "
+                "ON CONFLICT(appid) DO UPDATE SET fetched_at = excluded.fetched_at, success = excluded.success, "
+                "type = excluded.type, genres = excluded.genres, header_image = excluded.header_image, "
+                "screenshots = excluded.screenshots, payload = excluded.payload "
+                "WHERE excluded.fetched_at > appdetails.fetched_at"
+            )
+            total += conn.total_changes - before
+            conn.execute(f"DETACH DATABASE s{i}")
+    finally:
+        conn.close()
+    return total
+
+
+def report(title: str, conflicts: List[str]) -> None:
+    if not conflicts:
+        return
+    print(f"[CONFLICT] {title}: {len(conflicts)}")
+    for c in conflicts[:MAX_EXAMPLES]:
+        print(f"  {c}")
+    if len(conflicts) > MAX_EXAMPLES:
+        print(f"  ... {len(conflicts) - MAX_EXAMPLES} more")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--states", type=Path, nargs="*", default=[], help="Shard journals to merge.")
+    ap.add_argument("--into-state", type=Path, default=None, help="Merged journal (created if missing).")
+    ap.add_argument("--trees", type=Path, nargs="*", default=[], help="Shard trees, e.g. data/raw.shard-*-of-4.")
+    ap.add_argument("--into-tree", type=Path, default=None, help="Merged tree, e.g. data/raw.")
+    ap.add_argument("--caches", type=Path, nargs="*", default=[], help="appdetails SQLite files of the shards.")
+    ap.add_argument("--into-cache", type=Path, default=DB_PATH)
+    ap.add_argument("--strict", action="store_true", help="Write nothing and exit 1 if anything conflicts.")
+    ap.add_argument("--dry-run", action="store_true", help="Only report what would be merged.")
+    args = ap.parse_args()
+    if args.states and args.into_state is None:
+        raise SystemExit("[ERROR] --states needs --into-state")
+    if args.trees and args.into_tree is None:
+        raise SystemExit("[ERROR] --trees needs --into-tree")
+
+    sources = [CrawlState(p) for p in args.states]
+    target = open_state(args.into_state) if args.states else None
+    try:
+        n_conflicts = 0
+        if target is not None:
+            merged, keys, conflicts = merge_states(sources, target)
+            report("journal", conflicts)
+            n_conflicts += len(conflicts)
+            print(f"[STATE] {len(sources)} journals: {len(merged)} appids, {len(keys)} keys to merge")
+        links: List[Tuple[Path, Path]] = []
+        if args.trees:
+            links, same, conflicts = plan_trees(args.trees, args.into_tree)
+            report("files", conflicts)
+            n_conflicts += len(conflicts)
+            print(f"[TREE] {len(args.trees)} trees: {len(links)} files to link, {same} identical already there")
+
+        if args.dry_run:
+            return
+        if n_conflicts and args.strict:
+            raise SystemExit(1)
+
+        if target is not None:
+            apply_states(target, merged, keys)
+            print(f"[STATE] -> {target.path}: done={len(target.done())} failed={len(target.failed())} "
+                  f"skipped={len(target.with_outcome(SKIPPED))}")
+        for src, dst in links:
+            link_or_copy(src, dst)
+        if links:
+            print(f"[TREE] -> {args.into_tree}: {len(links)} files")
+        if args.caches:
+            n = merge_caches(args.caches, args.into_cache)
+            print(f"[CACHE] -> {args.into_cache}: {n} apps added or newer")
+    finally:
+        for s in sources:
+            s.close()
+        if target is not None:
+            target.close()
+
+
+if __name__ == "__main__":
+    main()
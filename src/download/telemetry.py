@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Download telemetry shared by all download scripts.
+
+One process-wide recorder (default_telemetry()) that the engine, the rate
+limited requests paths and urllib3 retries report into:
+
+- per host: requests by status, latency histogram (time to response
+  headers), bytes received, retries by cause (429, 5xx, error, truncated)
+- failure reasons of finished downloads and event counters (ok, ...)
+- a throughput timeline (bytes/s and images/s per flush interval)
+
+Recording is in memory and cheap (one lock, fixed buckets). With
+--telemetry-dir the scripts also write <dir>/<name>.json and <dir>/<name>.prom
+(Prometheus text format, e.g. for the node_exporter textfile collector) every
+--telemetry-interval seconds and once more at exit.
+
+urllib3's Retry retries silently inside requests; make_session() uses
+CountingRetry, so those retries are counted too, and record_response() is
+the requests hook for plain requests.Session calls.
+"""
+
+from __future__ import annotations
+
+import argparse
+import bisect
+import json
+import math
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Deque, Dict, Iterator, Optional, Union
+
+from ratelimit import host_of
+
+try:
+    from urllib3.util.retry import Retry
+except ImportError:
+    Retry = None
+
+# seconds; the last bucket is +Inf
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, math.inf)
+TIMELINE_LEN = 720
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, v)] += 1
+        self.sum += v
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate by linear interpolation inside the bucket (Prometheus style)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        lo = 0.0
+        for le, n in zip(BUCKETS, self.counts):
+            if seen + n >= rank and n:
+                if math.isinf(le):
+                    return lo
+                return lo + (le - lo) * (rank - seen) / n
+            seen += n
+            lo = le if not math.isinf(le) else lo
+        return lo
+
+    def to_dict(self) -> Dict:
+        return {
+            "count": self.count, "sum": round(self.sum, 4),
+            "buckets": {("+Inf" if math.isinf(le) else f"{le:g}"): n for le, n in zip(BUCKETS, self.counts)},
+            "p50": self.quantile(0.5), "p95": self.quantile(0.95), "p99": self.quantile(0.99),
+        }
+
+
+class _Host:
+    def __init__(self):
+        self.status: Counter = Counter()
+        self.latency = Histogram()
+        self.bytes = 0
+        self.retries: Counter = Counter()
+
+
+def _esc(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Telemetry:
+    def __init__(self, name: str = "download"):
+        self.name = name
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+        self.hosts: Dict[str, _Host] = {}
+        self.failures: Counter = Counter()
+        self.events: Counter = Counter()
+        self.timeline: Deque[Dict] = deque(maxlen=TIMELINE_LEN)
+        self._last = (0.0, 0, 0)  # (t, bytes, ok) at the previous sample
+        self.out_dir: Optional[Path] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---- recording ----
+
+    def _host(self, host: str) -> _Host:
+        h = self.hosts.get(host)
+        if h is None:
+            h = self.hosts[host] = _Host()
+        return h
+
+    def request(self, url_or_host: str, status: Union[int, str], seconds: float) -> None:
+        """A request got its response headers (or failed with status 'error')."""
+        host = host_of(url_or_host) if "://" in url_or_host else url_or_host
+        with self._lock:
+            h = self._host(host)
+            h.status[str(status)] += 1
+            h.latency.observe(seconds)
+
+    def received(self, url_or_host: str, nbytes: int) -> None:
+        host = host_of(url_or_host) if "://" in url_or_host else url_or_host
+        with self._lock:
+            self._host(host).bytes += nbytes
+
+    def retry(self, url_or_host: str, cause: Union[int, str]) -> None:
+        host = host_of(url_or_host) if "://" in url_or_host else url_or_host
+        with self._lock:
+            self._host(host).retries[str(cause)] += 1
+
+    def failure(self, reason: str) -> None:
+        with self._lock:
+            self.failures[reason] += 1
+
+    def count(self, event: str, n: int = 1) -> None:
+        with self._lock:
+            self.events[event] += n
+
+    # ---- output ----
+
+    def _sample_locked(self) -> None:
+        t = time.perf_counter() - self._t0
+        total = sum(h.bytes for h in self.hosts.values())
+        ok = self.events.get("ok", 0)
+        t0, b0, ok0 = self._last
+        dt = max(t - t0, 1e-9)
+        self.timeline.append({"t": round(t, 2), "bytes": total, "ok": ok,
+                              "bytes_per_s": round((total - b0) / dt, 1), "ok_per_s": round((ok - ok0) / dt, 2)})
+        self._last = (t, total, ok)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            self._sample_locked()
+            return {
+                "script": self.name,
+                "started_at": self.started,
+                "uptime_s": round(time.perf_counter() - self._t0, 2),
+                "hosts": {
+                    host: {"requests": dict(h.status), "latency_s": h.latency.to_dict(),
+                           "bytes": h.bytes, "retries": dict(h.retries)}
+                    for host, h in self.hosts.items()
+                },
+                "failures": dict(self.failures),
+                "events": dict(self.events),
+                "timeline": list(self.timeline),
+            }
+
+    def to_prometheus(self, snap: Optional[Dict] = None) -> str:
+        snap = snap or self.snapshot()
+        s = f'script="{_esc(self.name)}"'
+        out = []
+
+        def metric(name: str, kind: str, help_: str) -> None:
+            out.append(f"# HELP {name} {help_}")
+            out.append(f"# TYPE {name} {kind}")
+
+        metric("dl_requests_total", "counter", "HTTP requests by host and status ('error' = no response).")
+        for host, h in snap["hosts"].items():
+            for status, n in sorted(h["requests"].items()):
+                out.append(f'dl_requests_total{{{s},host="{_esc(host)}",status="{status}"}} {n}')
+        metric("dl_request_seconds", "histogram", "Time to response headers.")
+        for host, h in snap["hosts"].items():
+            lat, cum = h["latency_s"], 0
+            for le, n in lat["buckets"].items():
+                cum += n
+                out.append(f'dl_request_seconds_bucket{{{s},host="{_esc(host)}",le="{le}"}} {cum}')
+            out.append(f'dl_request_seconds_sum{{{s},host="{_esc(host)}"}} {lat["sum"]}')
+            out.append(f'dl_request_seconds_count{{{s},host="{_esc(host)}"}} {lat["count"]}')
+        metric("dl_bytes_total", "counter", "Response body bytes received.")
+        for host, h in snap["hosts"].items():
+            out.append(f'dl_bytes_total{{{s},host="{_esc(host)}"}} {h["bytes"]}')
+        metric("dl_retries_total", "counter", "Retries by cause (429, 5xx status, error, truncated).")
+        for host, h in snap["hosts"].items():
+            for cause, n in sorted(h["retries"].items()):
+                out.append(f'dl_retries_total{{{s},host="{_esc(host)}",cause="{_esc(cause)}"}} {n}')
+        metric("dl_failures_total", "counter", "Downloads given up, by reason.")
+        for reason, n in sorted(snap["failures"].items()):
+            out.append(f'dl_failures_total{{{s},reason="{_esc(reason)}"}} {n}')
+        metric("dl_events_total", "counter", "Download outcomes and other events.")
+        for event, n in sorted(snap["events"].items()):
+            out.append(f'dl_events_total{{{s},event="{_esc(event)}"}} {n}')
+        last = snap["timeline"][-1] if snap["timeline"] else {"bytes_per_s": 0, "ok_per_s": 0}
+        metric("dl_throughput_bytes_per_second", "gauge", "Bytes/s over the last interval.")
+        out.append(f"dl_throughput_bytes_per_second{{{s}}} {last['bytes_per_s']}")
+        metric("dl_throughput_images_per_second", "gauge", "Finished downloads/s over the last interval.")
+        out.append(f"dl_throughput_images_per_second{{{s}}} {last['ok_per_s']}")
+        metric("dl_uptime_seconds", "gauge", "Seconds since the script started recording.")
+        out.append(f"dl_uptime_seconds{{{s}}} {snap['uptime_s']}")
+        return "\n".join(out) + "\n"
+
+    def flush(self) -> None:
+        if self.out_dir is None:
+            return
+        snap = self.snapshot()
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        for suffix, text in ((".json", json.dumps(snap, indent=1)), (".prom", self.to_prometheus(snap))):
+            dst = self.out_dir / f"{self.name}{suffix}"
+            tmp = dst.with_name(dst.name + ".tmp")
+            tmp.write_text(text, encoding="utf-8")
+            tmp.replace(dst)  # scrapers never see a half-written file
+
+    def start(self, out_dir: Path, interval: float = 10.0) -> None:
+        self.out_dir = Path(out_dir)
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.flush()
+                except OSError:
+                    pass
+
+        self._thread = threading.Thread(target=loop, name="telemetry", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(5)
+            self._thread = None
+        self.flush()
+
+    def summary(self) -> str:
+        snap = self.snapshot()
+        lines = []
+        for host, h in sorted(snap["hosts"].items()):
+            lat = h["latency_s"]
+            p50 = f"{lat['p50'] * 1000:.0f}" if lat["p50"] is not None else "-"
+            p95 = f"{lat['p95'] * 1000:.0f}" if lat["p95"] is not None else "-"
+            retries = " ".join(f"{c}={n}" for c, n in sorted(h["retries"].items())) or "0"
+            lines.append(f"  {host}: req={lat['count']} p50={p50}ms p95={p95}ms "
+                         f"MB={h['bytes'] / 1e6:.1f} retries[{retries}]")
+        if snap["failures"]:
+            lines.append("  failures: " + " ".join(f"{r}={n}" for r, n in sorted(snap["failures"].items())))
+        rate = sum(h["bytes"] for h in snap["hosts"].values()) / max(snap["uptime_s"], 1e-9)
+        lines.insert(0, f"[TELEMETRY] {self.name}: {snap['uptime_s']:.0f}s, {rate / 1e6:.2f} MB/s avg")
+        return "\n".join(lines)
+
+
+_default: Optional[Telemetry] = None
+_default_lock = threading.Lock()
+
+
+def default_telemetry() -> Telemetry:
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = Telemetry()
+        return _default
+
+
+def record_response(r, *args, **kwargs):
+    """requests response hook (also callable on a finished response): status, time to headers, body size."""
+    tel = default_telemetry()
+    tel.request(r.url, r.status_code, r.elapsed.total_seconds())
+    if not kwargs.get("stream"):
+        tel.received(r.url, len(r.content or b""))
+
+
+if Retry is not None:
+    class CountingRetry(Retry):
+        """urllib3 Retry that reports every retry it performs to the telemetry."""
+
+        def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+            host = getattr(_pool, "host", None) or (host_of(url) if url and "://" in url else "?")
+            if response is not None and response.status:
+                cause = response.status
+            else:
+                cause = "error"
+            default_telemetry().retry(host, cause)
+            return super().increment(method, url, response, error, _pool, _stacktrace)
+else:
+    CountingRetry = None
+
+
+def add_telemetry_args(ap: argparse.ArgumentParser) -> None:
+    ap.add_argument("--telemetry-dir", type=Path, default=None,
+                    help="Write <name>.json and <name>.prom (Prometheus text) here periodically.")
+    ap.add_argument("--telemetry-interval", type=float, default=10.0, help="Seconds between telemetry writes.")
+
+
+@contextmanager
+def telemetry_session(args, name: str) -> Iterator[Telemetry]:
+    """Name the process-wide recorder; with --telemetry-dir also write it periodically and at exit."""
+    tel = default_telemetry()
+    tel.name = name
+    out_dir = getattr(args, "telemetry_dir", None)
+    if out_dir is None:
+        yield tel
+        return
+    tel.start(out_dir, max(1.0, args.telemetry_interval))
+    try:
+        yield tel
+    finally:
+        tel.stop()
+        print(tel.summary())
+        print(f"[TELEMETRY] -> {out_dir / (name + '.json')}, {out_dir / (name + '.prom')}")
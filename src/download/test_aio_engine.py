@@ -0,0 +1,133 @@
+"""Range resume and revalidation in DownloadEngine.fetch, against fake_steam.py.
+
+  python -m pytest -q src/download/test_aio_engine.py
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+
+import pytest
+
+pytest.importorskip("aiohttp")
+
+from aio_engine import DownloadEngine, parse_content_range  # noqa: E402
+from blobstore import link_or_copy  # noqa: E402
+from fake_steam import FakeConfig, FakeSteam, _Server, make_handler  # noqa: E402
+from url_meta import UrlMetaStore  # noqa: E402
+
+
+@pytest.fixture
+def steam():
+    """(FakeSteam, base URL) served from a thread, so a test can flip cfg.p_cut between attempts."""
+    fake = FakeSteam(FakeConfig(apps=5, latency_ms=0.0, jitter_ms=0.0, p_missing=0.0, seed=1))
+    srv = _Server(("127.0.0.1", 0), make_handler(fake))
+    t = threading.Thread(target=srv.serve_forever, daemon=True)
+    t.start()
+    yield fake, f"http://127.0.0.1:{srv.server_address[1]}"
+    srv.shutdown()
+    srv.server_close()
+
+
+def fetch(engine: DownloadEngine, url, dst):
+    async def go():
+        async with engine:
+            return await engine.fetch(url, dst, min_bytes=1)
+    return asyncio.run(go())
+
+
+def header_url(fake: FakeSteam, base: str) -> str:
+    return f"{base}/steam/apps/{min(fake.apps)}/header.jpg"
+
+
+def test_parse_content_range():
+    assert parse_content_range("bytes 100-199/1000") == (100, 1000)
+    assert parse_content_range("bytes 0-9/*") == (0, None)
+    assert parse_content_range("bytes */1000") == (None, None)
+    assert parse_content_range(None) == (None, None)
+
+
+def test_cut_body_resumes_from_kept_offset(steam, tmp_path):
+    fake, base = steam
+    url, dst = header_url(fake, base), tmp_path / "h.jpg"
+    part, side = tmp_path / "h.jpg.part", tmp_path / "h.jpg.part.json"
+
+    fake.cfg.p_cut = 1.0
+    assert fetch(DownloadEngine(retries=1, validate=False), url, dst) is not None
+    assert not dst.exists()
+    kept = part.stat().st_size
+    assert 0 < kept < len(fake.header)
+    assert json.loads(side.read_text())["total"] == len(fake.header)
+
+    fake.cfg.p_cut = 0.0
+    engine = DownloadEngine(retries=1, validate=False)
+    assert fetch(engine, url, dst) is None
+    assert dst.read_bytes() == fake.header
+    assert engine.counters["resumed"] == 1
+    assert engine.counters["resumed_bytes"] == kept
+    assert engine.counters["bytes"] == len(fake.header) - kept
+    assert fake.counters["status_206"] == 1
+    assert not part.exists() and not side.exists()
+
+
+def test_mismatched_validator_starts_over(steam, tmp_path):
+    fake, base = steam
+    url, dst = header_url(fake, base), tmp_path / "h.jpg"
+    # a strong ETag the server no longer has: If-Range fails and a 200 replaces the part
+    (tmp_path / "h.jpg.part").write_bytes(b"\0" * 100)
+    (tmp_path / "h.jpg.part.json").write_text(json.dumps(
+        {"url": url, "etag": '"stale"', "last_modified": None, "total": len(fake.header)}))
+    engine = DownloadEngine(retries=1, validate=False)
+    assert fetch(engine, url, dst) is None
+    assert dst.read_bytes() == fake.header
+    assert engine.counters["resumed"] == 0
+    assert fake.counters["status_200"] == 1
+
+
+@pytest.mark.parametrize("meta, size, resumes", [
+    ({"etag": '"a"', "total": 1000}, 400, True),
+    # If-Range needs a strong validator: a weak ETag alone is not enough...
+    ({"etag": 'W/"a"', "total": 1000}, 400, False),
+    # ...but Last-Modified can stand in for it
+    ({"etag": 'W/"a"', "last_modified": "Sun, 13 Sep 2020 12:26:40 GMT", "total": 1000}, 400, True),
+    # a part as long as the whole body is not continued
+    ({"etag": '"a"', "total": 1000}, 1000, False),
+    ({"etag": '"a"', "total": 1000}, 1200, False),
+    ({"etag": '"a"', "total": 1000, "url": "http://other/x.jpg"}, 400, False),
+    ({}, 400, False),
+])
+def test_resume_point(tmp_path, meta, size, resumes):
+    url = "http://steam/x.jpg"
+    part, side = tmp_path / "x.jpg.part", tmp_path / "x.jpg.part.json"
+    part.write_bytes(b"\0" * size)
+    side.write_text(json.dumps(dict({"url": url}, **meta)))
+    offset, headers = DownloadEngine()._resume_point(url, part, side)
+    if resumes:
+        assert offset == size
+        assert headers["Range"] == f"bytes={size}-"
+        assert headers["If-Range"] in (meta["etag"], meta.get("last_modified"))
+        assert not headers["If-Range"].startswith("W/")
+    else:
+        assert (offset, headers) == (0, {})
+        assert not part.exists() and not side.exists()
+
+
+def test_revalidation_relinks_recorded_copies(steam, tmp_path):
+    fake, base = steam
+    url = header_url(fake, base)
+    dst, copy = tmp_path / "RPG" / "h.jpg", tmp_path / "Action" / "h.jpg"
+    dst.parent.mkdir()
+    dst.write_bytes(b"old bytes")
+    link_or_copy(dst, copy)
+    store = UrlMetaStore(tmp_path / "meta.sqlite")
+    store.put(url, dst, '"stale"', None, dst.stat().st_size)
+    store.link(dst, copy)
+
+    saved = []
+    engine = DownloadEngine(retries=1, validate=False, validators=store, revalidate=True, on_saved=saved.append)
+    assert fetch(engine, url, dst) is None
+    assert dst.read_bytes() == copy.read_bytes() == fake.header
+    assert dst.stat().st_ino == copy.stat().st_ino
+    assert saved == [dst, copy]
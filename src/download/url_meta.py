@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+HTTP validators (ETag / Last-Modified) per downloaded URL.
+
+Lives in the appdetails SQLite file (table url_meta), so every downloader
+shares one store:
+
+- DownloadEngine(validators=UrlMetaStore()) records the validators of every
+  200 response together with the local path
+- with revalidate=True, files already on disk are re-requested with
+  If-None-Match / If-Modified-Since; 304 keeps the file, 200 replaces it
+- copies hard-linked from a downloaded file (e.g. the same triplet in
+  another genre bucket) are recorded with link(), and a revalidation that
+  replaces the file links them to the new bytes as well
+- URLs whose body failed validation (HTML page, tiny placeholder, ...) keep
+  the reason in `rejected` and are not requested again; a later 200 that
+  passes clears it, --clear-rejected forgets them all
+
+Refresh everything that was downloaded with validators recorded:
+  python src/download/url_meta.py --revalidate --root data/raw --workers 64
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from aio_engine import DownloadEngine, DownloadTask
+from appdetails_store import DB_PATH
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS url_meta (
+    url           TEXT PRIMARY KEY,
+    path          TEXT,
+    etag          TEXT,
+    last_modified TEXT,
+    size          INTEGER,
+    checked_at    REAL NOT NULL,
+    rejected      TEXT
+);
+CREATE INDEX IF NOT EXISTS url_meta_path ON url_meta(path);
+CREATE TABLE IF NOT EXISTS url_links (
+    path   TEXT PRIMARY KEY,
+    source TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS url_links_source ON url_links(source);
+"""
+
+
+class UrlMetaStore:
+    def __init__(self, path: Path = DB_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._tls = threading.local()
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        cols = {r[1] for r in conn.execute("PRAGMA table_info(url_meta)")}
+        if "rejected" not in cols:  # stores created before validation existed
+            conn.execute("ALTER TABLE url_meta ADD COLUMN rejected TEXT")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._tls, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._tls.conn = conn
+        return conn
+
+    def get(self, url: str) -> Optional[Tuple[Optional[str], Optional[str]]]:
+        """(etag, last_modified) recorded for url, or None."""
+        row = self._conn().execute(
+            "SELECT etag, last_modified FROM url_meta WHERE url = ?", (url,)
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def put(self, url: str, path: Path, etag: Optional[str], last_modified: Optional[str],
+            size: Optional[int]) -> None:
+        self._conn().execute(
+            "INSERT OR REPLACE INTO url_meta (url, path, etag, last_modified, size, checked_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (url, str(Path(path).resolve()), etag, last_modified, size, time.time()),
+        )
+
+    def reject(self, url: str, reason: str) -> None:
+        self._conn().execute(
+            "INSERT INTO url_meta (url, checked_at, rejected) VALUES (?, ?, ?) "
+            "ON CONFLICT(url) DO UPDATE SET rejected = excluded.rejected, checked_at = excluded.checked_at",
+            (url, time.time(), reason),
+        )
+
+    def rejected(self, url: str) -> Optional[str]:
+        """Reason url was rejected last time, or None."""
+        row = self._conn().execute("SELECT rejected FROM url_meta WHERE url = ?", (url,)).fetchone()
+        return row[0] if row else None
+
+    def rejection_counts(self) -> Dict[str, int]:
+        rows = self._conn().execute(
+            "SELECT rejected, COUNT(*) FROM url_meta WHERE rejected IS NOT NULL GROUP BY rejected"
+        )
+        return dict(rows.fetchall())
+
+    def clear_rejected(self) -> int:
+        return self._conn().execute("UPDATE url_meta SET rejected = NULL WHERE rejected IS NOT NULL").rowcount
+
+    def touch(self, url: str) -> None:
+        self._conn().execute("UPDATE url_meta SET checked_at = ? WHERE url = ?", (time.time(), url))
+
+    def move(self, old_path: Path, new_path: Path) -> None:
+        """Follow a rename of a downloaded file (e.g. staged -> final name)."""
+        new, old = str(Path(new_path).resolve()), str(Path(old_path).resolve())
+        conn = self._conn()
+        conn.execute("UPDATE url_meta SET path = ? WHERE path = ?", (new, old))
+        conn.execute("UPDATE url_links SET source = ? WHERE source = ?", (new, old))
+
+    def link(self, source: Path, path: Path) -> None:
+        """Record path as a linked copy of the downloaded file source."""
+        self._conn().execute(
+            "INSERT OR REPLACE INTO url_links (path, source) VALUES (?, ?)",
+            (str(Path(path).resolve()), str(Path(source).resolve())),
+        )
+
+    def links(self, source: Path) -> List[Path]:
+        """Linked copies recorded for source."""
+        rows = self._conn().execute("SELECT path FROM url_links WHERE source = ?", (str(Path(source).resolve()),))
+        return [Path(r[0]) for r in rows.fetchall()]
+
+    def iter_paths(self, root: Optional[Path] = None) -> Iterator[Tuple[str, Path]]:
+        """(url, path) for recorded files, optionally under root."""
+        if root is None:
+            rows = self._conn().execute("SELECT url, path FROM url_meta WHERE path IS NOT NULL")
+        else:
+            # range scan on the path index: [root/, root<sep+1>)
+            prefix = str(Path(root).resolve()).rstrip(os.sep)
+            rows = self._conn().execute(
+                "SELECT url, path FROM url_meta WHERE path >= ? AND path < ?",
+                (prefix + os.sep, prefix + chr(ord(os.sep) + 1)),
+            )
+        for url, p in rows.fetchall():
+            yield url, Path(p)
+
+
+_default: Optional[UrlMetaStore] = None
+_default_lock = threading.Lock()
+
+
+def default_store() -> UrlMetaStore:
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = UrlMetaStore()
+        return _default
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--db", type=Path, default=DB_PATH)
+    ap.add_argument("--revalidate", action="store_true", help="Conditional GET for every recorded file on disk.")
+    ap.add_argument("--root", type=Path, default=None, help="Only files under this folder (e.g. data/raw).")
+    ap.add_argument("--workers", type=int, default=64)
+    ap.add_argument("--min-bytes", type=int, default=6000)
+    ap.add_argument("--clear-rejected", action="store_true",
+                    help="Forget validation rejections so those URLs are tried again.")
+    args = ap.parse_args()
+
+    store = UrlMetaStore(args.db)
+    rejected = store.rejection_counts()
+    if rejected:
+        print(f"[INFO] rejected URLs: {sum(rejected.values())} "
+              + " ".join(f"{r}={n}" for r, n in sorted(rejected.items())))
+    if args.clear_rejected:
+        print(f"[INFO] cleared {store.clear_rejected()} rejections")
+    rows = [(u, p) for u, p in store.iter_paths(args.root) if p.exists()]
+    print(f"[INFO] recorded files on disk: {len(rows)}")
+    if not args.revalidate or not rows:
+        return
+
+    async def _run() -> Dict[str, int]:
+        async with DownloadEngine(concurrency=args.workers, per_host=args.workers,
+                                  validators=store, revalidate=True) as eng:
+            ok, fail = await eng.run((DownloadTask(url=u, path=p) for u, p in rows),
+                                     min_bytes=args.min_bytes, desc="Revalidating")
+            return dict(eng.counters, ok=ok, fail=fail)
+
+    t0 = time.perf_counter()
+    c = asyncio.run(_run())
+    print(f"[DONE] not_modified={c['not_modified']} changed={c['fetched']} fail={c['fail']} "
+          f"bytes={c['bytes']} in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
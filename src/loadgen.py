@@ -0,0 +1,102 @@
+import argparse
+import json
+import threading
+import time
+from pathlib import Path
+
+import requests
+
+from dataset import group_triplets
+from serve import FIELDS, percentile
+
+URL = "http://127.0.0.1:8000"
+
+
+def collect_payloads(root: Path, limit: int):
+    payloads = []
+    for d in sorted(p for p in root.rglob("*") if p.is_dir()):
+        for _, paths in group_triplets(d, sorted(f.name for f in d.iterdir() if f.is_file())):
+            payloads.append([p.read_bytes() for p in paths])
+            if len(payloads) >= limit:
+                return payloads
+    return payloads
+
+
+def client(url: str, payloads, stop_at: float, offset: int, out: list, lock: threading.Lock):
+    sess = requests.Session()
+    lat, errors = [], 0
+    i = offset
+    while time.perf_counter() < stop_at:
+        imgs = payloads[i % len(payloads)]
+        files = {name: (f"{name}.jpg", data, "image/jpeg") for name, data in zip(FIELDS, imgs)}
+        t0 = time.perf_counter()
+        try:
+            r = sess.post(f"{url}/predict", files=files, timeout=60)
+            ok = r.status_code == 200
+        except Exception:
+            ok = False
+        if ok:
+            lat.append((time.perf_counter() - t0) * 1000.0)
+        else:
+            errors += 1
+        i += 1
+    with lock:
+        out.append((lat, errors))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default=URL)
+    ap.add_argument("--data-dir", type=Path, default=Path("data/balanced_raw"))
+    ap.add_argument("--samples", type=int, default=200, help="Distinct triplets to cycle through.")
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    ap.add_argument("--duration", type=float, default=15.0, help="Seconds per concurrency level.")
+    ap.add_argument("--out", type=Path, default=Path("outputs/loadgen.json"))
+    args = ap.parse_args()
+
+    payloads = collect_payloads(args.data_dir, args.samples)
+    if not payloads:
+        raise SystemExit(f"[ERROR] No triplets found under {args.data_dir}")
+    print(f"[INFO] Loaded {len(payloads)} triplets from {args.data_dir}")
+
+    report = []
+    for c in args.concurrency:
+        out, lock = [], threading.Lock()
+        # /metrics counts since the last reset, so each level reports only its own batches
+        r = requests.post(f"{args.url}/metrics/reset", timeout=10)
+        if r.status_code != 200:
+            print(f"[WARN] {args.url}/metrics/reset answered {r.status_code}; server metrics are cumulative")
+        stop_at = time.perf_counter() + args.duration
+        threads = [threading.Thread(target=client, args=(args.url, payloads, stop_at, k * 7919, out, lock))
+                   for k in range(c)]
+        t0 = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - t0
+
+        lat = sorted(x for lats, _ in out for x in lats)
+        errors = sum(e for _, e in out)
+        server = requests.get(f"{args.url}/metrics", timeout=10).json()
+
+        row = {
+            "concurrency": c,
+            "requests": len(lat),
+            "errors": errors,
+            "throughput_rps": len(lat) / wall,
+            "latency_ms": {f"p{q}": percentile(lat, q) for q in (50, 90, 95, 99)},
+            "server": server,
+        }
+        report.append(row)
+        print(f"c={c:<4} rps={row['throughput_rps']:.1f} p50={row['latency_ms']['p50']:.1f}ms "
+              f"p99={row['latency_ms']['p99']:.1f}ms errors={errors} "
+              f"server_mean_batch={server['mean_batch_size']:.2f}")
+
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+    args.out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print("Saved:", args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+# One directory per store, one flat file per column, appended batch by batch:
+#   logits.f32  float32 [rows, K]
+#   labels.i16  int16   [rows]   (-1 when unlabeled)
+#   ids.txt     one triplet id per line ("<dir>/<appid>")
+#   meta.json   classes, K and source info
+LOGITS = "logits.f32"
+LABELS = "labels.i16"
+IDS = "ids.txt"
+META = "meta.json"
+
+
+def count_lines(path: Path) -> int:
+    n = 0
+    with path.open("rb") as f:
+        while True:
+            buf = f.read(1 << 20)
+            if not buf:
+                return n
+            n += buf.count(b"\n")
+
+
+def _truncate_lines(path: Path, rows: int):
+    pos = 0
+    n = 0
+    with path.open("r+b") as f:
+        while n < rows:
+            buf = f.read(1 << 20)
+            if not buf:
+                break
+            i = -1
+            while n < rows:
+                i = buf.find(b"\n", i + 1)
+                if i < 0:
+                    break
+                n += 1
+            if n == rows:
+                pos += i + 1
+                break
+            pos += len(buf)
+        f.truncate(pos)
+
+
+class LogitWriter:
+    """Append-only columnar writer for per-sample logits, labels and ids."""
+
+    def __init__(self, path: Path, classes, source: str = "", append: bool = False):
+        self.path = Path(path)
+        self.classes = list(classes)
+        self.k = len(self.classes)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        if append and (self.path / META).exists():
+            meta = json.loads((self.path / META).read_text(encoding="utf-8"))
+            if meta["classes"] != self.classes:
+                raise ValueError(f"{self.path}: existing store has classes {meta['classes']}")
+            self.rows = self.repair()
+        else:
+            for name in (LOGITS, LABELS, IDS):
+                (self.path / name).unlink(missing_ok=True)
+            self.rows = 0
+
+        self.meta = {"classes": self.classes, "num_classes": self.k, "source": source, "rows": self.rows}
+        self._write_meta()
+
+        self._logits = (self.path / LOGITS).open("ab")
+        self._labels = (self.path / LABELS).open("ab")
+        self._ids = (self.path / IDS).open("a", encoding="utf-8", newline="\n")
+
+    def repair(self) -> int:
+        # a killed writer can leave columns of different length; cut to the shortest
+        rows = min(
+            (self.path / LOGITS).stat().st_size // (4 * self.k) if (self.path / LOGITS).exists() else 0,
+            (self.path / LABELS).stat().st_size // 2 if (self.path / LABELS).exists() else 0,
+            count_lines(self.path / IDS) if (self.path / IDS).exists() else 0,
+        )
+        self.truncate(rows)
+        return rows
+
+    def truncate(self, rows: int):
+        for name, size in ((LOGITS, 4 * self.k * rows), (LABELS, 2 * rows)):
+            p = self.path / name
+            p.touch()
+            with p.open("r+b") as f:
+                f.truncate(size)
+        (self.path / IDS).touch()
+        _truncate_lines(self.path / IDS, rows)
+        self.rows = rows
+
+    def _write_meta(self):
+        tmp = self.path / (META + ".tmp")
+        tmp.write_text(json.dumps(self.meta, indent=2), encoding="utf-8")
+        tmp.replace(self.path / META)
+
+    def append(self, logits, labels, ids):
+        logits = np.ascontiguousarray(np.asarray(logits, dtype=np.float32))
+        if logits.ndim != 2 or logits.shape[1] != self.k:
+            raise ValueError(f"expected logits of shape (n, {self.k}), got {logits.shape}")
+        labels = np.asarray(labels if labels is not None else np.full(len(logits), -1), dtype=np.int16)
+
+        self._logits.write(logits.tobytes())
+        self._labels.write(labels.tobytes())
+        self._ids.write("".join(f"{i}\n" for i in ids))
+        self.rows += len(logits)
+
+    def flush(self, sync: bool = False):
+        for f in (self._logits, self._labels, self._ids):
+            f.flush()
+            if sync:
+                os.fsync(f.fileno())
+        self.meta["rows"] = self.rows
+        self._write_meta()
+
+    def close(self):
+        self.flush(sync=True)
+        for f in (self._logits, self._labels, self._ids):
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class LogitStore:
+    """Read side: logits are memory-mapped, so opening a store is O(1)."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.meta = json.loads((self.path / META).read_text(encoding="utf-8"))
+        self.classes = self.meta["classes"]
+        self.k = self.meta["num_classes"]
+
+        n_logits = (self.path / LOGITS).stat().st_size // (4 * self.k)
+        n_labels = (self.path / LABELS).stat().st_size // 2
+        self.rows = min(n_logits, n_labels)
+
+        self.logits = np.memmap(self.path / LOGITS, dtype=np.float32, mode="r", shape=(self.rows, self.k)) \
+            if self.rows else np.zeros((0, self.k), dtype=np.float32)
+        self.labels = np.fromfile(self.path / LABELS, dtype=np.int16, count=self.rows)
+
+    def ids(self):
+        with (self.path / IDS).open("r", encoding="utf-8") as f:
+            return [line.rstrip("\n") for _, line in zip(range(self.rows), f)]
+
+    def __len__(self):
+        return self.rows
@@ -0,0 +1,125 @@
+import torch
+
+
+class MetricAccumulator:
+    """Streaming classification metrics.
+
+    Every update folds a batch of logits into fixed-size counters (K*K confusion
+    matrix, top-k hits, calibration bins), so memory stays O(K^2) no matter how
+    many samples are seen and nothing has to be kept for a second pass.
+    """
+
+    def __init__(self, num_classes: int, topk=(1, 5), n_bins: int = 15, device="cpu"):
+        self.num_classes = num_classes
+        self.topk = tuple(k for k in topk if k <= num_classes) or (1,)
+        self.n_bins = n_bins
+        self.device = device
+        self.reset()
+
+    def reset(self):
+        k = self.num_classes
+        self.cm = torch.zeros(k * k, dtype=torch.long, device=self.device)
+        self.topk_hits = torch.zeros(len(self.topk), dtype=torch.long, device=self.device)
+        self.bin_count = torch.zeros(self.n_bins, dtype=torch.float64, device=self.device)
+        self.bin_conf = torch.zeros(self.n_bins, dtype=torch.float64, device=self.device)
+        self.bin_correct = torch.zeros(self.n_bins, dtype=torch.float64, device=self.device)
+        self.loss_sum = 0.0
+        self.loss_batches = 0
+
+    @torch.no_grad()
+    def update(self, logits: torch.Tensor, y: torch.Tensor, loss=None):
+        k = self.num_classes
+        logits = logits.detach().to(self.device).float()
+        y = y.to(self.device).long()
+
+        probs = torch.softmax(logits, dim=1)
+        conf, pred = probs.max(dim=1)
+
+        self.cm += torch.bincount(y * k + pred, minlength=k * k)
+
+        top = logits.topk(max(self.topk), dim=1).indices
+        hit = top == y[:, None]
+        for i, kk in enumerate(self.topk):
+            self.topk_hits[i] += hit[:, :kk].any(dim=1).sum()
+
+        b = torch.clamp((conf * self.n_bins).long(), max=self.n_bins - 1)
+        self.bin_count += torch.bincount(b, minlength=self.n_bins).double()
+        self.bin_conf += torch.bincount(b, weights=conf.double(), minlength=self.n_bins)
+        self.bin_correct += torch.bincount(b, weights=(pred == y).double(), minlength=self.n_bins)
+
+        if loss is not None:
+            self.loss_sum += float(loss)
+            self.loss_batches += 1
+
+    def confusion_matrix(self) -> torch.Tensor:
+        return self.cm.view(self.num_classes, self.num_classes).cpu()
+
+    def compute(self, classes=None) -> dict:
+        cm = self.confusion_matrix().double()
+        n = cm.sum()
+        tp = cm.diag()
+        support = cm.sum(dim=1)
+        predicted = cm.sum(dim=0)
+
+        precision = torch.where(predicted > 0, tp / predicted.clamp(min=1), torch.zeros_like(tp))
+        recall = torch.where(support > 0, tp / support.clamp(min=1), torch.zeros_like(tp))
+        denom = precision + recall
+        f1 = torch.where(denom > 0, 2 * precision * recall / denom.clamp(min=1e-12), torch.zeros_like(tp))
+
+        weights = support / n.clamp(min=1)
+        total = int(n.item())
+
+        bin_count = self.bin_count.cpu()
+        ece = (self.bin_conf.cpu() - self.bin_correct.cpu()).abs().sum() / max(1, total)
+
+        if classes is None:
+            classes = [str(i) for i in range(self.num_classes)]
+
+        per_class = {}
+        for i, cls in enumerate(classes):
+            per_class[cls] = {
+                "precision": float(precision[i]),
+                "recall": float(recall[i]),
+                "f1": float(f1[i]),
+                "support": int(support[i]),
+            }
+
+        result = {
+            "acc": float(tp.sum() / n) if total > 0 else 0.0,
+            "correct": int(tp.sum().item()),
+            "total": total,
+            "macro": {
+                "precision": float(precision.mean()),
+                "recall": float(recall.mean()),
+                "f1": float(f1.mean()),
+            },
+            "weighted": {
+                "precision": float((precision * weights).sum()),
+                "recall": float((recall * weights).sum()),
+                "f1": float((f1 * weights).sum()),
+            },
+            "per_class": per_class,
+            "ece": float(ece),
+            "ece_bins": self.n_bins,
+            "ece_bin_count": [int(c) for c in bin_count.tolist()],
+        }
+
+        for i, kk in enumerate(self.topk):
+            result[f"top{kk}_acc"] = int(self.topk_hits[i].item()) / max(1, total)
+
+        if self.loss_batches:
+            result["loss"] = self.loss_sum / self.loss_batches
+
+        return result
+
+
+def save_confusion_matrix_csv(cm, classes, path):
+    lines = []
+    header = ["true/pred"] + list(classes)
+    lines.append(",".join(header))
+
+    for i, cls in enumerate(classes):
+        row = [cls] + [str(int(x)) for x in cm[i]]
+        lines.append(",".join(row))
+
+    path.write_text("\n".join(lines), encoding="utf-8")
@@ -0,0 +1,94 @@
+import zipfile
+from pathlib import Path
+
+import torch
+import torch.nn as nn
+
+from models.baseline_cnn import BaselineCNN
+
+IN_CHANNELS = 9
+
+
+def build_model(arch: str, num_classes: int, pretrained: bool = False) -> nn.Module:
+    # "baseline" -> BaselineCNN, "timm:<name>" -> timm model with 9-channel stem
+    if arch == "baseline":
+        return BaselineCNN(num_classes, channels=IN_CHANNELS)
+
+    if arch.startswith("timm:"):
+        import timm
+
+        name = arch.split(":", 1)[1]
+        return timm.create_model(name, pretrained=pretrained, num_classes=num_classes, in_chans=IN_CHANNELS)
+
+    raise ValueError(f"Unknown arch: {arch}")
+
+
+def model_from_ckpt(ckpt: dict, device: str) -> nn.Module:
+    model = build_model(ckpt.get("arch", "baseline"), len(ckpt["classes"])).to(device)
+    model.load_state_dict(ckpt["model"])
+    model.eval()
+    return model
+
+
+def load_model(ckpt_path: Path, device: str):
+    if not Path(ckpt_path).exists():
+        raise FileNotFoundError(f"Checkpoint not found: {ckpt_path}")
+
+    ckpt = torch.load(ckpt_path, map_location=device)
+    model = model_from_ckpt(ckpt, device)
+
+    return model, ckpt["classes"], ckpt
+
+
+def is_torchscript(path: Path) -> bool:
+    # torch.save archives hold data.pkl, TorchScript archives also hold constants.pkl
+    if not zipfile.is_zipfile(path):
+        return False
+    with zipfile.ZipFile(path) as z:
+        return any(n.endswith("constants.pkl") for n in z.namelist())
+
+
+def is_quantized(model: nn.Module) -> bool:
+    # dynamic quantization keeps Linear weights as packed params, not quantized
+    # tensors in the state_dict, so look at the module types
+    return any(type(m).__module__.startswith(("torch.ao.nn.quantized", "torch.ao.nn.intrinsic.quantized",
+                                              "torch.nn.quantized"))
+               for m in model.modules())
+
+
+def load_artifact(path: Path, device: str):
+    """Load any evaluated model artifact: train.py checkpoint, pickled module or TorchScript.
+
+    Returns (model, classes, device); classes is None when the artifact does not
+    carry them. Quantized artifacts usually only run on CPU, so they fall back
+    there instead of failing.
+    """
+    path = Path(path)
+    if not path.exists():
+        raise FileNotFoundError(f"Checkpoint not found: {path}")
+
+    if is_torchscript(path):
+        for dev in dict.fromkeys([device, "cpu"]):
+            try:
+                model = torch.jit.load(str(path), map_location=dev)
+                model.eval()
+                return model, None, dev
+            except RuntimeError:
+                continue
+        raise RuntimeError(f"Could not load TorchScript artifact: {path}")
+
+    obj = torch.load(path, map_location="cpu", weights_only=False)
+
+    if isinstance(obj, nn.Module):
+        model, classes = obj, getattr(obj, "classes", None)
+    elif isinstance(obj.get("model"), nn.Module):
+        model, classes = obj["model"], obj.get("classes")
+    else:
+        model, classes = model_from_ckpt(obj, "cpu"), obj["classes"]
+
+    model.eval()
+    if is_quantized(model):
+        device = "cpu"
+    model.to(device)
+
+    return model, classes, device
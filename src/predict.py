@@ -0,0 +1,251 @@
+import argparse
+import json
+import os
+import zlib
+from pathlib import Path
+
+import torch
+from torch.utils.data import DataLoader, IterableDataset, get_worker_info
+from PIL import Image
+
+from dataset import build_eval_tf, group_triplets
+from logstore import LogitWriter, count_lines
+from models.factory import load_model
+
+CKPT = Path("checkpoints/baseline/best.pt")
+OUT = Path("outputs/predictions.jsonl")
+
+BATCH = 64
+IMG = 224
+TOPK = 3
+
+
+def parse_shard(spec):
+    if not spec:
+        return 0, 1
+    i, n = spec.split("/")
+    i, n = int(i), int(n)
+    if n < 1 or not 0 <= i < n:
+        raise SystemExit(f"[ERROR] bad --shard {spec!r}, expected i/N with 0 <= i < N")
+    return i, n
+
+
+def in_shard(appid: str, shard: int, num_shards: int) -> bool:
+    return num_shards == 1 or zlib.crc32(appid.encode("utf-8")) % num_shards == shard
+
+
+def iter_triplets(root: Path):
+    """Yield (rel_dir, appid, paths) for every triplet under root.
+
+    Directories and files are visited in sorted order, one directory listing
+    at a time, so the order is stable across runs and memory does not grow
+    with the size of the tree.
+    """
+    stack = [root]
+    while stack:
+        d = stack.pop()
+        with os.scandir(d) as it:
+            entries = sorted(it, key=lambda e: e.name)
+
+        files = [e.name for e in entries if e.is_file()]
+        rel = Path(d).relative_to(root).as_posix()
+        for appid, paths in group_triplets(d, files):
+            yield rel, appid, paths
+
+        subdirs = [e.path for e in entries if e.is_dir()]
+        stack.extend(reversed(subdirs))
+
+
+def walk_key(rel: str, appid: str):
+    """Sort key that follows iter_triplets order: a directory's own triplets, then its subdirectories."""
+    # the root is "." in the walk and "" in the JSONL (and in the ids of test.py/logstore)
+    return (() if rel in (".", "") else tuple(rel.split("/")), appid)
+
+
+def last_written_key(out_path: Path):
+    # read only the tail of the file; a torn last line from a killed run is cut off
+    if not out_path.exists() or out_path.stat().st_size == 0:
+        return None
+
+    with out_path.open("r+b") as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        pos = max(0, end - 64 * 1024)
+        f.seek(pos)
+        tail = f.read()
+
+        cut = tail.rfind(b"\n")
+        if cut + 1 < len(tail):
+            f.truncate(pos + cut + 1)
+            tail = tail[:cut + 1]
+
+    for line in reversed(tail.splitlines()):
+        try:
+            rec = json.loads(line)
+        except Exception:
+            continue
+        return rec["dir"], str(rec["appid"])
+    return None
+
+
+class TripletStream(IterableDataset):
+    """Streams pre-batched triplets in discovery order.
+
+    Work is cut into blocks of batch_size triplets and block b goes to worker
+    b % num_workers. DataLoader pulls from workers round-robin, so batches come
+    out in exactly the discovery order, which is what makes resume by the last
+    written appid safe. Resume compares walk_key() order rather than looking
+    for the exact key, so a last triplet since deleted from the tree does not
+    skip everything after it.
+    """
+
+    def __init__(self, root: Path, img_size: int, batch_size: int, shard=(0, 1), resume_after=None):
+        self.root = Path(root)
+        self.transform = build_eval_tf(img_size)
+        self.img_size = img_size
+        self.batch_size = batch_size
+        self.shard = shard
+        self.resume_after = resume_after
+
+    def _items(self):
+        after = walk_key(*self.resume_after) if self.resume_after is not None else None
+        for rel, appid, paths in iter_triplets(self.root):
+            if after is not None:
+                if walk_key(rel, appid) <= after:
+                    continue
+                after = None
+            if in_shard(appid, *self.shard):
+                yield rel, appid, paths
+
+    def _load(self, paths):
+        imgs = []
+        for p in paths:
+            img = Image.open(p).convert("RGB")
+            imgs.append(self.transform(img))
+        return torch.cat(imgs, dim=0)
+
+    def _make_batch(self, block):
+        xs, keys, errors = [], [], []
+        for rel, appid, paths in block:
+            try:
+                xs.append(self._load(paths))
+                errors.append("")
+            except Exception as e:
+                xs.append(torch.zeros(9, self.img_size, self.img_size))
+                errors.append(f"{type(e).__name__}: {e}")
+            keys.append((rel, appid))
+        return torch.stack(xs), keys, errors
+
+    def __iter__(self):
+        info = get_worker_info()
+        wid = info.id if info else 0
+        nw = info.num_workers if info else 1
+
+        block = []
+        b = 0
+        for item in self._items():
+            block.append(item)
+            if len(block) < self.batch_size:
+                continue
+            if b % nw == wid:
+                yield self._make_batch(block)
+            block = []
+            b += 1
+
+        if block and b % nw == wid:
+            yield self._make_batch(block)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--input", type=Path, required=True, help="Directory tree with <appid>.jpg/_gp1/_gp2 triplets.")
+    ap.add_argument("--ckpt", type=Path, default=CKPT)
+    ap.add_argument("--out", type=Path, default=OUT)
+    ap.add_argument("--topk", type=int, default=TOPK)
+    ap.add_argument("--batch", type=int, default=BATCH)
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--img", type=int, default=IMG)
+    ap.add_argument("--shard", default="", help="Process only shard i of N (i/N), split by appid hash.")
+    ap.add_argument("--store", type=Path, default=None,
+                    help="Per-sample logit store (default: next to --out, <name>_logits/).")
+    ap.add_argument("--no-resume", action="store_true", help="Overwrite --out instead of continuing it.")
+    args = ap.parse_args()
+
+    shard = parse_shard(args.shard)
+    out_path = args.out
+    if shard[1] > 1:
+        out_path = out_path.with_name(f"{out_path.stem}.shard{shard[0]}of{shard[1]}{out_path.suffix}")
+
+    store_dir = args.store or out_path.with_name(out_path.stem + "_logits")
+    if shard[1] > 1 and args.store:
+        store_dir = store_dir.with_name(f"{store_dir.name}.shard{shard[0]}of{shard[1]}")
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    model, classes, _ = load_model(args.ckpt, device)
+    topk = min(args.topk, len(classes))
+
+    resume_after = None
+    if args.no_resume:
+        out_path.unlink(missing_ok=True)
+    else:
+        resume_after = last_written_key(out_path)
+        if resume_after:
+            print(f"[INFO] Resuming after dir={resume_after[0]!r} appid={resume_after[1]}")
+
+    # the store is appended before the JSONL, so after a crash it can only be ahead
+    store = LogitWriter(store_dir, classes, source=str(args.ckpt), append=not args.no_resume)
+    lines_done = count_lines(out_path) if out_path.exists() else 0
+    if store.rows > lines_done:
+        store.truncate(lines_done)
+    elif store.rows < lines_done:
+        print(f"[WARN] {store_dir} has {store.rows} rows but {out_path} has {lines_done} lines; "
+              "earlier predictions are missing from the store.")
+
+    stream = TripletStream(args.input, args.img, args.batch, shard=shard, resume_after=resume_after)
+    loader = DataLoader(stream, batch_size=None, num_workers=args.workers,
+                        pin_memory=device == "cuda", persistent_workers=False)
+
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    written = 0
+    failed = 0
+
+    with out_path.open("a", encoding="utf-8") as f, torch.no_grad():
+        for x, keys, errors in loader:
+            logits = model(x.to(device, non_blocking=True)).float()
+            probs = torch.softmax(logits, dim=1)
+            top_p, top_i = probs.topk(topk, dim=1)
+            top_p = top_p.cpu().tolist()
+            top_i = top_i.cpu().tolist()
+
+            logits = logits.cpu()
+            logits[torch.tensor([bool(e) for e in errors])] = float("nan")
+            store.append(logits.numpy(), None, [f"{rel}/{appid}" if rel != "." else appid for rel, appid in keys])
+            store.flush()
+
+            lines = []
+            for (rel, appid), err, ps, idx in zip(keys, errors, top_p, top_i):
+                rec = {"appid": int(appid) if appid.isdigit() else appid, "dir": rel if rel != "." else ""}
+                if err:
+                    rec["error"] = err
+                    failed += 1
+                else:
+                    rec["genres"] = [classes[i] for i in idx]
+                    rec["probs"] = [round(p, 6) for p in ps]
+                lines.append(json.dumps(rec))
+
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            written += len(lines)
+
+            if written % (args.batch * 50) < len(lines):
+                print(f"[INFO] predicted={written} failed={failed}")
+
+    store.close()
+
+    if resume_after and written == 0:
+        print("[INFO] Nothing new after the resume point (or it is not under --input).")
+    print(f"[DONE] predicted={written} failed={failed} out={out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+import argparse
+import io
+import json
+import queue
+import threading
+import time
+from collections import Counter, deque
+from email import policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import torch
+from PIL import Image
+
+from dataset import build_eval_tf
+from models.factory import load_model
+
+CKPT = Path("checkpoints/baseline/best.pt")
+IMG = 224
+TOPK = 3
+
+FIELDS = ("cover", "gp1", "gp2")
+
+
+def percentile(sorted_vals, q):
+    if not sorted_vals:
+        return 0.0
+    i = min(len(sorted_vals) - 1, int(round(q / 100.0 * (len(sorted_vals) - 1))))
+    return sorted_vals[i]
+
+
+class Stats:
+    def __init__(self, window: int = 10000):
+        self.lock = threading.Lock()
+        self.latency_ms = deque(maxlen=window)
+        self.queue_ms = deque(maxlen=window)
+        self.batch_sizes = Counter()
+        self.requests = 0
+        self.errors = 0
+        self.started = time.time()
+
+    def reset(self):
+        """Start counting afresh, e.g. between load generator levels."""
+        with self.lock:
+            self.latency_ms.clear()
+            self.queue_ms.clear()
+            self.batch_sizes.clear()
+            self.requests = 0
+            self.errors = 0
+            self.started = time.time()
+
+    def record_batch(self, size: int, queue_ms):
+        with self.lock:
+            self.batch_sizes[size] += 1
+            self.queue_ms.extend(queue_ms)
+
+    def record_request(self, ms: float, ok: bool):
+        with self.lock:
+            self.requests += 1
+            if ok:
+                self.latency_ms.append(ms)
+            else:
+                self.errors += 1
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            lat = sorted(self.latency_ms)
+            qms = sorted(self.queue_ms)
+            hist = dict(sorted(self.batch_sizes.items()))
+            requests = self.requests
+            errors = self.errors
+
+        batches = sum(hist.values())
+        uptime = time.time() - self.started
+        return {
+            "requests": requests,
+            "errors": errors,
+            "uptime_s": uptime,
+            "req_per_s": requests / max(uptime, 1e-9),
+            "latency_ms": {f"p{q}": percentile(lat, q) for q in (50, 90, 95, 99)},
+            "queue_wait_ms": {f"p{q}": percentile(qms, q) for q in (50, 90, 99)},
+            "batches": batches,
+            "mean_batch_size": sum(k * v for k, v in hist.items()) / max(1, batches),
+            "batch_size_hist": {str(k): v for k, v in hist.items()},
+        }
+
+
+class _Pending:
+    __slots__ = ("x", "t_enqueued", "done", "result", "error")
+
+    def __init__(self, x):
+        self.x = x
+        self.t_enqueued = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """Coalesces concurrent requests into one forward pass.
+
+    The worker blocks for the first request, then keeps collecting until either
+    max_batch requests are queued or max_wait_ms has passed since the first one.
+    """
+
+    def __init__(self, model, classes, device, stats: Stats, max_batch: int = 32, max_wait_ms: float = 5.0, topk: int = TOPK):
+        self.model = model
+        self.classes = classes
+        self.device = device
+        self.stats = stats
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.topk = min(topk, len(classes))
+        self.q = queue.Queue()
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def submit(self, x: torch.Tensor, timeout: float = 30.0):
+        p = _Pending(x)
+        self.q.put(p)
+        if not p.done.wait(timeout):
+            raise TimeoutError("inference timed out")
+        if p.error is not None:
+            raise p.error
+        return p.result
+
+    def _collect(self):
+        batch = [self.q.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            left = deadline - time.perf_counter()
+            if left <= 0:
+                break
+            try:
+                batch.append(self.q.get(timeout=left))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            t0 = time.perf_counter()
+            try:
+                x = torch.stack([p.x for p in batch]).to(self.device)
+                with torch.no_grad():
+                    probs = torch.softmax(self.model(x), dim=1)
+                top_p, top_i = probs.topk(self.topk, dim=1)
+                top_p = top_p.cpu().tolist()
+                top_i = top_i.cpu().tolist()
+                for p, ps, idx in zip(batch, top_p, top_i):
+                    p.result = {"genres": [self.classes[i] for i in idx], "probs": [round(v, 6) for v in ps]}
+            except Exception as e:
+                for p in batch:
+                    p.error = e
+            finally:
+                self.stats.record_batch(len(batch), [(t0 - p.t_enqueued) * 1000.0 for p in batch])
+                for p in batch:
+                    p.done.set()
+
+
+def parse_multipart(content_type: str, body: bytes) -> dict:
+    head = f"Content-Type: {content_type}\r\nMIME-Version: 1.0\r\n\r\n".encode("latin-1")
+    msg = BytesParser(policy=policy.HTTP).parsebytes(head + body)
+    parts = {}
+    if not msg.is_multipart():
+        return parts
+    for part in msg.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        if name:
+            parts[name] = part.get_payload(decode=True)
+    return parts
+
+
+def make_handler(batcher: MicroBatcher, stats: Stats, transform):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _send_json(self, code: int, obj: dict):
+            body = json.dumps(obj).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/metrics":
+                self._send_json(200, stats.snapshot())
+            elif self.path == "/health":
+                self._send_json(200, {"ok": True})
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path == "/metrics/reset":
+                stats.reset()
+                self._send_json(200, {"ok": True})
+                return
+            if self.path != "/predict":
+                self._send_json(404, {"error": "not found"})
+                return
+
+            t0 = time.perf_counter()
+            try:
+                n = int(self.headers.get("Content-Length", "0"))
+                parts = parse_multipart(self.headers.get("Content-Type", ""), self.rfile.read(n))
+                missing = [f for f in FIELDS if not parts.get(f)]
+                if missing:
+                    stats.record_request(0.0, ok=False)
+                    self._send_json(400, {"error": f"missing fields: {', '.join(missing)}"})
+                    return
+
+                # decode in the handler thread so the batcher only runs the model
+                imgs = [transform(Image.open(io.BytesIO(parts[f])).convert("RGB")) for f in FIELDS]
+                result = batcher.submit(torch.cat(imgs, dim=0))
+            except Exception as e:
+                stats.record_request(0.0, ok=False)
+                self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+                return
+
+            ms = (time.perf_counter() - t0) * 1000.0
+            stats.record_request(ms, ok=True)
+            result["latency_ms"] = round(ms, 3)
+            self._send_json(200, result)
+
+    return Handler
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--ckpt", type=Path, default=CKPT)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8000)
+    ap.add_argument("--img", type=int, default=IMG)
+    ap.add_argument("--max-batch", type=int, default=32)
+    ap.add_argument("--max-wait-ms", type=float, default=5.0)
+    ap.add_argument("--topk", type=int, default=TOPK)
+    args = ap.parse_args()
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    model, classes, _ = load_model(args.ckpt, device)
+
+    stats = Stats()
+    batcher = MicroBatcher(model, classes, device, stats, args.max_batch, args.max_wait_ms, args.topk)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(batcher, stats, build_eval_tf(args.img)))
+    server.daemon_threads = True
+
+    print(f"[INFO] Serving {args.ckpt} on http://{args.host}:{args.port} "
+          f"(max_batch={args.max_batch}, max_wait_ms={args.max_wait_ms}, device={device})")
+    print("[INFO] POST /predict (multipart: cover, gp1, gp2) | GET /metrics | POST /metrics/reset | GET /health")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,10 @@
 from pathlib import Path
 import random
 import re
-import shutil
 import csv
 
+from download.blobstore import BlobStore, link_or_copy
+
 INPUT = Path("data/raw")
 OUTPUT = Path("data/balanced_raw")
 CSV_PATH = Path("outputs/sub_dist.csv")
@@ -14,6 +15,9 @@ CSV_PATH.parent.mkdir(exist_ok = True)
 
 MAX_GAMES = 1000
 
+# balanced_raw je samo pogled: linkovi na blobove (data/blobs), ne kopije
+store = BlobStore()
+
 regex = re.compile(r"^(\d+)_?(gp[12])?$")
 
 rows = []
@@ -65,7 +69,7 @@ for class_dir in classes:
             else:
                 out_name = f"{gid}_{img_type}{ext}"
             out = output / out_name
-            shutil.copy(src, out)
+            link_or_copy(store.adopt(src), out)
             img_counter += 1
     
     img_total = sum(len(games[k]) for k in games.keys())
@@ -77,5 +81,8 @@ with CSV_PATH.open("w", newline = "") as f:
     for r in rows:
         w.writerow(r)
 
+store.close()
+s = store.stats
+print(f"BLOBOVI -> novi={s['new_blobs']} dedup={s['deduped']} usteda={s['saved_bytes'] / 1e6:.1f}MB")
 print("NAPRAVLJEN -> ", OUTPUT)
 print("DIST FAJL -> ", CSV_PATH)
\ No newline at end of file
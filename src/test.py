@@ -1,10 +1,15 @@
+import argparse
 import json
+import time
 from pathlib import Path
 
 import torch
 
 from dataset import get_loaders
-from models.baseline_cnn import BaselineCNN
+from logstore import LogitWriter
+from metrics import MetricAccumulator, save_confusion_matrix_csv
+from models.factory import load_model
+from tta import TTA_VIEWS, tta_logits
 
 DATA_DIR = "data/balanced_raw"
 CKPT = Path("checkpoints/baseline/best.pt")
@@ -15,76 +20,121 @@ BATCH = 32
 IMG = 224
 
 
-def save_confusion_matrix_csv(cm, classes, path):
-    lines = []
-    header = ["true/pred"] + list(classes)
-    lines.append(",".join(header))
-
-    for i, cls in enumerate(classes):
-        row = [cls] + [str(int(x)) for x in cm[i]]
-        lines.append(",".join(row))
-
-    path.write_text("\n".join(lines), encoding="utf-8")
+def timed_forward(fn, x, device):
+    if device == "cuda":
+        torch.cuda.synchronize()
+    t0 = time.perf_counter()
+    out = fn(x)
+    if device == "cuda":
+        torch.cuda.synchronize()
+    return out, time.perf_counter() - t0
 
 
 def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--ckpt", type=Path, default=CKPT)
+    ap.add_argument("--out-dir", type=Path, default=OUT_DIR)
+    ap.add_argument("--data-dir", type=Path, default=Path(DATA_DIR),
+                    help="Evaluate on this tree (must hold the same triplets as training for the same split).")
+    ap.add_argument("--store", type=Path, default=None,
+                    help="Where to write per-sample logits (default: <out-dir>/test_logits).")
+    ap.add_argument("--tta", action="store_true",
+                    help="Also evaluate averaged logits over deterministic test-time views.")
+    ap.add_argument("--tta-views", nargs="+", default=list(TTA_VIEWS), choices=TTA_VIEWS)
+    args = ap.parse_args()
+
+    out_dir = args.out_dir
+    store_dir = args.store or out_dir / "test_logits"
     device = "cuda" if torch.cuda.is_available() else "cpu"
 
     _, _, test_loader, num_classes, classes = get_loaders(
-        DATA_DIR, batch_size=BATCH, img_size=IMG, seed=SEED
+        args.data_dir, batch_size=BATCH, img_size=IMG, seed=SEED
     )
 
-    if not CKPT.exists():
-        raise FileNotFoundError(f"Checkpoint not found: {CKPT}")
-
-    ckpt = torch.load(CKPT, map_location=device)
+    model, classes, ckpt = load_model(args.ckpt, device)
+    num_classes = len(classes)
 
-    if "classes" in ckpt:
-        classes = ckpt["classes"]
-        num_classes = len(classes)
+    meter = MetricAccumulator(num_classes, device=device)
+    tta_meter = MetricAccumulator(num_classes, device=device) if args.tta else None
+    plain_time = 0.0
+    tta_time = 0.0
 
-    model = BaselineCNN(num_classes, in_channels=9).to(device)
-    model.load_state_dict(ckpt["model"])
-    model.eval()
-
-    cm = [[0 for _ in range(num_classes)] for _ in range(num_classes)]
-    correct = 0
-    total = 0
+    triplets = test_loader.dataset.all_triplets
+    store = LogitWriter(store_dir, classes, source=str(args.ckpt))
+    tta_store = LogitWriter(store_dir.with_name(store_dir.name + "_tta"), classes, source=str(args.ckpt)) \
+        if args.tta else None
+    seen = 0
 
     with torch.no_grad():
         for x, y in test_loader:
             x = x.to(device)
             y = y.to(device)
 
-            logits = model(x)
-            pred = torch.argmax(logits, dim=1)
+            ids = [f"{p[0].parent.name}/{p[0].stem}" for p, _ in triplets[seen:seen + len(y)]]
+            seen += len(y)
+
+            logits, dt = timed_forward(model, x, device)
+            plain_time += dt
+            meter.update(logits, y)
+            store.append(logits.float().cpu().numpy(), y.cpu().numpy(), ids)
 
-            correct += (pred == y).sum().item()
-            total += y.numel()
+            if tta_meter is not None:
+                logits, dt = timed_forward(lambda b: tta_logits(model, b, args.tta_views), x, device)
+                tta_time += dt
+                tta_meter.update(logits, y)
+                tta_store.append(logits.float().cpu().numpy(), y.cpu().numpy(), ids)
 
-            for t, p in zip(y.tolist(), pred.tolist()):
-                cm[t][p] += 1
+    store.close()
+    if tta_store is not None:
+        tta_store.close()
 
-    acc = correct / total if total > 0 else 0.0
+    metrics = meter.compute(classes)
+    acc = metrics["acc"]
+    correct = metrics["correct"]
+    total = metrics["total"]
 
-    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    out_dir.mkdir(parents=True, exist_ok=True)
 
     result = {
         "test_acc": acc,
         "test_correct": correct,
         "test_total": total,
         "classes": classes,
-        "checkpoint": str(CKPT),
+        "checkpoint": str(args.ckpt),
         "val_acc_in_ckpt": float(ckpt.get("val_acc", -1.0)),
+        "metrics": metrics,
+        "ms_per_sample": 1000.0 * plain_time / max(1, total),
     }
 
-    (OUT_DIR / "test.json").write_text(json.dumps(result, indent=2), encoding="utf-8")
+    if tta_meter is not None:
+        tta_metrics = tta_meter.compute(classes)
+        result["tta"] = {
+            "views": args.tta_views,
+            "test_acc": tta_metrics["acc"],
+            "acc_gain": tta_metrics["acc"] - acc,
+            "ms_per_sample": 1000.0 * tta_time / max(1, total),
+            "latency_ratio": tta_time / max(plain_time, 1e-9),
+            "metrics": tta_metrics,
+        }
+
+    (out_dir / "test.json").write_text(json.dumps(result, indent=2), encoding="utf-8")
 
-    save_confusion_matrix_csv(cm, classes, OUT_DIR / "confusion_matrix.csv")
+    save_confusion_matrix_csv(meter.confusion_matrix().tolist(), classes, out_dir / "confusion_matrix.csv")
 
     print(f"TEST acc: {acc:.4f} ({correct}/{total})")
-    print("Saved:", OUT_DIR / "test.json")
-    print("Saved:", OUT_DIR / "confusion_matrix.csv")
+    print(f"macro F1: {metrics['macro']['f1']:.4f} | weighted F1: {metrics['weighted']['f1']:.4f} | ECE: {metrics['ece']:.4f}")
+    for cls, m in metrics["per_class"].items():
+        print(f"  {cls:<12} P={m['precision']:.3f} R={m['recall']:.3f} F1={m['f1']:.3f} n={m['support']}")
+
+    if "tta" in result:
+        t = result["tta"]
+        print(f"TTA acc: {t['test_acc']:.4f} (gain {t['acc_gain']:+.4f}) with {len(t['views'])} views")
+        print(f"latency: {result['ms_per_sample']:.2f} ms/sample plain -> "
+              f"{t['ms_per_sample']:.2f} ms/sample TTA (x{t['latency_ratio']:.2f})")
+
+    print("Saved:", out_dir / "test.json")
+    print("Saved:", out_dir / "confusion_matrix.csv")
+    print("Saved:", store_dir)
 
 
 if __name__ == "__main__":
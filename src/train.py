@@ -1,3 +1,4 @@
+import argparse
 import json
 from pathlib import Path
 
@@ -7,7 +8,9 @@ import torch.optim as optim
 import matplotlib.pyplot as plt
 
 from dataset import get_loaders
-from models.baseline_cnn import BaselineCNN
+from distill import cache_teacher_logits, distillation_loss
+from metrics import MetricAccumulator
+from models.factory import build_model
 
 DATA_DIR = "data/balanced_raw"
 OUT_DIR = Path("outputs/baseline")
@@ -19,25 +22,57 @@ BATCH = 32
 LR = 1e-3
 IMG = 224
 
+TEACHER_CKPT = Path("checkpoints/teacher/best.pt")
+TEACHER_LOGITS = Path("checkpoints/teacher/train_logits.pt")
+
 
 def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--arch", default="baseline",
+                    help='Model to train: "baseline" or "timm:<name>", e.g. timm:resnet50 for the teacher.')
+    ap.add_argument("--out-dir", type=Path, default=OUT_DIR)
+    ap.add_argument("--ckpt", type=Path, default=CKPT)
+    ap.add_argument("--data-dir", type=Path, default=Path(DATA_DIR),
+                    help="Class folders of triplets; point at a derived tree (download/derive.py) to train on small copies.")
+    ap.add_argument("--lr", type=float, default=LR)
+    ap.add_argument("--distill", action="store_true",
+                    help="Train the student on cached teacher logits blended with hard labels.")
+    ap.add_argument("--teacher-ckpt", type=Path, default=TEACHER_CKPT)
+    ap.add_argument("--teacher-logits", type=Path, default=TEACHER_LOGITS)
+    ap.add_argument("--alpha", type=float, default=0.7, help="Weight of the soft (teacher) term.")
+    ap.add_argument("--temperature", type=float, default=4.0)
+    args = ap.parse_args()
+
+    out_dir = args.out_dir
+    ckpt_path = args.ckpt
+
     device = "cuda" if torch.cuda.is_available() else "cpu"
 
     train_loader, val_loader, test_loader, num_classes, classes = get_loaders(
-        DATA_DIR, batch_size=BATCH, img_size=IMG, seed=SEED
+        args.data_dir, batch_size=BATCH, img_size=IMG, seed=SEED, train_index=args.distill
     )
 
-    x, y = next(iter(train_loader))
+    teacher_logits = None
+    if args.distill:
+        teacher_logits = cache_teacher_logits(
+            train_loader.dataset, val_loader.dataset.transform,
+            args.teacher_ckpt, args.teacher_logits, device, classes, batch_size=BATCH * 2,
+        )
+        if teacher_logits.shape != (len(train_loader.dataset), num_classes):
+            raise SystemExit(f"[ERROR] teacher logits {tuple(teacher_logits.shape)} do not match the train split")
+
+    x, y = next(iter(train_loader))[:2]
     print(x.shape, y.shape)
 
-    model = BaselineCNN(num_classes, in_channels=9).to(device)
+    model = build_model(args.arch, num_classes, pretrained=args.arch != "baseline").to(device)
     loss_fn = nn.CrossEntropyLoss()
-    opt = optim.Adam(model.parameters(), lr=LR)
+    opt = optim.Adam(model.parameters(), lr=args.lr)
 
-    OUT_DIR.mkdir(parents=True, exist_ok=True)
-    CKPT.parent.mkdir(parents=True, exist_ok=True)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    ckpt_path.parent.mkdir(parents=True, exist_ok=True)
 
-    hist = {"train_loss": [], "train_acc": [], "val_loss": [], "val_acc": []}
+    hist = {"train_loss": [], "train_acc": [], "val_loss": [], "val_acc": [], "val_macro_f1": []}
+    val_meter = MetricAccumulator(num_classes, device=device)
     best = -1.0
 
     for epoch in range(EPOCHS):
@@ -46,13 +81,17 @@ def main():
         tc = 0
         tn = 0
 
-        for x, y in train_loader:
-            x = x.to(device)
-            y = y.to(device)
+        for batch in train_loader:
+            x = batch[0].to(device)
+            y = batch[1].to(device)
 
             opt.zero_grad()
             logits = model(x)
-            loss = loss_fn(logits, y)
+            if teacher_logits is not None:
+                t = teacher_logits[batch[2]].to(device)
+                loss = distillation_loss(logits, t, y, args.alpha, args.temperature)
+            else:
+                loss = loss_fn(logits, y)
             loss.backward()
             opt.step()
 
@@ -62,9 +101,7 @@ def main():
             tn += y.numel()
 
         model.eval()
-        vl = 0.0
-        vc = 0
-        vn = 0
+        val_meter.reset()
 
         with torch.no_grad():
             for x, y in val_loader:
@@ -73,34 +110,33 @@ def main():
 
                 logits = model(x)
                 loss = loss_fn(logits, y)
+                val_meter.update(logits, y, loss=loss.item())
 
-                vl += float(loss.item())
-                pred = torch.argmax(logits, dim=1)
-                vc += (pred == y).sum().item()
-                vn += y.numel()
+        val_metrics = val_meter.compute(classes)
 
         train_loss = tl / max(1, len(train_loader))
-        val_loss = vl / max(1, len(val_loader))
+        val_loss = val_metrics.get("loss", 0.0)
         train_acc = tc / max(1, tn)
-        val_acc = vc / max(1, vn)
+        val_acc = val_metrics["acc"]
 
         hist["train_loss"].append(train_loss)
         hist["val_loss"].append(val_loss)
         hist["train_acc"].append(train_acc)
         hist["val_acc"].append(val_acc)
+        hist["val_macro_f1"].append(val_metrics["macro"]["f1"])
 
         print(epoch + 1, EPOCHS, train_loss, train_acc, val_loss, val_acc)
 
         if val_acc > best:
             best = val_acc
-            torch.save({"model": model.state_dict(), "classes": classes, "val_acc": best}, CKPT)
+            torch.save({"model": model.state_dict(), "arch": args.arch, "classes": classes, "val_acc": best}, ckpt_path)
 
     plt.figure()
     plt.plot(hist["train_loss"], label="train")
     plt.plot(hist["val_loss"], label="val")
     plt.legend()
     plt.tight_layout()
-    plt.savefig(OUT_DIR / "loss.png", dpi=160)
+    plt.savefig(out_dir / "loss.png", dpi=160)
     plt.close()
 
     plt.figure()
@@ -108,10 +144,10 @@ def main():
     plt.plot(hist["val_acc"], label="val")
     plt.legend()
     plt.tight_layout()
-    plt.savefig(OUT_DIR / "acc.png", dpi=160)
+    plt.savefig(out_dir / "acc.png", dpi=160)
     plt.close()
 
-    (OUT_DIR / "history.json").write_text(json.dumps(hist, indent=2), encoding="utf-8")
+    (out_dir / "history.json").write_text(json.dumps(hist, indent=2), encoding="utf-8")
 
 
 if __name__ == "__main__":
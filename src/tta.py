@@ -0,0 +1,46 @@
+import torch
+import torch.nn.functional as F
+
+# Deterministic test-time views, applied on the already decoded batch tensor
+TTA_VIEWS = ("identity", "hflip", "crop_tl", "crop_br", "zoom_in", "zoom_out")
+
+CROP = 0.875
+
+
+def _resize(x: torch.Tensor, h: int, w: int) -> torch.Tensor:
+    return F.interpolate(x, size=(h, w), mode="bilinear", align_corners=False)
+
+
+def apply_view(x: torch.Tensor, view: str) -> torch.Tensor:
+    _, _, h, w = x.shape
+    ch, cw = int(h * CROP), int(w * CROP)
+
+    if view == "identity":
+        return x
+    if view == "hflip":
+        return x.flip(-1)
+    if view == "crop_tl":
+        return _resize(x[:, :, :ch, :cw], h, w)
+    if view == "crop_br":
+        return _resize(x[:, :, h - ch:, w - cw:], h, w)
+    if view == "zoom_in":
+        top, left = (h - ch) // 2, (w - cw) // 2
+        return _resize(x[:, :, top:top + ch, left:left + cw], h, w)
+    if view == "zoom_out":
+        small = _resize(x, ch, cw)
+        top, left = (h - ch) // 2, (w - cw) // 2
+        return F.pad(small, (left, w - cw - left, top, h - ch - top), mode="replicate")
+
+    raise ValueError(f"Unknown TTA view: {view}")
+
+
+def expand_views(x: torch.Tensor, views=TTA_VIEWS) -> torch.Tensor:
+    # (B, C, H, W) -> (V*B, C, H, W), view-major
+    return torch.cat([apply_view(x, v) for v in views], dim=0)
+
+
+def tta_logits(model, x: torch.Tensor, views=TTA_VIEWS) -> torch.Tensor:
+    """Run every view of the batch in one forward pass and average the logits."""
+    b = x.shape[0]
+    logits = model(expand_views(x, views))
+    return logits.view(len(views), b, -1).mean(dim=0)